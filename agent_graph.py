@@ -1,53 +1,61 @@
 import os
-import psycopg2
-from typing import TypedDict, Literal, Annotated
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain_core.tools import tool
-from langgraph.graph import StateGraph, START, END, MessagesState
-from langgraph.prebuilt import create_react_agent
+from typing import Literal
+from langchain_ollama import ChatOllama
+from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
 
 # --- Configuration ---
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5435")
-DB_USER = os.getenv("POSTGRES_USER", "postgres")
-DB_PASS = os.getenv("POSTGRES_PASSWORD", "password")
-DB_NAME = os.getenv("POSTGRES_DB", "krafix_factory")
-DB_DSN = f"dbname={DB_NAME} user={DB_USER} password={DB_PASS} host={DB_HOST} port={DB_PORT}"
+# DB settings live in db.py (shared pool used by the PydanticAI tools)
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# "router": supervisor LLM routes to PydanticAI agents (default).
+# "structured": one structured-output call extracts the command and the tool runs directly.
+SUPERVISOR_MODE = os.getenv("SUPERVISOR_MODE", "router")
+# Where conversation threads live: "postgres" (survives restarts, shared by workers), "memory" or "none"
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "postgres")
 
 # Tools are now imported from pydantic_agent.py
 
 
 # --- Supervisor & Agents ---
-from pydantic_agent import production_agent, inventory_agent, maintenance_agent, AgentDeps
+from pydantic_agent import production_agent, inventory_agent, answer_maintenance, AgentDeps
+import router
+import commands
+import memory
+import tracing
+from memory import ConversationState
+from llm_scheduler import ollama_slot
 
 # Create Deps object
 deps = AgentDeps()
 
 llm = ChatOllama(model="llama3.2", base_url=OLLAMA_HOST, temperature=0)
+command_llm = llm.with_structured_output(commands.FactoryCommand)
 
 # Wrappers for PydanticAI Agents to work in LangGraph
-async def call_production_agent(state: MessagesState):
-    user_msg = state["messages"][-1].content
-    result = await production_agent.run(user_msg, deps=deps)
+async def call_production_agent(state: ConversationState):
+    user_msg = memory.agent_input(state)
+    async with ollama_slot():
+        with tracing.span("agent", "production_agent"):
+            result = await production_agent.run(user_msg, deps=deps)
     return {"messages": [{"role": "assistant", "content": result.output}]}
 
-async def call_inventory_agent(state: MessagesState):
-    user_msg = state["messages"][-1].content
-    result = await inventory_agent.run(user_msg, deps=deps)
+async def call_inventory_agent(state: ConversationState):
+    user_msg = memory.agent_input(state)
+    async with ollama_slot():
+        with tracing.span("agent", "inventory_agent"):
+            result = await inventory_agent.run(user_msg, deps=deps)
     return {"messages": [{"role": "assistant", "content": result.output}]}
 
-async def call_maintenance_agent(state: MessagesState):
-    user_msg = state["messages"][-1].content
-    result = await maintenance_agent.run(user_msg, deps=deps)
-    return {"messages": [{"role": "assistant", "content": result.output}]}
+async def call_maintenance_agent(state: ConversationState):
+    user_msg = memory.agent_input(state)
+    # Same fault reported again (any shift, any sender) -> cached answer in milliseconds;
+    # the cache is keyed on the current message, and follow-ups ("still broken after that") bypass it
+    answer = await answer_maintenance(user_msg, _last_user_text(state), deps)
+    return {"messages": [{"role": "assistant", "content": answer}]}
 
-# Supervisor Node
-def supervisor_node(state: MessagesState) -> Command[Literal["production_agent", "inventory_agent", "maintenance_agent", "__end__"]]:
-    messages = [
-        {"role": "system", "content": """You are a factory supervisor. Manage the conversation by routing to the correct worker.
+# Phonetic table comes from router.py so the fast path and the LLM correct the same words
+_PHONETIC = router.phonetic_prompt().replace("\n", "\n        ")
+SUPERVISOR_PROMPT = f"""You are a factory supervisor. Manage the conversation by routing to the correct worker.
         
         - If user wants to LOG output -> route to 'production_agent'.
         - If user wants to UPDATE STOCK -> route to 'inventory_agent'.
@@ -55,19 +63,38 @@ def supervisor_node(state: MessagesState) -> Command[Literal["production_agent",
         - IF THE INTENT IS UNCLEAR OR GENERAL CHAT -> You MUST reply to the user yourself.
         
         PHONETIC CORRECTION:
-        - "Law" -> "Log"
-        - "Rules" / "Roles" / "Doles" -> "Rolls"
-        - "Luxion" -> "Production"
+        {_PHONETIC}
         
         Return the name of the next agent specificly: 'production_agent', 'inventory_agent', 'maintenance_agent'.
         
         CRITICAL INSTRUCTION:
         If the last message in the history is a successful response from an agent (e.g. "Success", "Stock Updated", "Logged"), then you MUST route to 'FINISH'. Do NOT simply repeat the confirmation.
         ONLY route to 'FINISH' if the task is complete or the user said goodbye.
-        """},
-    ] + state["messages"]
-    
-    response = llm.invoke(messages)
+        """
+
+def _last_user_text(state: ConversationState):
+    """Text of the last message if the user sent it (dicts in tests, BaseMessages in the graph)."""
+    msg = state["messages"][-1]
+    if isinstance(msg, dict):
+        return msg.get("content") if msg.get("role") == "user" else None
+    return msg.content if getattr(msg, "type", None) == "human" else None
+
+# Supervisor Node
+@tracing.traced("supervisor")
+async def supervisor_node(state: ConversationState) -> Command[Literal["production_agent", "inventory_agent", "maintenance_agent", "__end__"]]:
+    # Fast path: plain "log N rolls" / "add N units" / "Error 502" skip the routing LLM call
+    user_text = _last_user_text(state)
+    intent = router.classify(user_text) if user_text else None
+    router.record(intent)
+    if intent:
+        return Command(goto=router.ROUTES[intent])
+
+    # Summary + newest turns within the token budget, not the whole thread
+    messages = memory.prompt(state, SUPERVISOR_PROMPT)
+
+    # Async + slot-limited: never blocks the FastAPI event loop while Ollama thinks
+    async with ollama_slot():
+        response = await llm.ainvoke(messages)
     decision = response.content.strip().lower()
 
     if "production" in decision:
@@ -87,19 +114,82 @@ def supervisor_node(state: MessagesState) -> Command[Literal["production_agent",
             update={"messages": [{"role": "assistant", "content": response.content}]}
         )
 
-# Build Graph
-builder = StateGraph(MessagesState)
+# Single-pass Command Node (SUPERVISOR_MODE=structured)
+NOT_UNDERSTOOD = "Sorry, I didn't catch that. Try: 'Log 50 rolls for Machine A' or 'Add 10 units of Glue'."
+
+@tracing.traced("supervisor")
+async def command_node(state: ConversationState) -> Command[Literal["maintenance_agent", "__end__"]]:
+    """One LLM call -> typed command -> tool runs here -> END. No second LLM call to decide FINISH."""
+    user_text = _last_user_text(state)
+    intent = router.classify(user_text) if user_text else None
+    if intent == "maintenance":
+        # Nothing to extract for RAG questions
+        router.record(intent)
+        return Command(goto="maintenance_agent")
+    router.record(None)
 
-builder.add_node("supervisor", supervisor_node)
-builder.add_node("production_agent", call_production_agent)
-builder.add_node("inventory_agent", call_inventory_agent)
-builder.add_node("maintenance_agent", call_maintenance_agent)
+    messages = memory.prompt(state, commands.COMMAND_PROMPT)
+    try:
+        async with ollama_slot():
+            cmd = await command_llm.ainvoke(messages)
+    except Exception as e:
+        print(f"⚠️ Command extraction failed: {e}", flush=True)
+        return Command(goto=END, update={"messages": [{"role": "assistant", "content": NOT_UNDERSTOOD}]})
 
-builder.add_edge(START, "supervisor")
+    if cmd.intent == "maintenance":
+        return Command(goto="maintenance_agent")
 
-# Workers return to supervisor to report back
-builder.add_edge("production_agent", "supervisor")
-builder.add_edge("inventory_agent", "supervisor")
-builder.add_edge("maintenance_agent", "supervisor")
+    missing = commands.missing_fields(cmd)
+    if cmd.intent == "chat" or missing:
+        if cmd.reply:
+            reply = cmd.reply
+        elif missing:
+            reply = f"Please tell me the {' and '.join(f.replace('_', ' ') for f in missing)}."
+        else:
+            reply = NOT_UNDERSTOOD  # chat intent with no reply text
+    else:
+        reply = await commands.execute(cmd, pool=deps.db)
+    return Command(goto=END, update={"messages": [{"role": "assistant", "content": reply}]})
+
+# Memory Node: keeps the checkpointed thread bounded before any LLM sees it
+async def memory_node(state: ConversationState):
+    return await memory.compact(state, llm)
+
+def make_checkpointer(backend: str = MEMORY_BACKEND):
+    if backend == "postgres":
+        from checkpointer import PostgresSaver
+        return PostgresSaver()
+    if backend == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+    return None
 
-graph = builder.compile()
+# Build Graph
+def build_graph(mode: str = SUPERVISOR_MODE, checkpointer=None):
+    builder = StateGraph(ConversationState)
+    builder.add_node("memory", memory_node)
+    builder.add_edge(START, "memory")
+
+    if mode == "structured":
+        builder.add_node("supervisor", command_node)
+        builder.add_node("maintenance_agent", call_maintenance_agent)
+        builder.add_edge("memory", "supervisor")
+        # Deterministic end: the agent's answer is the reply
+        builder.add_edge("maintenance_agent", END)
+        return builder.compile(checkpointer=checkpointer)
+
+    builder.add_node("supervisor", supervisor_node)
+    builder.add_node("production_agent", call_production_agent)
+    builder.add_node("inventory_agent", call_inventory_agent)
+    builder.add_node("maintenance_agent", call_maintenance_agent)
+
+    builder.add_edge("memory", "supervisor")
+
+    # Workers return to supervisor to report back
+    builder.add_edge("production_agent", "supervisor")
+    builder.add_edge("inventory_agent", "supervisor")
+    builder.add_edge("maintenance_agent", "supervisor")
+
+    return builder.compile(checkpointer=checkpointer)
+
+graph = build_graph(checkpointer=make_checkpointer())
@@ -0,0 +1,116 @@
+"""Bounded execution for analyze_data's LLM-written SQL.
+
+Queries run in a READ ONLY transaction under a statement_timeout and are read through a
+server-side cursor, so at most ANALYZE_MAX_ROWS rows ever reach Python. The result is a
+compact table (row count + truncated cells) sized for a llama3.2 prompt, cached for a
+short while per normalized query.
+"""
+import os
+import re
+
+import psycopg2
+import psycopg2.errors
+
+import db
+from cache import TTLCache
+
+# --- Configuration ---
+ANALYZE_MAX_ROWS = int(os.getenv("ANALYZE_MAX_ROWS", "50"))
+ANALYZE_TIMEOUT_MS = int(os.getenv("ANALYZE_TIMEOUT_MS", "5000"))
+ANALYZE_CELL_CHARS = int(os.getenv("ANALYZE_CELL_CHARS", "40"))
+ANALYZE_CACHE_SIZE = int(os.getenv("ANALYZE_CACHE_SIZE", "128"))
+ANALYZE_CACHE_TTL = float(os.getenv("ANALYZE_CACHE_TTL", "30"))  # seconds; numbers change as shifts log
+
+# Friendly early refusal; the READ ONLY transaction is what actually enforces it
+FORBIDDEN = re.compile(r"\b(insert|update|delete|drop|truncate|alter|create|grant|revoke|copy|vacuum)\b", re.IGNORECASE)
+# Quoted literals/identifiers are kept verbatim when normalizing
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+result_cache = TTLCache(maxsize=ANALYZE_CACHE_SIZE, ttl=ANALYZE_CACHE_TTL)
+
+
+def normalize_sql(sql: str) -> str:
+    """Cache key: case and whitespace folded outside quotes, trailing semicolons dropped."""
+    parts = _QUOTED.split(sql.strip().rstrip(";").strip())
+    return "".join(p if i % 2 else " ".join(p.split()).lower() for i, p in enumerate(parts))
+
+
+def _unquoted(sql: str) -> str:
+    return "".join(p for i, p in enumerate(_QUOTED.split(sql)) if not i % 2)
+
+
+def check_query(sql: str):
+    """Error reply for queries we refuse outright, else None."""
+    bare = _unquoted(sql.strip().rstrip(";"))
+    if FORBIDDEN.search(bare):
+        return "❌ SAFETY ALERT: Read-only tool."
+    if ";" in bare:
+        return "❌ SQL Error: one statement per call."
+    return None
+
+
+def run_readonly_query(conn, sql: str, max_rows: int = ANALYZE_MAX_ROWS, timeout_ms: int = ANALYZE_TIMEOUT_MS):
+    """(columns, rows, total) with rows capped at max_rows; total is None if counting timed out."""
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION READ ONLY")
+        cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+    with conn.cursor(name="analyze_data") as cur:
+        cur.itersize = max_rows + 1
+        cur.execute(sql)
+        rows = cur.fetchmany(max_rows + 1)
+        columns = [d[0] for d in cur.description] if cur.description else []
+        total = len(rows)
+        if len(rows) > max_rows:
+            rows = rows[:max_rows]
+            # Count the rest server-side without shipping it. A timeout here would abort the
+            # transaction (and the cursor's CLOSE with it), so it runs under a savepoint.
+            with conn.cursor() as counter:
+                counter.execute("SAVEPOINT count_rest")
+                try:
+                    counter.execute('MOVE FORWARD ALL IN "analyze_data"')
+                    total += counter.rowcount
+                    counter.execute("RELEASE SAVEPOINT count_rest")
+                except psycopg2.errors.QueryCanceled:
+                    counter.execute("ROLLBACK TO SAVEPOINT count_rest")
+                    total = None
+    return columns, rows, total
+
+
+def _cell(value) -> str:
+    text = "NULL" if value is None else str(value)
+    text = " ".join(text.split())
+    return text if len(text) <= ANALYZE_CELL_CHARS else text[:ANALYZE_CELL_CHARS - 1] + "…"
+
+
+def render_table(columns, rows, total) -> str:
+    if not rows:
+        return "0 results found."
+    if total is None:
+        header = f"More than {len(rows)} rows (showing first {len(rows)}):"
+    elif total > len(rows):
+        header = f"{total} rows (showing first {len(rows)}):"
+    else:
+        header = f"{total} row{'s' if total != 1 else ''}:"
+    lines = [header, " | ".join(columns)]
+    lines += [" | ".join(_cell(v) for v in row) for row in rows]
+    return "\n".join(lines)
+
+
+def analyze(sql: str, pool=None) -> str:
+    """Run one read-only query and return its rendered table (cached per normalized SQL)."""
+    refusal = check_query(sql)
+    if refusal:
+        return refusal
+    key = normalize_sql(sql)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        columns, rows, total = (pool or db.get_pool()).run(run_readonly_query, sql.strip().rstrip(";"))
+    except psycopg2.errors.QueryCanceled:
+        return f"❌ SQL Error: query took longer than {ANALYZE_TIMEOUT_MS} ms. Add a WHERE clause or aggregate."
+    except Exception as e:
+        return f"❌ SQL Error: {e}"
+    rendered = render_table(columns, rows, total)
+    result_cache.set(key, rendered)
+    return rendered
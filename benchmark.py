@@ -0,0 +1,445 @@
+"""Offline end-to-end latency benchmark for the WhatsApp path.
+
+Drives whatsapp_server.app through POST /whatsapp (text and voice notes) at a fixed
+concurrency, in-process. The real webhook, LLM scheduler, supervisor graph, PydanticAI
+agents, tools and Twilio client code all run; only the outside world is stubbed:
+  - Ollama: routing/summary/extraction stand-ins and PydanticAI FunctionModels that sleep
+    --ollama-latency (+/- jitter) per call and answer deterministically.
+  - Whisper: sleeps --whisper-latency and returns the text encoded in the fake media.
+  - Twilio: an httpx MockTransport serving media and accepting messages.
+  - Postgres: an async pool stand-in with --db-latency per call and synthetic IDs.
+
+    python benchmark.py --requests 200 --concurrency 16 --voice-ratio 0.3 --ollama-latency 0.8
+    python benchmark.py --mode structured --out bench_structured.json --baseline benchmark_results.json
+
+Writes p50/p95/p99 and throughput per stage (download, transcribe, route, agent, tool,
+send, plus queue_wait and end_to_end) as JSON so runs can be compared.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import zlib
+import itertools
+import contextlib
+import contextvars
+import functools
+import collections
+from types import SimpleNamespace
+from dataclasses import dataclass, asdict
+from unittest import mock
+
+import httpx
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from pydantic_ai.models.function import FunctionModel
+from cache import SemanticCache
+from keyword_index import named_codes
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart, UserPromptPart
+
+import db
+import router
+import retriever
+import worker
+import commands
+import timing
+import tracing
+import http_client
+import factory_ops
+import agent_graph
+import llm_scheduler
+import pydantic_agent
+import whatsapp_server
+
+STAGES = ("download", "transcribe", "route", "agent", "tool", "send", "queue_wait", "end_to_end")
+MEDIA_BASE = "https://api.twilio.com/2010-04-01/Accounts/ACbenchmark/Messages/MM{}/Media/ME{}"
+
+TEXT_TEMPLATES = [
+    "Log {n} rolls for Machine {m}",
+    "Add {n} units of {product}",
+    "Remove {n} units of {product}",
+    "Error {code} on the {m} cutter",
+    "Machine A {n}, B {n2}, C {n3} rolls",
+    "Hello, how is the shift going?",
+    "Can you record that we made {n} rules on machine {m}",
+]
+PRODUCTS = ["Glue", "Paper Cores", "Shrink Wrap", "Ink Cartridge"]
+
+
+@dataclass
+class BenchConfig:
+    requests: int = 100
+    concurrency: int = 8
+    senders: int = 10
+    voice_ratio: float = 0.3
+    mode: str = agent_graph.SUPERVISOR_MODE
+    ollama_latency: float = 0.5
+    ollama_jitter: float = 0.1
+    ollama_concurrency: int = llm_scheduler.OLLAMA_CONCURRENCY
+    embed_latency: float = 0.05
+    whisper_latency: float = 1.0
+    db_latency: float = 0.005
+    twilio_latency: float = 0.05
+    max_pending: int = llm_scheduler.LLM_MAX_PENDING
+    max_pending_per_sender: int = llm_scheduler.LLM_MAX_PENDING_PER_SENDER
+    timeout: float = 600.0
+    seed: int = 7
+
+
+# --- Deterministic "LLM" behaviour ---
+_MACHINE = re.compile(r"\bmachine\s+(\w+)")
+_PAIRS = re.compile(r"\b(?:machine\s+)?([a-z])\s+(\d+)\b")
+_NUMBER = re.compile(r"\b\d+\b")
+_PRODUCT = re.compile(r"\bof\s+([a-z ]+?)\s*$")
+_ROUTES = [
+    ("maintenance_agent", re.compile(r"\b(error|manual|fix|broken)\b")),
+    ("production_agent", re.compile(r"\b(rolls?|log|record)\b")),
+    ("inventory_agent", re.compile(r"\b(stock|units?|add|remove)\b")),
+]
+
+
+def parse_command(text: str) -> commands.FactoryCommand:
+    """What a well-behaved llama3.2 would extract from one message."""
+    text = router.correct(text)
+    route = next((name for name, rule in _ROUTES if rule.search(text)), None)
+    numbers = [int(n) for n in _NUMBER.findall(text)]
+    if route == "maintenance_agent":
+        return commands.FactoryCommand(intent="maintenance")
+    if route == "production_agent" and numbers:
+        pairs = _PAIRS.findall(text)
+        if len(pairs) > 1:
+            entries = [factory_ops.ProductionEntry(machine_id=m.upper(), rolls=int(n)) for m, n in pairs]
+            return commands.FactoryCommand(intent="log_production", entries=entries)
+        machine = _MACHINE.search(text)
+        return commands.FactoryCommand(intent="log_production", rolls=numbers[0],
+                                       machine_id=machine.group(1).upper() if machine else None)
+    if route == "inventory_agent" and numbers:
+        product = _PRODUCT.search(text)
+        sign = -1 if re.search(r"\b(remove|used|took)\b", text) else 1
+        return commands.FactoryCommand(intent="update_stock", quantity_change=sign * numbers[0],
+                                       product_name=product.group(1).title() if product else None)
+    return commands.FactoryCommand(intent="chat", reply="Hello! Tell me what to log or which error you see.")
+
+
+class FakeOllama:
+    """Stand-in for agent_graph.llm / command_llm: fixed latency, rule-based answers."""
+
+    def __init__(self, cfg: BenchConfig, rng: random.Random, structured: bool = False):
+        self.cfg = cfg
+        self.rng = rng
+        self.structured = structured
+
+    async def think(self):
+        await asyncio.sleep(max(0.0, self.cfg.ollama_latency + self.rng.uniform(-1, 1) * self.cfg.ollama_jitter))
+
+    async def ainvoke(self, messages):
+        await self.think()
+        last = messages[-1]
+        if self.structured:
+            return parse_command(last.content)
+        if messages[0].content.startswith("You maintain a running summary"):
+            return AIMessage("Foreman logged production and adjusted stock.")
+        if last.type == "ai":
+            return AIMessage("FINISH")
+        cmd = parse_command(last.content)
+        route = {"log_production": "production_agent", "update_stock": "inventory_agent",
+                 "maintenance": "maintenance_agent"}.get(cmd.intent)
+        return AIMessage(route or cmd.reply)
+
+
+def agent_model(fake: FakeOllama) -> FunctionModel:
+    """PydanticAI model: call the agent's tool with parsed args, then echo the tool result."""
+    async def respond(messages, info):
+        await fake.think()
+        request = messages[-1]
+        returns = [p for p in request.parts if isinstance(p, ToolReturnPart)]
+        if returns:
+            return ModelResponse(parts=[TextPart(str(returns[-1].content))])
+        prompt = next(p.content for p in request.parts if isinstance(p, UserPromptPart))
+        text = str(prompt).rsplit("Current message:", 1)[-1].strip()
+        tools = {t.name for t in info.function_tools}
+        cmd = parse_command(text)
+        if "consult_manual" in tools:
+            return ModelResponse(parts=[ToolCallPart("consult_manual", {"query": text})])
+        if cmd.entries and "log_production_batch" in tools:
+            return ModelResponse(parts=[ToolCallPart("log_production_batch",
+                                                     {"entries": [e.model_dump() for e in cmd.entries]})])
+        if cmd.intent == "log_production" and not commands.missing_fields(cmd) and "log_production" in tools:
+            return ModelResponse(parts=[ToolCallPart("log_production", {"machine_id": cmd.machine_id, "rolls": cmd.rolls})])
+        if cmd.intent == "update_stock" and not commands.missing_fields(cmd) and "update_stock" in tools:
+            return ModelResponse(parts=[ToolCallPart("update_stock", {"product_name": cmd.product_name,
+                                                                      "quantity_change": cmd.quantity_change})])
+        return ModelResponse(parts=[TextPart("Please tell me the machine and the number of rolls.")])
+    return FunctionModel(respond)
+
+
+# --- Stand-ins for Whisper, Postgres and Twilio ---
+class FakeTranscriber:
+    def __init__(self, cfg: BenchConfig, recorder):
+        self.cfg = cfg
+        self.recorder = recorder
+
+    async def transcribe(self, data: bytes) -> str:
+        start = time.perf_counter()
+        await asyncio.sleep(self.cfg.whisper_latency)
+        self.recorder.record("transcribe", time.perf_counter() - start)
+        return data.decode().split(":", 1)[1]
+
+
+class FakeRetriever:
+    """ManualRetriever stand-in: bag-of-words "embeddings", real semantic answer cache."""
+    version = 1.0
+
+    def __init__(self, cfg: BenchConfig, recorder):
+        self.cfg = cfg
+        self.recorder = recorder
+        self.answer_cache = SemanticCache(retriever.ANSWER_CACHE_SIZE, retriever.ANSWER_CACHE_TTL,
+                                          retriever.ANSWER_CACHE_THRESHOLD)
+
+    def embed(self, query: str) -> list:
+        time.sleep(self.cfg.embed_latency)  # runs in a worker thread, like the real Ollama call
+        vector = [0.0] * 64
+        for word in retriever.normalize_query(query).split():
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        return vector
+
+    def search(self, query: str, k: int = 3):
+        start = time.perf_counter()
+        self.embed(query)
+        self.recorder.record("tool", time.perf_counter() - start)
+        return [SimpleNamespace(page_content="Error 502: feeder jam. Power off, clear the rollers, restart.")]
+
+    def code_passages(self, query: str):
+        codes = named_codes(query)
+        return [f"Error {code}: feeder jam. Power off, clear the rollers, restart." for code in codes] or None
+
+    def has_embedding(self, question: str) -> bool:
+        return False  # every lookup pays embed_latency, like a cold ManualRetriever
+
+    def cached_answer(self, question: str):
+        hit = self.answer_cache.lookup(self.embed(question), tag=retriever.error_codes(question))
+        return hit[0] if hit else None
+
+    def remember_answer(self, question: str, answer: str, version: float = None):
+        self.answer_cache.add(self.embed(question), answer, tag=retriever.error_codes(question))
+
+
+class StubPool:
+    """Async stand-in for db.AsyncConnectionPool: fixed latency, synthetic results."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.maxconn = db.DB_POOL_MAX
+        self._ids = itertools.count(1)
+        self.calls = collections.Counter()
+
+    async def run(self, fn, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        name = getattr(fn, "__name__", str(fn))
+        self.calls[name] += 1
+        if name == "insert_production":
+            return next(self._ids)
+        if name == "insert_production_batch":
+            return [next(self._ids) for _ in args[0]]
+        if name == "apply_stock_change":
+            return args[0].strip().title(), 100 + args[1]
+        return None
+
+
+def twilio_transport(cfg: BenchConfig, media: dict, sent: list) -> httpx.MockTransport:
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(cfg.twilio_latency)
+        if request.method == "GET" and str(request.url) in media:
+            body = media[str(request.url)]
+            return httpx.Response(200, content=body, headers={"content-length": str(len(body))})
+        if request.method == "POST" and request.url.path.endswith("/Messages.json"):
+            sent.append(time.perf_counter())
+            return httpx.Response(201, json={"sid": f"SM{len(sent):032d}", "status": "queued"})
+        return httpx.Response(404)
+    return httpx.MockTransport(handle)
+
+
+# --- Measurement ---
+class StageRecorder:
+    def __init__(self):
+        self.durations = collections.defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        self.durations[stage].append(seconds)  # list.append is atomic: safe from worker threads
+
+    def wrap(self, stage: str, fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def report(self, wall_seconds: float) -> dict:
+        return {stage: timing.summarize(self.durations.get(stage, []), wall_seconds) for stage in STAGES}
+
+
+_request_started = contextvars.ContextVar("request_started")
+
+
+def build_workload(cfg: BenchConfig, rng: random.Random) -> list:
+    """[(sender, form, media_url_or_None)] - voice notes carry their transcript in the fake audio."""
+    workload = []
+    for i in range(cfg.requests):
+        text = rng.choice(TEXT_TEMPLATES).format(
+            n=rng.randint(5, 120), n2=rng.randint(5, 120), n3=rng.randint(5, 120),
+            m=rng.choice("ABCD"), product=rng.choice(PRODUCTS), code=rng.choice([101, 205, 502, 503]),
+        )
+        sender = f"whatsapp:+1555{i % cfg.senders:07d}"
+        if rng.random() < cfg.voice_ratio:
+            url = MEDIA_BASE.format(i, i)
+            form = {"From": sender, "MediaUrl0": url, "MediaContentType0": "audio/ogg"}
+            workload.append((sender, form, url, f"BENCHAUDIO:{text}".encode()))
+        else:
+            workload.append((sender, {"From": sender, "Body": text}, None, None))
+    return workload
+
+
+@contextlib.contextmanager
+def stubbed_app(cfg: BenchConfig, recorder: StageRecorder, media: dict, sent: list):
+    """Patch the outside world and wrap each stage with a timer; everything is restored on exit."""
+    rng = random.Random(cfg.seed)
+    scheduler = llm_scheduler.LLMScheduler(cfg.ollama_concurrency, cfg.max_pending, cfg.max_pending_per_sender)
+    pool = StubPool(cfg.db_latency)
+    fake_llm = FakeOllama(cfg, rng)
+    client = httpx.AsyncClient(transport=twilio_transport(cfg, media, sent), follow_redirects=True)
+
+    async def enqueue_ai_job(user_text: str, sender_id: str):
+        # Same as JOB_QUEUE=memory, plus queue-wait and end-to-end timing per message
+        started_at, enqueued_at = _request_started.get(), time.perf_counter()
+
+        async def job(text, sender, request_id):
+            recorder.record("queue_wait", time.perf_counter() - enqueued_at)
+            await worker.process_ai_response(text, sender, request_id)
+            recorder.record("end_to_end", time.perf_counter() - started_at)
+        scheduler.enqueue(sender_id, job, user_text, sender_id, tracing.current_request_id())
+
+    with contextlib.ExitStack() as stack:
+        patch = lambda target, name, value: stack.enter_context(mock.patch.object(target, name, value))
+        patch(llm_scheduler, "_scheduler", scheduler)
+        patch(db, "_async_pool", pool)
+        patch(http_client, "_client", client)
+        patch(http_client, "TWILIO_ACCOUNT_SID", "ACbenchmark")
+        patch(http_client, "TWILIO_AUTH_TOKEN", "benchmark")
+        patch(agent_graph, "llm", fake_llm)
+        patch(agent_graph, "command_llm", FakeOllama(cfg, rng, structured=True))
+        # Graph nodes are bound at build time: wrap first, then build the graph the worker runs
+        patch(agent_graph, "supervisor_node", recorder.wrap("route", agent_graph.supervisor_node))
+        patch(agent_graph, "command_node", recorder.wrap("route", agent_graph.command_node))
+        for node in ("call_production_agent", "call_inventory_agent", "call_maintenance_agent"):
+            patch(agent_graph, node, recorder.wrap("agent", getattr(agent_graph, node)))
+        patch(worker, "graph", agent_graph.build_graph(cfg.mode, checkpointer=InMemorySaver()))
+        for tool in ("log_production", "log_production_batch", "update_stock"):
+            patch(factory_ops, tool, recorder.wrap("tool", getattr(factory_ops, tool)))
+        manuals = FakeRetriever(cfg, recorder)
+        patch(pydantic_agent, "get_retriever", lambda: manuals)
+        for agent in (pydantic_agent.production_agent, pydantic_agent.inventory_agent, pydantic_agent.maintenance_agent):
+            stack.enter_context(agent.override(model=agent_model(fake_llm)))
+        patch(whatsapp_server, "download_media", recorder.wrap("download", whatsapp_server.download_media))
+        patch(whatsapp_server, "get_transcriber", lambda: FakeTranscriber(cfg, recorder))
+        patch(whatsapp_server, "enqueue_ai_job", enqueue_ai_job)
+        patch(worker, "send_whatsapp", recorder.wrap("send", worker.send_whatsapp))
+        yield SimpleNamespace(scheduler=scheduler, pool=pool, client=client)
+
+
+async def run_benchmark(cfg: BenchConfig) -> dict:
+    recorder, media, sent = StageRecorder(), {}, []
+    workload = build_workload(cfg, random.Random(cfg.seed))
+    media.update({url: audio for _, _, url, audio in workload if url})
+    outcomes = collections.Counter()
+    webhook = []
+
+    with stubbed_app(cfg, recorder, media, sent) as env:
+        transport = httpx.ASGITransport(app=whatsapp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            queue = asyncio.Queue()
+            for item in workload:
+                queue.put_nowait(item)
+
+            async def driver():
+                while not queue.empty():
+                    sender, form, _, _ = queue.get_nowait()
+                    start = time.perf_counter()
+                    _request_started.set(start)
+                    resp = await client.post("/whatsapp", data=form)
+                    webhook.append(time.perf_counter() - start)
+                    if "Thinking" in resp.text:
+                        outcomes["accepted"] += 1
+                    elif llm_scheduler.BUSY_REPLY in resp.text:
+                        outcomes["busy"] += 1
+                    else:
+                        outcomes["rejected"] += 1
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(driver() for _ in range(cfg.concurrency)))
+            deadline = time.monotonic() + cfg.timeout
+            while env.scheduler.stats()["pending"] and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            wall = time.perf_counter() - wall_start
+        await env.client.aclose()
+
+    outcomes["delivered"] = len(sent)
+    outcomes["sent"] = len(workload)
+    return {
+        "config": asdict(cfg),
+        "wall_s": round(wall, 3),
+        "requests": dict(outcomes),
+        "webhook": timing.summarize(webhook, wall),
+        "stages": recorder.report(wall),
+        "llm_scheduler": env.scheduler.stats(),
+        "db_calls": dict(env.pool.calls),
+    }
+
+
+def compare(result: dict, baseline: dict) -> str:
+    """One line per stage: p95 now vs baseline."""
+    lines = [f"{'stage':<12}{'p95 ms':>12}{'baseline':>12}{'change':>10}"]
+    for stage in ("webhook",) + STAGES:
+        now = (result["stages"].get(stage) or result.get(stage) or {}).get("p95_ms", 0.0)
+        then = (baseline.get("stages", {}).get(stage) or baseline.get(stage) or {}).get("p95_ms", 0.0)
+        change = f"{(now - then) / then * 100:+.1f}%" if then else "n/a"
+        lines.append(f"{stage:<12}{now:>12.1f}{then:>12.1f}{change:>10}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline WhatsApp path latency benchmark")
+    for field, default in asdict(BenchConfig()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare p95s against")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log lines")
+    args = vars(parser.parse_args(argv))
+    out, baseline, verbose = args.pop("out"), args.pop("baseline"), args.pop("verbose")
+    cfg = BenchConfig(**args)
+
+    if not verbose:
+        os.environ.setdefault("PYDANTIC_AI_NO_BANNER", "1")
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        result = asyncio.run(run_benchmark(cfg))
+
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+    print(json.dumps({"wall_s": result["wall_s"], "requests": result["requests"],
+                      "end_to_end": result["stages"]["end_to_end"]}, indent=2))
+    if baseline:
+        with open(baseline) as f:
+            print(compare(result, json.load(f)))
+    print(f"📊 Results written to {out}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
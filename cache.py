@@ -0,0 +1,143 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        """Live entry present? Doesn't touch the LRU order or the hit/miss counters."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and entry[0] >= time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expired": self.expired,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class SemanticCache:
+    """Thread-safe answer cache keyed by embedding similarity, with TTL and LRU capacity.
+
+    lookup() returns the stored value whose vector has the highest cosine similarity to
+    the query, if that is >= threshold. Entries only match within the same `tag`, so
+    callers can partition by facts that embeddings blur (e.g. "Error 502" vs "Error 503").
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600, threshold: float = 0.92):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._data = OrderedDict()  # id -> (expires_at, unit vector, tag, value)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def _unit(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def lookup(self, vector, tag=None):
+        """(value, similarity) of the closest live entry above the threshold, else None."""
+        query = self._unit(vector)
+        now = time.monotonic()
+        best_id, best_score = None, self.threshold
+        with self._lock:
+            for entry_id, (expires_at, v, entry_tag, _) in list(self._data.items()):
+                if expires_at < now:
+                    del self._data[entry_id]
+                    self.expired += 1
+                    continue
+                if entry_tag != tag or v.shape != query.shape:
+                    continue
+                score = float(np.dot(v, query))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(best_id)
+            self.hits += 1
+            return self._data[best_id][3], best_score
+
+    def add(self, vector, value, tag=None):
+        with self._lock:
+            self._data[self._next_id] = (time.monotonic() + self.ttl, self._unit(vector), tag, value)
+            self._next_id += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data), "maxsize": self.maxsize, "threshold": self.threshold,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expired": self.expired,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
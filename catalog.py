@@ -0,0 +1,54 @@
+"""Product catalog lookups: spoken/typed names -> one canonical inventory row.
+
+inventory.product_key holds the normalized name (unique, migration v7) with a pg_trgm
+GIN index, so both the exact hit and the fuzzy fallback are index lookups no matter how
+many SKUs the catalog holds.
+"""
+import os
+import re
+
+# --- Configuration ---
+# Minimum trigram similarity for a fuzzy match, and the lead the best match needs over the runner-up
+PRODUCT_MATCH_THRESHOLD = float(os.getenv("PRODUCT_MATCH_THRESHOLD", "0.45"))
+PRODUCT_MATCH_MARGIN = float(os.getenv("PRODUCT_MATCH_MARGIN", "0.1"))
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+class AmbiguousProduct(Exception):
+    """The name is close to several products; ask instead of guessing."""
+
+    def __init__(self, name: str, candidates: list):
+        super().__init__(f"'{name}' matches several products: {', '.join(candidates)}")
+        self.name = name
+        self.candidates = candidates
+
+
+def normalize_product(name: str) -> str:
+    """Catalog key: lower-case, punctuation to spaces, single-spaced. Mirrors the SQL backfill in migration v7."""
+    return _NON_ALNUM.sub(" ", name.lower()).strip()
+
+
+def resolve_product(conn, name: str):
+    """(product_key, product_name) of the matching product, or None if it's new. Raises AmbiguousProduct."""
+    key = normalize_product(name)
+    with conn.cursor() as cur:
+        # Exact key first (unique index), else best trigram neighbours (GIN index via %)
+        cur.execute("""
+            SELECT product_key, product_name, similarity(product_key, %(key)s) AS score
+            FROM inventory
+            WHERE product_key = %(key)s OR product_key %% %(key)s
+            ORDER BY product_key = %(key)s DESC, score DESC
+            LIMIT 2
+        """, {"key": key})
+        rows = cur.fetchall()
+    if not rows:
+        return None
+    best_key, best_name, best_score = rows[0]
+    if best_key == key:
+        return best_key, best_name
+    if best_score < PRODUCT_MATCH_THRESHOLD:
+        return None
+    if len(rows) > 1 and best_score - rows[1][2] < PRODUCT_MATCH_MARGIN:
+        raise AmbiguousProduct(name, [best_name, rows[1][1]])
+    return best_key, best_name
@@ -0,0 +1,207 @@
+"""LangGraph checkpointer on the shared psycopg2 pool (db.py).
+
+Each checkpoint stores the full (bounded, see memory.py) channel values inline, so one
+row is enough to restore a conversation. Only the newest CHECKPOINT_KEEP checkpoints per
+thread are kept; older ones are pruned on write.
+"""
+import os
+from typing import Any, Iterator, AsyncIterator, Sequence
+
+import psycopg2
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+import db
+
+# --- Configuration ---
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "5"))  # per thread; history lives in the latest one
+
+
+def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+class PostgresSaver(BaseCheckpointSaver):
+    """Sync methods take a pooled connection; async ones run them via db.get_async_pool()."""
+
+    def __init__(self, pool=None, keep: int = CHECKPOINT_KEEP, **kwargs):
+        super().__init__(**kwargs)
+        self._pool = pool
+        self._async_pool = db.AsyncConnectionPool(pool) if pool is not None else None
+        self.keep = keep
+
+    @property
+    def pool(self):
+        return self._pool or db.get_pool()
+
+    # --- Connection-level ops ---
+    def _tuple(self, cur, thread_id, checkpoint_ns, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, ctype, checkpoint, mtype, metadata = row
+        cur.execute(
+            "SELECT task_id, channel, type, value FROM graph_checkpoint_writes "
+            "WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id = %s "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        )
+        writes = [(task_id, channel, self.serde.loads_typed((vtype, bytes(value))))
+                  for task_id, channel, vtype, value in cur.fetchall()]
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self.serde.loads_typed((ctype, bytes(checkpoint))),
+            metadata=self.serde.loads_typed((mtype, bytes(metadata))),
+            parent_config=_config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=writes,
+        )
+
+    def _get(self, conn, config: RunnableConfig):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        sql = ("SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+               "FROM graph_checkpoints WHERE thread_id = %s AND checkpoint_ns = %s")
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id:
+            sql += " AND checkpoint_id = %s"
+            params.append(checkpoint_id)
+        with conn.cursor() as cur:
+            cur.execute(sql + " ORDER BY checkpoint_id DESC LIMIT 1", params)
+            row = cur.fetchone()
+            return self._tuple(cur, thread_id, checkpoint_ns, row) if row else None
+
+    def _list(self, conn, config, filter, before, limit) -> list:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = %s")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = %s")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = %s")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < %s")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        results = []
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+                f"FROM graph_checkpoints {where} ORDER BY checkpoint_id DESC",
+                params
+            )
+            for row in cur.fetchall():
+                tup = self._tuple(cur, row[0], row[1], row[2:])
+                if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(tup)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def _put(self, conn, config, checkpoint, metadata) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        ctype, cbytes = self.serde.dumps_typed(checkpoint)
+        mtype, mbytes = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO graph_checkpoints
+                    (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id)
+                DO UPDATE SET checkpoint = EXCLUDED.checkpoint, metadata = EXCLUDED.metadata
+            """, (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                  ctype, psycopg2.Binary(cbytes), mtype, psycopg2.Binary(mbytes)))
+            if self.keep:
+                self._prune(cur, thread_id, checkpoint_ns)
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def _prune(self, cur, thread_id, checkpoint_ns):
+        cur.execute("""
+            WITH stale AS (
+                DELETE FROM graph_checkpoints
+                WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id < ALL (
+                    SELECT checkpoint_id FROM graph_checkpoints
+                    WHERE thread_id = %s AND checkpoint_ns = %s
+                    ORDER BY checkpoint_id DESC LIMIT %s
+                )
+                RETURNING checkpoint_id
+            )
+            DELETE FROM graph_checkpoint_writes
+            WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id IN (SELECT checkpoint_id FROM stale)
+        """, (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep, thread_id, checkpoint_ns))
+
+    def _put_writes(self, conn, config, writes, task_id, task_path):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special channels (errors, interrupts) keep one row per task: overwrite; regular writes are idempotent
+        upsert = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            vtype, vbytes = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, vtype, psycopg2.Binary(vbytes), task_path))
+        conflict = ("DO UPDATE SET channel = EXCLUDED.channel, type = EXCLUDED.type, value = EXCLUDED.value"
+                    if upsert else "DO NOTHING")
+        with conn.cursor() as cur:
+            cur.executemany(f"""
+                INSERT INTO graph_checkpoint_writes
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id, task_id, idx) {conflict}
+            """, rows)
+
+    def _delete(self, conn, thread_id: str):
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM graph_checkpoint_writes WHERE thread_id = %s", (thread_id,))
+            cur.execute("DELETE FROM graph_checkpoints WHERE thread_id = %s", (thread_id,))
+
+    # --- BaseCheckpointSaver API ---
+    def get_tuple(self, config: RunnableConfig):
+        return self.pool.run(self._get, config)
+
+    def list(self, config, *, filter=None, before=None, limit=None) -> Iterator[CheckpointTuple]:
+        yield from self.pool.run(self._list, config, filter, before, limit)
+
+    def put(self, config, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        return self.pool.run(self._put, config, checkpoint, metadata)
+
+    def put_writes(self, config, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = ""):
+        self.pool.run(self._put_writes, config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str):
+        self.pool.run(self._delete, thread_id)
+
+    # Async variants: blocking psycopg2 work goes to threads, bounded by the async pool
+    @property
+    def _apool(self):
+        return self._async_pool or db.get_async_pool()
+
+    async def aget_tuple(self, config: RunnableConfig):
+        return await self._apool.run(self._get, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[CheckpointTuple]:
+        for tup in await self._apool.run(self._list, config, filter, before, limit):
+            yield tup
+
+    async def aput(self, config, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await self._apool.run(self._put, config, checkpoint, metadata)
+
+    async def aput_writes(self, config, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = ""):
+        await self._apool.run(self._put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        await self._apool.run(self._delete, thread_id)
@@ -0,0 +1,52 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+import factory_ops
+import router
+
+
+class FactoryCommand(BaseModel):
+    """One structured-output call turns a message into this; the matching tool runs directly."""
+    intent: Literal["log_production", "update_stock", "maintenance", "chat"]
+    machine_id: Optional[str] = Field(None, description="Machine name/ID for log_production, e.g. 'A'")
+    rolls: Optional[int] = Field(None, description="Rolls produced, for log_production")
+    entries: Optional[list[factory_ops.ProductionEntry]] = Field(
+        None, description="log_production for SEVERAL machines: one entry per machine")
+    product_name: Optional[str] = Field(None, description="Item name for update_stock")
+    quantity_change: Optional[int] = Field(None, description="Positive to ADD stock, negative to REMOVE")
+    reply: Optional[str] = Field(None, description="Answer to the user for chat, or a question if details are missing")
+
+
+_PHONETIC = router.phonetic_prompt().replace("\n", "\n        ")
+COMMAND_PROMPT = f"""You are a factory supervisor. Read the user's last message and return ONE command as JSON.
+
+        - LOG production output -> intent 'log_production' with machine_id and rolls
+          (several machines in one message -> entries, one per machine).
+        - ADD / REMOVE stock -> intent 'update_stock' with product_name and quantity_change (negative to remove).
+        - ERROR codes, broken machines, manuals -> intent 'maintenance'.
+        - Anything else (greetings, unclear requests) -> intent 'chat' with a short reply.
+
+        PHONETIC CORRECTION:
+        {_PHONETIC}
+
+        Never invent numbers or names. If a detail is missing use intent 'chat' and ask for it in reply.
+        """
+
+
+def missing_fields(cmd: FactoryCommand) -> list:
+    if cmd.intent == "log_production" and cmd.entries:
+        return []
+    required = {"log_production": ["machine_id", "rolls"], "update_stock": ["product_name", "quantity_change"]}
+    return [f for f in required.get(cmd.intent, []) if getattr(cmd, f) in (None, "")]
+
+
+async def execute(cmd: FactoryCommand, pool=None) -> str:
+    """Run the tool for a write command and return its reply text."""
+    if cmd.intent == "log_production" and cmd.entries:
+        return await factory_ops.log_production_batch(cmd.entries, pool=pool)
+    if cmd.intent == "log_production":
+        return await factory_ops.log_production(cmd.machine_id, cmd.rolls, pool=pool)
+    if cmd.intent == "update_stock":
+        return await factory_ops.update_stock(cmd.product_name, cmd.quantity_change, pool=pool)
+    raise ValueError(f"No direct tool for intent '{cmd.intent}'")
@@ -1,66 +1,98 @@
+import os
+
+import psycopg2
 import streamlit as st
 import pandas as pd
-import psycopg2
 import plotly.express as px
-import os
+from streamlit_autorefresh import st_autorefresh
+
+import db
+import migrations
+import rollups
+from live_updates import ChangeListener
+
+# Seconds a query result is reused across reruns and viewers (the TV and every browser share it).
+# Change events invalidate earlier; the TTL only backstops a dropped listener and the date rollover.
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+# How often the page checks the listener's counters - costs no queries unless something changed
+DASHBOARD_REFRESH_MS = int(os.getenv("DASHBOARD_REFRESH_MS", "2000"))
 
 st.set_page_config(page_title="Krafix FactoryOS", layout="wide")
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5435")
-DB_USER = os.getenv("POSTGRES_USER", "postgres")
-DB_PASS = os.getenv("POSTGRES_PASSWORD", "password")
-DB_NAME = os.getenv("POSTGRES_DB", "krafix_factory")
+# The pool lives in the db module, so it survives Streamlit reruns (no reconnect per refresh)
+pool = db.get_pool()
+
+
+
+# One LISTEN connection per dashboard process, shared by every viewer
+@st.cache_resource
+def get_listener() -> ChangeListener:
+    return ChangeListener().start()
+
+
+# Reads hit the production_daily rollup (a few rows per day), never the raw logs.
+# `version` is the table's change counter: a NOTIFY makes the next rerun miss the cache.
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_production_today(version: int) -> int:
+    return pool.run(rollups.production_today)
 
-def get_db_connection():
-    try:
-        return psycopg2.connect(f"dbname={DB_NAME} user={DB_USER} password={DB_PASS} host={DB_HOST} port={DB_PORT}")
-    except:
-        return None
 
-conn = get_db_connection()
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_daily_production(version: int) -> pd.DataFrame:
+    return pd.DataFrame(pool.run(rollups.daily_production), columns=['dt', 'rolls'])
 
-if conn:
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_machine_production(version: int) -> pd.DataFrame:
+    return pd.DataFrame(pool.run(rollups.machine_production), columns=['machine', 'rolls'])
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_inventory(version: int) -> pd.DataFrame:
+    return pd.DataFrame(pool.run(rollups.inventory_levels), columns=['product', 'quantity'])
+
+
+st_autorefresh(interval=DASHBOARD_REFRESH_MS, key="live_refresh")
+
+try:
+    # Schema bootstrap runs once per process (see migrations.py), not on every rerun
+    migrations.ensure_migrated()
+    listener = get_listener()
+    production_version = listener.version("production_daily")
     st.title("🏭 Krafix Command Center")
-    
-    try:
-        cur = conn.cursor()
-        
-        # 1. Auto-create table if missing (Same schema as server.py)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS production_logs (
-                id SERIAL PRIMARY KEY, machine_id TEXT, rolls_produced INT, timestamp TIMESTAMP DEFAULT NOW()
-            );
-        """)
-        conn.commit()
-
-        # 2. Fetch Data (Using Cursor to avoid Pandas/SQLAlchemy warning)
-        cur.execute("SELECT SUM(rolls_produced) FROM production_logs WHERE date(timestamp) = CURRENT_DATE;")
-        result = cur.fetchone()
-        prod_today = result[0] if result and result[0] is not None else 0
-        
-        # Charts
-        col1, col2 = st.columns(2)
-        col1.metric("📦 Production Today", f"{prod_today} Rolls")
-        
-        # Trend Chart
-        cur.execute("SELECT date(timestamp) as dt, SUM(rolls_produced) as rolls FROM production_logs GROUP BY dt ORDER BY dt ASC")
-        rows = cur.fetchall()
-        
-        if rows:
-            df_trend = pd.DataFrame(rows, columns=['dt', 'rolls'])
-            fig = px.bar(df_trend, x='dt', y='rolls', template="plotly_dark", title="Daily Production")
-            st.plotly_chart(fig, width="stretch")
-        else:
-            st.info("No production history yet. Start logging via WhatsApp!")
-            
-        cur.close()
-        
-    except Exception as e:
-        st.error(f"Error loading dashboard: {e}")
-    
-    conn.close()
-else:
+    if not listener.connected:
+        st.caption(f"⚠️ Live updates offline - numbers refresh every {DASHBOARD_CACHE_TTL}s")
+
+    prod_today = load_production_today(production_version)
+
+    # Charts
+    col1, col2 = st.columns(2)
+    col1.metric("📦 Production Today", f"{prod_today} Rolls")
+
+    df_machines = load_machine_production(production_version)
+    if not df_machines.empty:
+        fig = px.bar(df_machines, x='machine', y='rolls', template="plotly_dark", title="Today by Machine")
+        col2.plotly_chart(fig, width="stretch")
+
+    # Trend Chart
+    df_trend = load_daily_production(production_version)
+    if not df_trend.empty:
+        fig = px.bar(df_trend, x='dt', y='rolls', template="plotly_dark", title="Daily Production")
+        st.plotly_chart(fig, width="stretch")
+    else:
+        st.info("No production history yet. Start logging via WhatsApp!")
+
+    # Inventory
+    df_inventory = load_inventory(listener.version("inventory"))
+    if not df_inventory.empty:
+        st.subheader("📋 Inventory")
+        st.dataframe(df_inventory, hide_index=True, width="stretch")
+
+except (db.PoolTimeout, psycopg2.OperationalError):
     st.error("Connecting to Database...")
+except Exception as e:
+    st.error(f"Error loading dashboard: {e}")
 
-if st.button("Refresh"): st.rerun()
\ No newline at end of file
+if st.button("Refresh"):
+    st.cache_data.clear()
+    st.rerun()
@@ -0,0 +1,269 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+# --- Configuration ---
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5435")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASS = os.getenv("POSTGRES_PASSWORD", "password")
+DB_NAME = os.getenv("POSTGRES_DB", "krafix_factory")
+DB_DSN = f"dbname={DB_NAME} user={DB_USER} password={DB_PASS} host={DB_HOST} port={DB_PORT}"
+
+# Pool sizing (tune with pool_stats(): if 'waits' keeps climbing, raise DB_POOL_MAX)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Idle connections older than this are pinged with SELECT 1 before being handed out
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the pool timeout."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe psycopg2 pool with health checks and saturation stats."""
+
+    def __init__(self, dsn: str, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT, check_after: float = DB_POOL_CHECK_AFTER):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool bounds: min={minconn} max={maxconn}")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self._idle = []  # [(conn, last_used_monotonic)] - LIFO keeps hot connections hot
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0, "waits": 0, "wait_seconds": 0.0, "timeouts": 0,
+            "peak_in_use": 0, "connects": 0, "health_check_failures": 0, "discarded": 0,
+        }
+
+    # --- Internals ---
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        with self._cond:
+            self._stats["connects"] += 1
+        return conn
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    # --- Public API ---
+    def getconn(self):
+        """Check out a healthy connection, blocking up to `timeout` seconds when saturated."""
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.maxconn:
+                    self._open += 1  # reserve the slot before connecting outside the lock
+                    conn, last_used = None, None
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._open >= self.maxconn:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"No DB connection free after {self.timeout}s (max={self.maxconn})")
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - start
+
+        try:
+            if conn is None:
+                return self._connect()
+            if self._is_healthy(conn, last_used):
+                return conn
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn):
+        """Return a connection; broken or mid-transaction connections are cleaned up first."""
+        with self._cond:
+            self._in_use -= 1
+        if self._closed or conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn(conn, *args) in one transaction: commit on success, rollback on error."""
+        with self.connection() as conn:
+            try:
+                result = fn(conn, *args, **kwargs)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+
+    def warm(self):
+        """Open `minconn` connections up front so the first request skips the handshake."""
+        conns = [self.getconn() for _ in range(self.minconn)]
+        for conn in conns:
+            self.putconn(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "max": self.maxconn,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "saturation": round(self._in_use / self.maxconn, 3),
+            })
+        return stats
+
+
+class AsyncConnectionPool:
+    """asyncio front-end: DB work runs in a worker thread so the event loop never blocks on psycopg2."""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        # One semaphore per event loop (tests and workers may run several loops in one process)
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            # Callers beyond pool size queue on the loop instead of parking executor threads
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.pool.maxconn)
+        return sem
+
+    async def run(self, fn, *args, **kwargs):
+        """Async twin of ConnectionPool.run."""
+        async with self._semaphore():
+            return await asyncio.to_thread(self.pool.run, fn, *args, **kwargs)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a connection without blocking the loop. Queries on it still block - prefer run()."""
+        async with self._semaphore():
+            conn = await asyncio.to_thread(self.pool.getconn)
+            try:
+                yield conn
+            finally:
+                self.pool.putconn(conn)
+
+    def stats(self) -> dict:
+        return self.pool.stats()
+
+
+# --- Process-wide singletons ---
+_pool = None
+_async_pool = None
+_lock = threading.RLock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_DSN)
+    return _pool
+
+
+def get_async_pool() -> AsyncConnectionPool:
+    global _async_pool
+    if _async_pool is None:
+        with _lock:
+            if _async_pool is None:
+                _async_pool = AsyncConnectionPool(get_pool())
+    return _async_pool
+
+
+def connection():
+    """Shortcut: `with db.connection() as conn:` on the shared pool."""
+    return get_pool().connection()
+
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
+def close_pool():
+    """Close the shared pool (shutdown hooks and tests)."""
+    global _pool, _async_pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+        _async_pool = None
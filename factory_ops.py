@@ -0,0 +1,187 @@
+"""Database operations behind the tools, shared by server.py (MCP), pydantic_agent.py and
+the direct command path in agent_graph.py. Each op takes an open connection; callers run it
+through the pool (`db.get_pool().run(op, ...)` or `await db.get_async_pool().run(op, ...)`).
+"""
+import os
+import asyncio
+import weakref
+
+from pydantic import BaseModel, Field
+
+from db import get_async_pool
+from catalog import AmbiguousProduct, normalize_product, resolve_product
+import ledger
+import tracing
+
+# --- Configuration ---
+# Write-behind window for single production logs: inserts arriving within it share one
+# transaction. 0 disables buffering (every log commits on its own).
+PRODUCTION_BUFFER_MS = int(os.getenv("PRODUCTION_BUFFER_MS", "0"))
+PRODUCTION_BUFFER_MAX = int(os.getenv("PRODUCTION_BUFFER_MAX", "100"))  # flush early at this many rows
+
+
+class ProductionEntry(BaseModel):
+    machine_id: str = Field(description="Machine name/ID, e.g. 'A'")
+    rolls: int = Field(description="Rolls produced")
+
+
+# --- Ops (run inside one pooled transaction) ---
+def insert_production(conn, machine_id: str, rolls: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO production_logs (machine_id, rolls_produced) VALUES (%s, %s) RETURNING id",
+            (machine_id, rolls)
+        )
+        return cur.fetchone()[0]
+
+
+def insert_production_batch(conn, entries) -> list:
+    """Insert many (machine_id, rolls) rows in one statement. IDs come back in entry order."""
+    entries = [(e.machine_id, e.rolls) if isinstance(e, ProductionEntry) else tuple(e) for e in entries]
+    if not entries:
+        return []
+    machines, rolls = zip(*entries)
+    with conn.cursor() as cur:
+        # One round trip for the whole shift report (COPY can't return the generated IDs)
+        cur.execute("""
+            INSERT INTO production_logs (machine_id, rolls_produced)
+            SELECT machine_id, rolls FROM unnest(%s::text[], %s::int[]) WITH ORDINALITY AS t(machine_id, rolls, n)
+            ORDER BY n
+            RETURNING id
+        """, (list(machines), list(rolls)))
+        return [row[0] for row in cur.fetchall()]
+
+
+def apply_stock_change(conn, product_name: str, quantity_change: int) -> tuple:
+    """Resolve the name to one catalog product (or create it) and append the change to the ledger.
+    Returns (canonical product_name, new quantity)."""
+    if not normalize_product(product_name):
+        raise ValueError(f"'{product_name}' is not a product name")
+    match = resolve_product(conn, product_name)
+    key, name = match or (normalize_product(product_name), product_name.strip())
+    if match is None:
+        with conn.cursor() as cur:
+            # New catalog entry; a concurrent creator of the same product wins harmlessly
+            cur.execute(
+                "INSERT INTO inventory (product_name, product_key) VALUES (%s, %s) ON CONFLICT (product_key) DO NOTHING",
+                (name, key)
+            )
+    # Append-only: no UPDATE of the product row, so concurrent changes don't wait on each other
+    ledger.record_movement(conn, key, quantity_change)
+    return name, ledger.current_stock(conn, key)
+
+
+# --- Write-behind buffer ---
+class ProductionBuffer:
+    """Groups single production inserts arriving within `window` seconds into one batch
+    transaction; every caller still gets its own ID (or the batch's exception)."""
+
+    def __init__(self, pool, window: float = PRODUCTION_BUFFER_MS / 1000, max_rows: int = PRODUCTION_BUFFER_MAX):
+        self.pool = pool
+        self.window = window
+        self.max_rows = max_rows
+        self._pending = []  # (entry, future)
+        self._timer = None
+        self._flushes = set()  # strong refs so in-flight flush tasks aren't garbage collected
+        self._stats = {"rows": 0, "flushes": 0, "failed_flushes": 0}
+
+    async def add(self, machine_id: str, rolls: int) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((machine_id, rolls), future))
+        if len(self._pending) >= self.max_rows:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.window)
+        return await future
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            ids = await self.pool.run(insert_production_batch, [entry for entry, _ in batch])
+        except Exception as e:
+            self._stats["failed_flushes"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._stats["flushes"] += 1
+        self._stats["rows"] += len(batch)
+        for (_, future), new_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(new_id)
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = len(self._pending)
+        stats["rows_per_flush"] = round(stats["rows"] / stats["flushes"], 2) if stats["flushes"] else 0.0
+        return stats
+
+
+# One buffer per (event loop, pool): futures and timers belong to a loop
+_buffers = weakref.WeakKeyDictionary()
+
+
+def get_production_buffer(pool=None) -> ProductionBuffer:
+    pool = pool or get_async_pool()
+    per_loop = _buffers.setdefault(asyncio.get_running_loop(), {})
+    if pool not in per_loop:
+        per_loop[pool] = ProductionBuffer(pool)
+    return per_loop[pool]
+
+
+# --- Async entry points returning the user-facing reply ---
+async def log_production(machine_id: str, rolls: int, pool=None) -> str:
+    try:
+        with tracing.span("tool", "log_production"):
+            if PRODUCTION_BUFFER_MS > 0:
+                new_id = await get_production_buffer(pool).add(machine_id, rolls)
+            else:
+                new_id = await (pool or get_async_pool()).run(insert_production, machine_id, rolls)
+        return f"✅ Success. Logged to Database. ID: {new_id}"
+    except Exception as e:
+        return f"❌ Error logging: {e}"
+
+
+def ambiguous_reply(e: AmbiguousProduct) -> str:
+    return f"❓ Which product did you mean: {' or '.join(e.candidates)}? Nothing was changed."
+
+
+def format_batch_reply(entries, ids) -> str:
+    lines = [f"- {e.machine_id}: {e.rolls} rolls (ID: {new_id})" for e, new_id in zip(entries, ids)]
+    return f"✅ Success. Logged {len(ids)} entries to Database.\n" + "\n".join(lines)
+
+
+async def log_production_batch(entries, pool=None) -> str:
+    entries = [e if isinstance(e, ProductionEntry) else ProductionEntry(**e) for e in entries]
+    if not entries:
+        return "❌ Error logging: no entries given."
+    try:
+        with tracing.span("tool", "log_production_batch", entries=len(entries)):
+            ids = await (pool or get_async_pool()).run(insert_production_batch, entries)
+        return format_batch_reply(entries, ids)
+    except Exception as e:
+        return f"❌ Error logging: {e}"
+
+
+async def update_stock(product_name: str, quantity_change: int, pool=None) -> str:
+    try:
+        with tracing.span("tool", "update_stock"):
+            name, new_qty = await (pool or get_async_pool()).run(apply_stock_change, product_name, quantity_change)
+        return f"✅ Stock Updated. {name}: {new_qty}"
+    except AmbiguousProduct as e:
+        return ambiguous_reply(e)
+    except Exception as e:
+        return f"❌ Error updating stock: {e}"
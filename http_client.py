@@ -0,0 +1,100 @@
+import os
+import random
+import asyncio
+
+import httpx
+
+# --- Configuration ---
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+# Point at a local stand-in for tests/benchmarks, e.g. http://localhost:9000
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com").rstrip("/")
+TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886")
+
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(16 * 1024 * 1024)))  # WhatsApp's own voice-note limit
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+SEND_RETRIES = int(os.getenv("TWILIO_SEND_RETRIES", "4"))
+BACKOFF_BASE, BACKOFF_CAP = 0.5, 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MediaDownloadError(Exception):
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared pooled client (keep-alive) for Twilio media downloads and outbound messages."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+            follow_redirects=True,  # Twilio media URLs redirect to the CDN
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def twilio_auth():
+    if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and "PLACEHOLDER" not in TWILIO_ACCOUNT_SID:
+        return (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return None
+
+
+async def download_media(url: str, max_bytes: int = MEDIA_MAX_BYTES) -> bytes:
+    """Stream a media file into memory, aborting as soon as it exceeds max_bytes."""
+    async with get_client().stream("GET", url, auth=twilio_auth()) as resp:
+        if resp.status_code != 200:
+            raise MediaDownloadError(f"Download failed (Status {resp.status_code})", resp.status_code)
+        declared = int(resp.headers.get("content-length") or 0)
+        if declared > max_bytes:
+            raise MediaDownloadError(f"Media too large ({declared} bytes)", resp.status_code)
+        chunks, size = [], 0
+        async for chunk in resp.aiter_bytes():
+            size += len(chunk)
+            if size > max_bytes:
+                raise MediaDownloadError(f"Media too large (>{max_bytes} bytes)", resp.status_code)
+            chunks.append(chunk)
+    if not size:
+        raise MediaDownloadError("Empty media file", 200)
+    return b"".join(chunks)
+
+
+def _backoff(attempt: int, retry_after: str = None) -> float:
+    """Full-jitter exponential backoff; honours Retry-After when Twilio sends one."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+async def send_whatsapp(to: str, body: str, retries: int = SEND_RETRIES) -> httpx.Response:
+    """POST a message via the Twilio Messages API, retrying network errors, 429s and 5xx."""
+    url = f"{TWILIO_API_BASE}/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+    data = {"To": to, "From": TWILIO_WHATSAPP_FROM, "Body": body}
+    for attempt in range(retries + 1):
+        try:
+            resp = await get_client().post(url, auth=twilio_auth(), data=data)
+            if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                return resp
+            delay = _backoff(attempt, resp.headers.get("retry-after"))
+            print(f"⚠️ Twilio {resp.status_code}, retry {attempt + 1}/{retries} in {delay:.1f}s", flush=True)
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            delay = _backoff(attempt)
+            print(f"⚠️ Twilio send error ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s", flush=True)
+        await asyncio.sleep(delay)
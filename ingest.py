@@ -2,38 +2,149 @@ from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_ollama import OllamaEmbeddings
+from retriever import mark_ingested
+from keyword_index import INDEX_FILE, chunk_id, build_index, save_index
 
-# Create dummy PDF if none exists
 import os
+import sys
+import time
 import requests
+from concurrent.futures import ProcessPoolExecutor
 
 # 1. Configuration
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+CHROMA_DIR = "./chroma_db"
+# Drop PDFs here (sub-folders are fine). Falls back to ./manual.pdf when the folder is absent.
+MANUALS_DIR = os.getenv("MANUALS_DIR", "./manuals")
+EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+CHUNK_SIZE, CHUNK_OVERLAP = 500, 50
 
-# 2. Ensure Embedding Model Exists
-print(f"🔌 Connecting to Ollama at {OLLAMA_HOST}...")
-try:
-    requests.post(f"{OLLAMA_HOST}/api/pull", json={"name": "nomic-embed-text"})
-    print("⬇️  Pulled 'nomic-embed-text' model.")
-except Exception as e:
-    print(f"⚠️ Warning: Could not pull model automatically: {e}")
-
-# 3. Create dummy file if missing
-if not os.path.exists("manual.pdf"):
-    from reportlab.pdfgen import canvas
-    c = canvas.Canvas("manual.pdf")
-    c.drawString(100, 750, "Error 502: Blade Jam. Solution: Apply grease.")
-    c.save()
-    print("📄 Created dummy 'manual.pdf'")
-
-loader = PyPDFLoader("manual.pdf")
-docs = loader.load()
-splits = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50).split_documents(docs)
-
-print("🧠 Ingesting...")
-Chroma.from_documents(
-    documents=splits,
-    embedding=OllamaEmbeddings(model="nomic-embed-text", base_url=OLLAMA_HOST),
-    persist_directory="./chroma_db"
-)
-print("✅ Manual Ingested! Vector DB saved to ./chroma_db")
\ No newline at end of file
+
+def find_pdfs(paths: list) -> list:
+    """Expand files/directories into a sorted list of PDF paths."""
+    pdfs = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                pdfs.update(os.path.join(root, f) for f in files if f.lower().endswith(".pdf"))
+        elif path.lower().endswith(".pdf") and os.path.exists(path):
+            pdfs.add(path)
+    return sorted(os.path.normpath(p) for p in pdfs)
+
+
+def load_and_split(path: str) -> tuple:
+    """Parse one PDF (runs in a worker process). Returns (pages, [(id, text, metadata)])."""
+    docs = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+    chunks = {}
+    for doc in splitter.split_documents(docs):
+        # page + start_index let keyword_index stitch the manual back together for error-code passages
+        metadata = {"source": path, "page": doc.metadata.get("page", 0), "start_index": doc.metadata["start_index"]}
+        chunks.setdefault(chunk_id(path, doc.page_content), (doc.page_content, metadata))
+    return len(docs), [(cid, text, meta) for cid, (text, meta) in chunks.items()]
+
+
+def plan_changes(existing: dict, desired: dict, scanned: set) -> tuple:
+    """Diff the store against the scan.
+
+    existing: {id: source} already in Chroma; desired: {id: ...} from this scan.
+    Returns (ids to embed, ids to delete). Chunks are deleted when their file was
+    re-scanned with different content, or when the file no longer exists.
+    """
+    to_add = [cid for cid in desired if cid not in existing]
+    to_delete = [
+        cid for cid, source in existing.items()
+        if cid not in desired and (source in scanned or not source or not os.path.exists(source))
+    ]
+    return to_add, to_delete
+
+
+def ensure_model():
+    print(f"🔌 Connecting to Ollama at {OLLAMA_HOST}...")
+    try:
+        requests.post(f"{OLLAMA_HOST}/api/pull", json={"name": "nomic-embed-text"})
+        print("⬇️  Pulled 'nomic-embed-text' model.")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not pull model automatically: {e}")
+
+
+def ingest(paths: list):
+    pdfs = find_pdfs(paths)
+    if not pdfs:
+        print("⚠️ No PDFs found.")
+        return
+
+    # 1. Parse in parallel
+    t0 = time.perf_counter()
+    pages, desired = 0, {}
+    workers = max(1, min(INGEST_WORKERS, len(pdfs)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for n_pages, chunks in pool.map(load_and_split, pdfs):
+            pages += n_pages
+            for cid, text, meta in chunks:
+                desired[cid] = (text, meta)
+    parse_s = time.perf_counter() - t0
+    print(f"📄 Parsed {len(pdfs)} PDFs / {pages} pages into {len(desired)} chunks ({workers} workers)")
+
+    # 2. Diff against what's already embedded
+    store = Chroma(
+        persist_directory=CHROMA_DIR,
+        embedding_function=OllamaEmbeddings(model="nomic-embed-text", base_url=OLLAMA_HOST),
+    )
+    current = store.get(include=["metadatas"])
+    existing = {}
+    for cid, meta in zip(current["ids"], current["metadatas"]):
+        source = (meta or {}).get("source")
+        existing[cid] = os.path.normpath(source) if source else ""
+    to_add, to_delete = plan_changes(existing, desired, set(pdfs))
+
+    # 3. Apply: delete stale chunks, embed only new/changed ones in batches
+    t1 = time.perf_counter()
+    if to_delete:
+        store.delete(ids=to_delete)
+    print(f"🧠 Ingesting {len(to_add)} new chunks ({len(desired) - len(to_add)} unchanged, {len(to_delete)} removed)...")
+    for i in range(0, len(to_add), EMBED_BATCH):
+        batch = to_add[i:i + EMBED_BATCH]
+        store.add_texts(
+            texts=[desired[cid][0] for cid in batch],
+            metadatas=[desired[cid][1] for cid in batch],
+            ids=batch,
+        )
+    embed_s = time.perf_counter() - t1
+
+    if to_add or to_delete or not os.path.exists(os.path.join(CHROMA_DIR, INDEX_FILE)):
+        # BM25 + error-code map over the whole collection (other folders' chunks included)
+        everything = store.get(include=["documents", "metadatas"])
+        # Unchanged chunks keep their stored metadata; this scan's copy has start_index even for older ingests
+        metadatas = [desired[cid][1] if cid in desired else meta
+                     for cid, meta in zip(everything["ids"], everything["metadatas"])]
+        index = build_index(zip(everything["ids"], everything["documents"], metadatas))
+        save_index(index, CHROMA_DIR)
+        print(f"🔎 Keyword index: {len(index['docs'])} chunks, {len(index['codes'])} error codes")
+        # Tell running servers to reopen the collection
+        mark_ingested(CHROMA_DIR)
+
+    total_s = parse_s + embed_s
+    print(
+        f"📊 Parse: {pages / parse_s if parse_s else 0:.1f} pages/s | "
+        f"Embed: {len(to_add) / embed_s if embed_s and to_add else 0:.1f} chunks/s | "
+        f"Total: {total_s:.1f}s"
+    )
+    print(f"✅ Manuals Ingested! Vector DB saved to {CHROMA_DIR}")
+
+
+if __name__ == "__main__":
+    ensure_model()
+
+    paths = sys.argv[1:] or ([MANUALS_DIR] if os.path.isdir(MANUALS_DIR) else ["manual.pdf"])
+
+    # Create dummy file if missing
+    if paths == ["manual.pdf"] and not os.path.exists("manual.pdf"):
+        from reportlab.pdfgen import canvas
+        c = canvas.Canvas("manual.pdf")
+        c.drawString(100, 750, "Error 502: Blade Jam. Solution: Apply grease.")
+        c.save()
+        print("📄 Created dummy 'manual.pdf'")
+
+    ingest(paths)
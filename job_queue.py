@@ -0,0 +1,125 @@
+"""Durable AI job queue in Postgres (FOR UPDATE SKIP LOCKED).
+
+The webhook enqueues, worker.py processes claim and run. A job whose worker dies is
+re-delivered once its visibility timeout lapses; failed jobs retry with backoff.
+Delivery is at-least-once. Jobs from one sender are claimed strictly in order.
+Ops take an open connection, like factory_ops.py; run them through the pool.
+"""
+import os
+
+# --- Configuration ---
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))  # workers heartbeat well within this
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "5"))
+# Queued jobs before the webhook answers "busy"
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "50"))
+
+
+def enqueue_job(conn, sender_id: str, payload: str, max_attempts: int = JOB_MAX_ATTEMPTS, request_id: str = None) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO ai_jobs (sender_id, payload, max_attempts, request_id) VALUES (%s, %s, %s, %s) RETURNING id",
+            (sender_id, payload, max_attempts, request_id)
+        )
+        return cur.fetchone()[0]
+
+
+def claim_job(conn, worker_id: str, visibility: int = JOB_VISIBILITY_TIMEOUT):
+    """Lease the oldest visible job whose sender has no earlier unfinished job. None if idle."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE ai_jobs SET
+                status = 'running', attempts = attempts + 1, worker_id = %s,
+                started_at = NOW(), first_started_at = COALESCE(first_started_at, NOW()),
+                visible_at = NOW() + make_interval(secs => %s)
+            WHERE id = (
+                SELECT j.id FROM ai_jobs j
+                WHERE j.status IN ('queued', 'running') AND j.visible_at <= NOW()
+                  AND NOT EXISTS (
+                      SELECT 1 FROM ai_jobs e
+                      WHERE e.sender_id = j.sender_id AND e.id < j.id AND e.status IN ('queued', 'running')
+                  )
+                ORDER BY j.id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, sender_id, payload, attempts, max_attempts,
+                      EXTRACT(EPOCH FROM NOW() - enqueued_at)::float AS queue_wait_s, request_id
+        """, (worker_id, visibility))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return dict(zip(("id", "sender_id", "payload", "attempts", "max_attempts", "queue_wait_s", "request_id"), row))
+
+
+def extend_job(conn, job_id: int, worker_id: str, visibility: int = JOB_VISIBILITY_TIMEOUT) -> bool:
+    """Heartbeat: push the lease out while a long LLM turn is still running."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE ai_jobs SET visible_at = NOW() + make_interval(secs => %s) "
+            "WHERE id = %s AND worker_id = %s AND status = 'running'",
+            (visibility, job_id, worker_id)
+        )
+        return cur.rowcount == 1
+
+
+def complete_job(conn, job_id: int, result: str):
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE ai_jobs SET status = 'done', result = %s, finished_at = NOW() WHERE id = %s",
+            (result, job_id)
+        )
+
+
+def fail_job(conn, job_id: int, error: str, retry: bool):
+    """Requeue with exponential backoff, or mark failed for good."""
+    with conn.cursor() as cur:
+        if retry:
+            cur.execute("""
+                UPDATE ai_jobs SET status = 'queued', last_error = %s,
+                    visible_at = NOW() + make_interval(secs => %s * power(2, attempts - 1))
+                WHERE id = %s
+            """, (error, JOB_RETRY_BASE, job_id))
+        else:
+            cur.execute(
+                "UPDATE ai_jobs SET status = 'failed', last_error = %s, finished_at = NOW() WHERE id = %s",
+                (error, job_id)
+            )
+
+
+def queue_depth(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM ai_jobs WHERE status = 'queued'")
+        return cur.fetchone()[0]
+
+
+def job_stats(conn, window_minutes: int = 60) -> dict:
+    """Status counts plus queue-wait / end-to-end latency percentiles for recent jobs."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT status, COUNT(*) FROM ai_jobs WHERE status IN ('queued', 'running') GROUP BY status")
+        stats = {"queued": 0, "running": 0}
+        stats.update(dict(cur.fetchall()))
+        cur.execute("""
+            SELECT COUNT(*) FILTER (WHERE status = 'done'),
+                   COUNT(*) FILTER (WHERE status = 'failed'),
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM first_started_at - enqueued_at)),
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM first_started_at - enqueued_at)),
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM finished_at - enqueued_at)),
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM finished_at - enqueued_at))
+            FROM ai_jobs
+            WHERE finished_at > NOW() - make_interval(mins => %s)
+        """, (window_minutes,))
+        row = cur.fetchone()
+    keys = ("done", "failed", "queue_wait_p50_s", "queue_wait_p95_s", "total_p50_s", "total_p95_s")
+    stats.update({k: round(v, 3) if isinstance(v, float) else v for k, v in zip(keys, row)})
+    return stats
+
+
+def purge_jobs(conn, older_than_days: int = 7) -> int:
+    """Drop finished jobs past the retention window (run from a cron/maintenance task)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM ai_jobs WHERE status IN ('done', 'failed') AND finished_at < NOW() - make_interval(days => %s)",
+            (older_than_days,)
+        )
+        return cur.rowcount
@@ -0,0 +1,166 @@
+"""Keyword side of manual retrieval, built by ingest.py next to the Chroma collection.
+
+- BM25 inverted index over every chunk: exact words ("axle", "E-stop", part numbers)
+  that embeddings blur.
+- Error-code map: code -> the manual passage that starts at "Error <code>", so
+  "How to fix Error 502?" is a dict lookup with no embedding call and can't come back
+  with Error 503's chunk. Passages are cut from each manual's full text (chunks stitched
+  back together by page + start_index), so a fix that spills into the next chunk stays
+  attached to its header.
+
+Stored as JSON in the Chroma directory and reloaded by retriever.py after each ingest.
+"""
+import os
+import re
+import math
+import json
+import hashlib
+from collections import Counter, defaultdict
+
+INDEX_FILE = "keyword_index.json"
+BM25_K1, BM25_B = 1.5, 0.75
+CODE_PASSAGE_MAX_CHARS = 1500  # long procedures end at a sentence boundary, not mid-step
+CODE_PASSAGE_MIN_CHARS = 40  # shorter is a header without its fix: leave it to search
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# "Error 502", "error code 502", "Fault #17", "alarm: 999"
+ERROR_CODE = re.compile(r"\b(?:error|err|fault|alarm)\s*(?:code\s*)?[#:]?\s*(\d{2,5})\b", re.IGNORECASE)
+_STOPWORDS = frozenset("a an and are as at be by for from how i in is it of on or the to what when with".split())
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Content-addressed ID: unchanged chunks keep their ID, so re-runs skip them."""
+    return hashlib.sha256(f"{source}\0{text}".encode()).hexdigest()
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def named_codes(text: str) -> list:
+    """Codes the text names explicitly ("Error 502"), in order."""
+    return list(dict.fromkeys(ERROR_CODE.findall(text)))
+
+
+def _trim(passage: str) -> str:
+    if len(passage) <= CODE_PASSAGE_MAX_CHARS:
+        return passage
+    end = passage.rfind(". ", 0, CODE_PASSAGE_MAX_CHARS)
+    return passage[:end + 1] if end >= CODE_PASSAGE_MIN_CHARS else passage[:CODE_PASSAGE_MAX_CHARS]
+
+
+def code_passages(text: str) -> dict:
+    """{code: passage} - each passage runs from its "Error <code>" to the next code (or the end).
+
+    Passages too short to hold a fix are left out."""
+    matches = list(ERROR_CODE.finditer(text))
+    passages = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        passage = _trim(" ".join(text[match.start():end].split()))
+        if len(passage) >= CODE_PASSAGE_MIN_CHARS and len(passage) > len(passages.get(match.group(1), "")):
+            passages[match.group(1)] = passage
+    return passages
+
+
+def _stitch(pieces) -> str:
+    """One page's text from its (start_index, text) chunks, overlaps removed."""
+    text, end = "", 0
+    for start, piece in sorted(pieces):
+        if start + len(piece) <= end:
+            continue
+        text += (" " if text and start > end else "") + piece[max(end - start, 0):]
+        end = start + len(piece)
+    return text
+
+
+def source_texts(chunks) -> dict:
+    """{source: full text} rebuilt from chunks. Sources with chunks from before start_index
+    was recorded are left out (their codes are mapped chunk by chunk)."""
+    pages, legacy = defaultdict(lambda: defaultdict(list)), set()
+    for _, text, meta in chunks:
+        meta = meta or {}
+        source = meta.get("source", "")
+        if meta.get("start_index") is None:
+            legacy.add(source)
+        else:
+            pages[source][meta.get("page", 0)].append((meta["start_index"], text))
+    return {
+        source: "\n".join(_stitch(by_page[page]) for page in sorted(by_page))
+        for source, by_page in pages.items() if source not in legacy
+    }
+
+
+def build_index(chunks) -> dict:
+    """chunks: iterable of (id, text, metadata). Returns the JSON-serialisable index."""
+    chunks = list(chunks)
+    docs, postings = {}, defaultdict(dict)
+    for cid, text, meta in chunks:
+        terms = Counter(tokenize(text))
+        docs[cid] = {"text": text, "meta": meta or {}, "len": sum(terms.values())}
+        for term, tf in terms.items():
+            postings[term][cid] = tf
+
+    codes = defaultdict(dict)  # code -> {source: passage}
+    texts = source_texts(chunks)
+    for source, text in texts.items():
+        for code, passage in code_passages(text).items():
+            codes[code][source] = {"source": source, "text": passage}
+    for cid, text, meta in chunks:
+        source = (meta or {}).get("source", "")
+        if source in texts:
+            continue
+        # Legacy chunks: overlapping chunks keep the longest passage
+        for code, passage in code_passages(text).items():
+            if len(passage) > len(codes[code].get(source, {}).get("text", "")):
+                codes[code][source] = {"source": source, "text": passage}
+    lengths = [d["len"] for d in docs.values()]
+    return {
+        "docs": docs,
+        "postings": dict(postings),
+        "avgdl": sum(lengths) / len(lengths) if lengths else 0.0,
+        "codes": {code: list(by_source.values()) for code, by_source in codes.items()},
+    }
+
+
+def save_index(index: dict, persist_dir: str):
+    path = os.path.join(persist_dir, INDEX_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)  # readers never see a half-written file
+
+
+class KeywordIndex:
+    def __init__(self, index: dict):
+        self.docs = index["docs"]
+        self.postings = index["postings"]
+        self.avgdl = index["avgdl"] or 1.0
+        self.codes = index["codes"]
+
+    @classmethod
+    def load(cls, persist_dir: str):
+        """The index ingest.py wrote, or None if this collection predates it."""
+        try:
+            with open(os.path.join(persist_dir, INDEX_FILE)) as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def passages_for(self, code: str) -> list:
+        """O(1): manual passages for one error code ([] if no manual mentions it)."""
+        return [entry["text"] for entry in self.codes.get(code, [])]
+
+    def search(self, query: str, k: int = 3) -> list:
+        """[(chunk id, BM25 score)] best first."""
+        n = len(self.docs)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for cid, tf in posting.items():
+                norm = 1 - BM25_B + BM25_B * self.docs[cid]["len"] / self.avgdl
+                scores[cid] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
@@ -0,0 +1,72 @@
+"""Inventory ledger (migration v8): stock changes append to inventory_movements and never
+UPDATE a hot per-product row, so concurrent receipts don't queue on row locks.
+
+compact_inventory() periodically folds each product's new movements into its balance
+(inventory.quantity / as_of_id) and records a snapshot, so current stock (the
+inventory_stock view) and point-in-time stock (stock_at()) are an index lookup plus a
+short tail scan. worker.py runs it every INVENTORY_COMPACT_INTERVAL seconds; by hand:
+    docker exec krafix_app python ledger.py
+"""
+import os
+
+import db
+
+# --- Configuration ---
+INVENTORY_COMPACT_INTERVAL = float(os.getenv("INVENTORY_COMPACT_INTERVAL", "300"))
+INVENTORY_COMPACT_LOCK_ID = 0x6B726167  # one compactor at a time across workers
+
+
+def record_movement(conn, product_key: str, quantity_change: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO inventory_movements (product_key, quantity_change) VALUES (%s, %s) RETURNING id",
+            (product_key, quantity_change)
+        )
+        return cur.fetchone()[0]
+
+
+def current_stock(conn, product_key: str) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT quantity FROM inventory_stock WHERE product_key = %s", (product_key,))
+        row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def stock_at(conn, product_key: str, at) -> int:
+    """Balance as of timestamp `at` (0 before the product's first known snapshot)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT stock_at(%s, %s)", (product_key, at))
+        return int(cur.fetchone()[0])
+
+
+def compact_inventory(conn) -> int:
+    """Fold new movements into balances + snapshots. Returns products compacted (0 if another worker is on it)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (INVENTORY_COMPACT_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            return 0
+        # Wait for in-flight movements to commit so none can land below the new as_of_id.
+        # Writers pause only for this transaction (one aggregate over the tails).
+        cur.execute("LOCK TABLE inventory_movements IN SHARE MODE")
+        cur.execute("""
+            WITH tail AS (
+                SELECT i.product_key, SUM(m.quantity_change) AS delta, MAX(m.id) AS max_id,
+                       GREATEST(MAX(m.created_at), i.as_of_time) AS max_time
+                FROM inventory i
+                JOIN inventory_movements m ON m.product_key = i.product_key AND m.id > i.as_of_id
+                GROUP BY i.product_key, i.as_of_time
+            ), balances AS (
+                UPDATE inventory i
+                SET quantity = i.quantity + tail.delta, as_of_id = tail.max_id, as_of_time = tail.max_time
+                FROM tail WHERE i.product_key = tail.product_key
+                RETURNING i.product_key, i.as_of_id, i.as_of_time, i.quantity
+            )
+            INSERT INTO inventory_snapshots (product_key, as_of_id, as_of_time, quantity)
+            SELECT product_key, as_of_id, as_of_time, quantity FROM balances
+        """)
+        return cur.rowcount
+
+
+if __name__ == "__main__":
+    compacted = db.get_pool().run(compact_inventory)
+    print(f"✅ Compacted {compacted} product balances.")
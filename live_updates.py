@@ -0,0 +1,90 @@
+"""LISTEN side of the dashboard's live updates (NOTIFY triggers: migration v6).
+
+One background thread per dashboard process holds a dedicated connection (LISTEN needs
+a session of its own, so it stays outside the pool) and counts change events per table.
+The dashboard keys its caches on those counters: a rerun only queries what changed.
+"""
+import os
+import select
+import threading
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.extensions
+
+import db
+
+# --- Configuration ---
+CHANGE_CHANNEL = "factory_changes"
+LISTEN_RECONNECT_DELAY = float(os.getenv("LISTEN_RECONNECT_DELAY", "3"))
+
+
+class ChangeListener:
+    def __init__(self, dsn: str = db.DB_DSN, channel: str = CHANGE_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.connected = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-listener", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def version(self, table: str) -> int:
+        with self._lock:
+            return self._versions[table]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._versions)
+
+    def _bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def _bump_all(self):
+        # Events may have been missed while disconnected: treat everything as changed
+        with self._lock:
+            for table in list(self._versions) or ["production_daily", "inventory"]:
+                self._versions[table] += 1
+
+    def drain(self, conn):
+        """Consume pending notifications; returns the tables that changed."""
+        conn.poll()
+        tables = set()
+        while conn.notifies:
+            tables.add(conn.notifies.pop(0).payload)
+        if tables:
+            self._bump(*tables)
+        return tables
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                self.connected = True
+                self._bump_all()
+                while not self._stop.is_set():
+                    # Wake at least once a second so stop() is honoured
+                    if select.select([conn], [], [], 1.0)[0]:
+                        self.drain(conn)
+            except Exception as e:
+                print(f"⚠️ Change listener disconnected ({e}), retrying in {LISTEN_RECONNECT_DELAY}s", flush=True)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(LISTEN_RECONNECT_DELAY)
@@ -0,0 +1,212 @@
+import os
+import time
+import asyncio
+import weakref
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+
+# --- Configuration ---
+# Ollama on CPU serves ~1-2 requests at a time; more in flight only adds queueing inside Ollama
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "2"))
+# "cluster": processes that call share_slots() (worker.py, server.py) hold OLLAMA_CONCURRENCY
+# slots between them via Postgres advisory locks. "process": each process has its own cap.
+OLLAMA_SLOT_SCOPE = os.getenv("OLLAMA_SLOT_SCOPE", "cluster")
+OLLAMA_SLOT_POLL = float(os.getenv("OLLAMA_SLOT_POLL", "0.1"))  # seconds between tries when all are held
+OLLAMA_SLOT_LOCK_ID = 0x6F6C6C61  # "olla": advisory lock class, slot index is the second key
+# Jobs waiting or running across all senders before we answer "busy"
+LLM_MAX_PENDING = int(os.getenv("LLM_MAX_PENDING", "20"))
+# Per sender, so one chatty foreman can't fill the whole queue
+LLM_MAX_PENDING_PER_SENDER = int(os.getenv("LLM_MAX_PENDING_PER_SENDER", "3"))
+
+BUSY_REPLY = "⏳ I'm handling a lot of requests right now. Please try again in a minute."
+
+# Set while a task holds an Ollama slot: nested calls (e.g. embeddings inside an agent run) don't re-acquire
+_holding_slot = contextvars.ContextVar("holding_ollama_slot", default=False)
+
+
+class SchedulerBusy(Exception):
+    """Raised by enqueue() when the queue is full; reply with BUSY_REPLY instead of piling up work."""
+
+
+# --- Cross-process slots (ops take an open connection, like job_queue.py) ---
+def try_ollama_slot(conn, slots: int):
+    """Take the first free cluster-wide slot (a session advisory lock). Its index, or None if all are held."""
+    with conn.cursor() as cur:
+        for slot in range(slots):
+            cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (OLLAMA_SLOT_LOCK_ID, slot))
+            if cur.fetchone()[0]:
+                break
+        else:
+            slot = None
+    conn.commit()  # session lock outlives the transaction; don't sit idle-in-transaction during the LLM call
+    return slot
+
+
+def release_ollama_slots(conn):
+    """Drop every slot this connection holds before it goes back to the pool."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock_all()")
+        conn.commit()
+    except Exception:
+        conn.close()  # the pool discards it, and the server frees its locks
+
+
+class SharedSlots:
+    """OLLAMA_CONCURRENCY slots shared by every process on the same database.
+
+    A slot is a session advisory lock held on a pooled connection for the length of the call;
+    a crashed process's connection closes and its slot frees itself."""
+
+    def __init__(self, slots: int = OLLAMA_CONCURRENCY, pool=None, poll: float = OLLAMA_SLOT_POLL):
+        self.slots = slots
+        self.pool = pool
+        self.poll = poll
+
+    @asynccontextmanager
+    async def hold(self):
+        import db
+        pool = self.pool or db.get_async_pool()
+        async with pool.connection() as conn:
+            try:
+                while True:
+                    attempt = asyncio.ensure_future(asyncio.to_thread(try_ollama_slot, conn, self.slots))
+                    try:
+                        slot = await asyncio.shield(attempt)
+                    except asyncio.CancelledError:
+                        await asyncio.wait([attempt])  # the thread can't be interrupted: unlock after it
+                        raise
+                    if slot is not None:
+                        break
+                    await asyncio.sleep(self.poll)
+                yield slot
+            finally:
+                await asyncio.to_thread(release_ollama_slots, conn)
+
+
+class LLMScheduler:
+    """Front door for all Ollama work.
+
+    - Global concurrency limit on Ollama calls (`slot()`): per process, and across processes
+      once share_slots() has attached SharedSlots.
+    - Per-sender FIFO: one sender's jobs run one at a time, in arrival order.
+    - Queue-depth backpressure: enqueue() raises SchedulerBusy when full.
+    """
+
+    def __init__(self, concurrency: int = OLLAMA_CONCURRENCY, max_pending: int = LLM_MAX_PENDING,
+                 max_pending_per_sender: int = LLM_MAX_PENDING_PER_SENDER):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_pending_per_sender = max_pending_per_sender
+        self.shared = None  # SharedSlots: cross-process cap on top of the per-process semaphore
+        self._queues = {}  # sender -> deque[(enqueued_at, fn, args, future)]
+        self._pending = 0
+        self._active_slots = 0
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._workers = set()  # strong refs so running drain tasks aren't garbage collected
+        self._stats = {"enqueued": 0, "completed": 0, "failed": 0, "rejected": 0,
+                       "queue_wait_seconds": 0.0, "slot_wait_seconds": 0.0}
+
+    # --- Global Ollama concurrency ---
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return sem
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the global Ollama slots for the duration of an LLM/embedding call."""
+        if _holding_slot.get():
+            yield
+            return
+        start = time.monotonic()
+        async with self._semaphore(), (self.shared.hold() if self.shared else nullcontext()):
+            self._stats["slot_wait_seconds"] += time.monotonic() - start
+            self._active_slots += 1
+            token = _holding_slot.set(True)
+            try:
+                yield
+            finally:
+                _holding_slot.reset(token)
+                self._active_slots -= 1
+
+    # --- Per-sender FIFO jobs ---
+    def enqueue(self, sender_id: str, fn, *args) -> asyncio.Future:
+        """Queue `await fn(*args)` behind the sender's earlier jobs. Must be called on the event loop."""
+        queue = self._queues.get(sender_id)
+        if self._pending >= self.max_pending or (queue and len(queue) >= self.max_pending_per_sender):
+            self._stats["rejected"] += 1
+            raise SchedulerBusy(f"LLM queue full ({self._pending} pending)")
+
+        future = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers never await: mark failures as retrieved to avoid loop warnings
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if queue is None:
+            queue = self._queues[sender_id] = deque()
+            worker = asyncio.create_task(self._drain(sender_id, queue))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        queue.append((time.monotonic(), fn, args, future))
+        self._pending += 1
+        self._stats["enqueued"] += 1
+        return future
+
+    async def _drain(self, sender_id: str, queue: deque):
+        try:
+            while queue:
+                enqueued_at, fn, args, future = queue[0]
+                self._stats["queue_wait_seconds"] += time.monotonic() - enqueued_at
+                try:
+                    result = await fn(*args)
+                    self._stats["completed"] += 1
+                    if not future.done():
+                        future.set_result(result)
+                except Exception as e:
+                    self._stats["failed"] += 1
+                    if not future.done():
+                        future.set_exception(e)
+                finally:
+                    queue.popleft()
+                    self._pending -= 1
+        finally:
+            # Sender idle: drop its queue so the next message starts a fresh worker
+            if self._queues.get(sender_id) is queue:
+                del self._queues[sender_id]
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats.update({
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "active_senders": len(self._queues),
+            "active_slots": self._active_slots,
+            "concurrency": self.concurrency,
+            "shared_slots": self.shared is not None,
+        })
+        return stats
+
+
+_scheduler = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+
+def share_slots(pool=None):
+    """Make this process's Ollama slots count against the cluster-wide OLLAMA_CONCURRENCY
+    (no-op for OLLAMA_SLOT_SCOPE=process). Call once at startup where LLM work runs."""
+    if OLLAMA_SLOT_SCOPE == "cluster":
+        scheduler = get_scheduler()
+        scheduler.shared = SharedSlots(scheduler.concurrency, pool)
+
+
+def ollama_slot():
+    """`async with ollama_slot():` around any call that hits Ollama."""
+    return get_scheduler().slot()
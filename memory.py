@@ -0,0 +1,107 @@
+"""Bounded conversation memory for the supervisor graph.
+
+The checkpointer (checkpointer.py) keeps each sender's thread across messages. Left alone
+the thread grows forever, and on CPU llama3.2 latency grows with prompt length, so:
+  - compact(): once a thread holds more than MEMORY_MAX_MESSAGES, the oldest turns are
+    folded into a rolling summary and removed from the checkpointed state.
+  - prompt(): what an LLM sees is system prompt + summary + the newest messages that fit
+    MEMORY_TOKEN_BUDGET, however long the foreman has been chatting.
+"""
+import os
+
+from langchain_core.messages import RemoveMessage, SystemMessage, HumanMessage, convert_to_messages, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph import MessagesState
+
+from llm_scheduler import ollama_slot
+
+# --- Configuration ---
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "12"))  # compact when the thread is longer
+MEMORY_KEEP_MESSAGES = int(os.getenv("MEMORY_KEEP_MESSAGES", "6"))  # verbatim messages kept after compaction
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1024"))  # history tokens per prompt (approx.)
+MEMORY_SUMMARY_CHARS = int(os.getenv("MEMORY_SUMMARY_CHARS", "600"))
+AGENT_CONTEXT_MESSAGES = int(os.getenv("AGENT_CONTEXT_MESSAGES", "4"))  # for "Yes"/"Machine 4" follow-ups
+
+SUMMARY_PROMPT = f"""You maintain a running summary of a WhatsApp chat between a factory foreman and the factory assistant.
+Merge the previous summary with the new lines. Keep machine IDs, product names, quantities,
+error codes and anything still awaiting confirmation. Drop greetings and small talk.
+Reply with the summary only, under {MEMORY_SUMMARY_CHARS // 6} words."""
+
+
+class ConversationState(MessagesState):
+    summary: str
+
+
+def _messages(state) -> list:
+    return convert_to_messages(state["messages"])
+
+
+def _clip(summary: str) -> str:
+    summary = " ".join(summary.split())
+    return summary if len(summary) <= MEMORY_SUMMARY_CHARS else "…" + summary[-MEMORY_SUMMARY_CHARS:]
+
+
+def _transcript(messages) -> str:
+    roles = {"human": "User", "ai": "Assistant"}
+    return "\n".join(f"{roles.get(m.type, m.type)}: {m.content}" for m in messages if str(m.content).strip())
+
+
+def split_point(messages, keep: int = MEMORY_KEEP_MESSAGES) -> int:
+    """Index where the verbatim window starts: at most `keep` messages, beginning on a user turn."""
+    cut = max(len(messages) - keep, 0)
+    while cut < len(messages) - 1 and messages[cut].type != "human":
+        cut += 1
+    return cut
+
+
+async def summarize(llm, previous: str, messages) -> str:
+    """Fold `messages` into the running summary. Falls back to an extractive summary if Ollama fails."""
+    lines = _transcript(messages)
+    request = f"Previous summary: {previous or '(none)'}\n\nNew lines:\n{lines}"
+    try:
+        async with ollama_slot():
+            response = await llm.ainvoke([SystemMessage(SUMMARY_PROMPT), HumanMessage(request)])
+        return _clip(response.content)
+    except Exception as e:
+        print(f"⚠️ Summarization failed ({e}), keeping extractive summary", flush=True)
+        return _clip(f"{previous} {lines}")
+
+
+async def compact(state, llm) -> dict:
+    """State update that moves overflow turns into the summary (empty if under the limit)."""
+    messages = _messages(state)
+    if len(messages) <= MEMORY_MAX_MESSAGES:
+        return {}
+    cut = split_point(messages)
+    old = messages[:cut]
+    summary = await summarize(llm, state.get("summary", ""), old)
+    print(f"🧠 Compacted {len(old)} messages into summary ({len(summary)} chars)", flush=True)
+    return {"summary": summary, "messages": [RemoveMessage(id=m.id) for m in old if m.id]}
+
+
+def prompt(state, system_prompt: str) -> list:
+    """System prompt + summary + newest history within MEMORY_TOKEN_BUDGET."""
+    system = system_prompt
+    if state.get("summary"):
+        system += f"\n\nEARLIER IN THIS CONVERSATION (summary):\n{state['summary']}"
+    history = trim_messages(
+        _messages(state), max_tokens=MEMORY_TOKEN_BUDGET, token_counter=count_tokens_approximately,
+        strategy="last", start_on="human", allow_partial=False,
+    )
+    if not history:  # one oversized message: still send it
+        history = _messages(state)[-1:]
+    return [SystemMessage(system)] + history
+
+
+def agent_input(state) -> str:
+    """Last message, prefixed with recent turns when there are any (so 'Yes' can confirm a pending log)."""
+    messages = _messages(state)
+    current = messages[-1].content
+    earlier = messages[max(len(messages) - 1 - AGENT_CONTEXT_MESSAGES, 0):-1]
+    if not earlier and not state.get("summary"):
+        return current
+    context = _transcript(earlier)
+    if state.get("summary"):
+        context = f"Summary: {state['summary']}\n{context}"
+    return (f"Recent conversation (context only - act on the current message, never repeat earlier actions):\n"
+            f"{context}\n\nCurrent message: {current}")
@@ -0,0 +1,280 @@
+"""Versioned schema bootstrap. Owns every table the tools write to, so tools only run DML.
+
+Run once at startup (whatsapp_server, server.py, dashboard) or by hand:
+    docker exec krafix_app python migrations.py
+"""
+import db
+
+# Any fixed 64-bit key: serializes concurrent migrators (app + dashboard starting together)
+MIGRATION_LOCK_ID = 0x6B726166  # "kraf"
+
+# (version, description, SQL). Append only - never edit a migration that has shipped.
+MIGRATIONS = [
+    (1, "base tables", """
+        CREATE TABLE IF NOT EXISTS production_logs (
+            id SERIAL PRIMARY KEY, machine_id TEXT, rolls_produced INT, timestamp TIMESTAMP DEFAULT NOW()
+        );
+        CREATE TABLE IF NOT EXISTS inventory (
+            id SERIAL PRIMARY KEY, product_name TEXT UNIQUE, quantity INT DEFAULT 0
+        );
+    """),
+    (2, "query indexes", """
+        CREATE INDEX IF NOT EXISTS idx_production_logs_timestamp ON production_logs (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_production_logs_machine_ts ON production_logs (machine_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_inventory_product_norm ON inventory (lower(btrim(product_name)));
+    """),
+    (3, "durable ai job queue", """
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            sender_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INT NOT NULL DEFAULT 0,
+            max_attempts INT NOT NULL DEFAULT 3,
+            enqueued_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            visible_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            first_started_at TIMESTAMPTZ,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            worker_id TEXT,
+            result TEXT,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_ai_jobs_pending ON ai_jobs (visible_at, id) WHERE status IN ('queued', 'running');
+        CREATE INDEX IF NOT EXISTS idx_ai_jobs_sender_pending ON ai_jobs (sender_id, id) WHERE status IN ('queued', 'running');
+        CREATE INDEX IF NOT EXISTS idx_ai_jobs_finished ON ai_jobs (finished_at);
+    """),
+    (4, "langgraph conversation checkpoints", """
+        CREATE TABLE IF NOT EXISTS graph_checkpoints (
+            thread_id TEXT NOT NULL,
+            checkpoint_ns TEXT NOT NULL DEFAULT '',
+            checkpoint_id TEXT NOT NULL,
+            parent_id TEXT,
+            type TEXT,
+            checkpoint BYTEA NOT NULL,
+            metadata_type TEXT,
+            metadata BYTEA,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+        );
+        CREATE TABLE IF NOT EXISTS graph_checkpoint_writes (
+            thread_id TEXT NOT NULL,
+            checkpoint_ns TEXT NOT NULL DEFAULT '',
+            checkpoint_id TEXT NOT NULL,
+            task_id TEXT NOT NULL,
+            idx INT NOT NULL,
+            channel TEXT NOT NULL,
+            type TEXT,
+            value BYTEA,
+            task_path TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+        );
+    """),
+    (5, "daily production rollup", """
+        CREATE TABLE IF NOT EXISTS production_daily (
+            day DATE NOT NULL,
+            machine_id TEXT NOT NULL,
+            rolls BIGINT NOT NULL DEFAULT 0,
+            entries INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (day, machine_id)
+        );
+
+        -- Statement-level: a batch insert touches each (day, machine) row once
+        CREATE OR REPLACE FUNCTION production_daily_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO production_daily AS d (day, machine_id, rolls, entries)
+                SELECT timestamp::date, COALESCE(machine_id, ''), -SUM(COALESCE(rolls_produced, 0)), -COUNT(*)
+                FROM old_rows GROUP BY 1, 2
+                ON CONFLICT (day, machine_id) DO UPDATE
+                    SET rolls = d.rolls + EXCLUDED.rolls, entries = d.entries + EXCLUDED.entries, updated_at = NOW();
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO production_daily AS d (day, machine_id, rolls, entries)
+                SELECT timestamp::date, COALESCE(machine_id, ''), SUM(COALESCE(rolls_produced, 0)), COUNT(*)
+                FROM new_rows GROUP BY 1, 2
+                ON CONFLICT (day, machine_id) DO UPDATE
+                    SET rolls = d.rolls + EXCLUDED.rolls, entries = d.entries + EXCLUDED.entries, updated_at = NOW();
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS production_daily_ins ON production_logs;
+        CREATE TRIGGER production_daily_ins AFTER INSERT ON production_logs
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION production_daily_apply();
+        DROP TRIGGER IF EXISTS production_daily_upd ON production_logs;
+        CREATE TRIGGER production_daily_upd AFTER UPDATE ON production_logs
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION production_daily_apply();
+        DROP TRIGGER IF EXISTS production_daily_del ON production_logs;
+        CREATE TRIGGER production_daily_del AFTER DELETE ON production_logs
+            REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION production_daily_apply();
+
+        -- Backfill existing history (the triggers only see new writes)
+        INSERT INTO production_daily (day, machine_id, rolls, entries)
+        SELECT timestamp::date, COALESCE(machine_id, ''), SUM(COALESCE(rolls_produced, 0)), COUNT(*)
+        FROM production_logs GROUP BY 1, 2
+        ON CONFLICT (day, machine_id) DO UPDATE SET rolls = EXCLUDED.rolls, entries = EXCLUDED.entries;
+    """),
+    (6, "change notifications for the live dashboard", """
+        -- Payload is the table name; Postgres folds duplicates within one transaction.
+        -- Production fires via production_daily, so rollup rebuilds refresh the dashboard too.
+        CREATE OR REPLACE FUNCTION notify_factory_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('factory_changes', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS production_daily_notify ON production_daily;
+        CREATE TRIGGER production_daily_notify AFTER INSERT OR UPDATE OR DELETE ON production_daily
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_factory_change();
+        DROP TRIGGER IF EXISTS inventory_notify ON inventory;
+        CREATE TRIGGER inventory_notify AFTER INSERT OR UPDATE OR DELETE ON inventory
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_factory_change();
+    """),
+    (7, "product catalog key with trigram index", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        ALTER TABLE inventory ADD COLUMN IF NOT EXISTS product_key TEXT;
+        -- Same rule as catalog.normalize_product()
+        UPDATE inventory SET product_key = btrim(regexp_replace(lower(product_name), '[^a-z0-9]+', ' ', 'g'));
+
+        -- Fold rows that only differed by case/spacing ("Glue" / "glue ") into the oldest one
+        WITH dupes AS (
+            SELECT id, product_key, MIN(id) OVER (PARTITION BY product_key) AS keep_id FROM inventory
+        ), moved AS (
+            SELECT d.keep_id, COALESCE(SUM(i.quantity), 0) AS qty
+            FROM dupes d JOIN inventory i ON i.id = d.id
+            WHERE d.id <> d.keep_id GROUP BY d.keep_id
+        )
+        UPDATE inventory SET quantity = COALESCE(quantity, 0) + moved.qty FROM moved WHERE inventory.id = moved.keep_id;
+        DELETE FROM inventory i USING inventory k
+        WHERE i.product_key = k.product_key AND i.id > k.id;
+
+        ALTER TABLE inventory ALTER COLUMN product_key SET NOT NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_product_key ON inventory (product_key);
+        CREATE INDEX IF NOT EXISTS idx_inventory_product_key_trgm ON inventory USING gin (product_key gin_trgm_ops);
+        DROP INDEX IF EXISTS idx_inventory_product_norm;
+    """),
+    (8, "append-only inventory ledger with snapshots", """
+        -- Write path: one row per stock change, never updated
+        CREATE TABLE IF NOT EXISTS inventory_movements (
+            id BIGSERIAL PRIMARY KEY,
+            product_key TEXT NOT NULL REFERENCES inventory (product_key),
+            quantity_change INT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_inventory_movements_product ON inventory_movements (product_key, id);
+
+        -- inventory.quantity is now the compacted balance of movements up to as_of_id
+        ALTER TABLE inventory ADD COLUMN IF NOT EXISTS as_of_id BIGINT NOT NULL DEFAULT 0;
+        ALTER TABLE inventory ADD COLUMN IF NOT EXISTS as_of_time TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+        -- Balance history, one row per product per compaction that changed it
+        CREATE TABLE IF NOT EXISTS inventory_snapshots (
+            product_key TEXT NOT NULL REFERENCES inventory (product_key),
+            as_of_id BIGINT NOT NULL,
+            as_of_time TIMESTAMPTZ NOT NULL,
+            quantity BIGINT NOT NULL,
+            PRIMARY KEY (product_key, as_of_id)
+        );
+        -- Opening balances (history before this migration is unknown)
+        INSERT INTO inventory_snapshots (product_key, as_of_id, as_of_time, quantity)
+        SELECT product_key, 0, NOW(), COALESCE(quantity, 0) FROM inventory
+        ON CONFLICT DO NOTHING;
+        UPDATE inventory SET quantity = 0 WHERE quantity IS NULL;
+
+        -- Live balance: compacted quantity + the short tail of newer movements
+        CREATE OR REPLACE VIEW inventory_stock AS
+        SELECT i.id, i.product_name, i.product_key, i.quantity + COALESCE(t.delta, 0) AS quantity
+        FROM inventory i
+        LEFT JOIN LATERAL (
+            SELECT SUM(m.quantity_change) AS delta FROM inventory_movements m
+            WHERE m.product_key = i.product_key AND m.id > i.as_of_id
+        ) t ON true;
+
+        -- Point-in-time balance, also callable from analyze_data:
+        --   SELECT product_name, stock_at(product_key, '2026-10-12') FROM inventory
+        CREATE OR REPLACE FUNCTION stock_at(key TEXT, at TIMESTAMPTZ) RETURNS BIGINT AS $$
+            WITH snap AS (
+                SELECT quantity, as_of_id FROM inventory_snapshots
+                WHERE product_key = key AND as_of_time <= at
+                ORDER BY as_of_id DESC LIMIT 1
+            )
+            SELECT COALESCE((SELECT quantity FROM snap), 0) + COALESCE((
+                SELECT SUM(quantity_change) FROM inventory_movements
+                WHERE product_key = key AND id > COALESCE((SELECT as_of_id FROM snap), 0) AND created_at <= at
+            ), 0)
+        $$ LANGUAGE sql STABLE;
+
+        -- Ledger writes refresh the dashboard's inventory view (see migration v6)
+        CREATE OR REPLACE FUNCTION notify_factory_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('factory_changes', COALESCE(TG_ARGV[0], TG_TABLE_NAME));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS inventory_movements_notify ON inventory_movements;
+        CREATE TRIGGER inventory_movements_notify AFTER INSERT ON inventory_movements
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_factory_change('inventory');
+    """),
+    (9, "request id on ai jobs for tracing", """
+        -- The webhook's request ID (Twilio MessageSid), so worker spans join up with it
+        ALTER TABLE ai_jobs ADD COLUMN IF NOT EXISTS request_id TEXT;
+    """),
+    (10, "runtime stats published by worker processes", """
+        -- Router / LLM scheduler / retriever counters live in worker.py; GET /stats sums these rows
+        CREATE TABLE IF NOT EXISTS worker_stats (
+            worker_id TEXT PRIMARY KEY,
+            stats JSONB NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """),
+]
+
+_migrated = False
+
+
+def _apply(conn) -> list:
+    applied = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY, description TEXT, applied_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+        cur.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cur.fetchall()}
+        for version, description, sql in MIGRATIONS:
+            if version in done:
+                continue
+            cur.execute(sql)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            applied.append(version)
+    return applied
+
+
+def migrate() -> list:
+    """Apply pending migrations in one transaction. Returns the versions applied."""
+    global _migrated
+    applied = db.get_pool().run(_apply)
+    _migrated = True
+    if applied:
+        print(f"🗄️ Applied migrations: {applied}", flush=True)
+    return applied
+
+
+def ensure_migrated():
+    """migrate() once per process; later calls are free."""
+    if not _migrated:
+        migrate()
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    print("✅ Schema up to date." if not applied else f"✅ Schema migrated to v{applied[-1]}.")
@@ -1,28 +1,31 @@
 
 import os
-import psycopg2
+import re
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
 from typing import Optional
+import asyncio
+
+from db import AsyncConnectionPool, get_async_pool
+from retriever import get_retriever, error_codes
+import factory_ops
+import tracing
+from llm_scheduler import ollama_slot
 
 # --- Configuration ---
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5435")
-DB_USER = os.getenv("POSTGRES_USER", "postgres")
-DB_PASS = os.getenv("POSTGRES_PASSWORD", "password")
-DB_NAME = os.getenv("POSTGRES_DB", "krafix_factory")
-DB_DSN = f"dbname={DB_NAME} user={DB_USER} password={DB_PASS} host={DB_HOST} port={DB_PORT}"
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 # PydanticAI uses OpenAI client -> Needs /v1 suffix for Ollama
 os.environ["OLLAMA_BASE_URL"] = f"{OLLAMA_HOST}/v1"
 
 # --- Dependencies ---
 class AgentDeps:
-    db_dsn: str = DB_DSN
     ollama_host: str = OLLAMA_HOST
 
+    @property
+    def db(self) -> AsyncConnectionPool:
+        """Shared pool; queries run in a worker thread so agent runs don't block the loop."""
+        return get_async_pool()
+
 # --- Agents ---
 
 # 1. Production Agent
@@ -30,31 +33,18 @@ production_agent = Agent(
     'ollama:llama3.2',
     deps_type=AgentDeps,
     retries=3,
-    system_prompt="You are a Production Logger. Your ONLY job is to log production data to the database using the provided tools. If successful, confirm the ID."
+    system_prompt="You are a Production Logger. Your ONLY job is to log production data to the database using the provided tools. For several machines in one message use log_production_batch once. If successful, confirm the IDs."
 )
 
 @production_agent.tool
 async def log_production(ctx: RunContext[AgentDeps], machine_id: str, rolls: int) -> str:
     """Log production output. Use when user says 'log', 'record', or 'save'."""
-    conn = psycopg2.connect(ctx.deps.db_dsn)
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS production_logs (
-                    id SERIAL PRIMARY KEY, machine_id TEXT, rolls_produced INT, timestamp TIMESTAMP DEFAULT NOW()
-                );
-            """)
-            cur.execute(
-                "INSERT INTO production_logs (machine_id, rolls_produced) VALUES (%s, %s) RETURNING id",
-                (machine_id, rolls)
-            )
-            new_id = cur.fetchone()[0]
-            conn.commit()
-            return f"✅ Success. Logged to Database. ID: {new_id}"
-    except Exception as e:
-        return f"❌ Error logging: {e}"
-    finally:
-        conn.close()
+    return await factory_ops.log_production(machine_id, rolls, pool=ctx.deps.db)
+
+@production_agent.tool
+async def log_production_batch(ctx: RunContext[AgentDeps], entries: list[factory_ops.ProductionEntry]) -> str:
+    """Log production for SEVERAL machines in one call (e.g. 'Machine A 50, B 30, C 20 rolls')."""
+    return await factory_ops.log_production_batch(entries, pool=ctx.deps.db)
 
 # 2. Inventory Agent
 inventory_agent = Agent(
@@ -67,29 +57,7 @@ inventory_agent = Agent(
 @inventory_agent.tool
 async def update_stock(ctx: RunContext[AgentDeps], product_name: str, quantity_change: int) -> str:
     """Update inventory. Positive int to ADD, Negative to REMOVE."""
-    conn = psycopg2.connect(ctx.deps.db_dsn)
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS inventory (
-                    id SERIAL PRIMARY KEY, product_name TEXT UNIQUE, quantity INT DEFAULT 0
-                );
-            """)
-            cur.execute("SELECT id FROM inventory WHERE product_name ILIKE %s", (f"%{product_name}%",))
-            if not cur.fetchone():
-                cur.execute("INSERT INTO inventory (product_name, quantity) VALUES (%s, 0)", (product_name,))
-            
-            cur.execute(
-                "UPDATE inventory SET quantity = quantity + %s WHERE product_name ILIKE %s RETURNING quantity",
-                (quantity_change, f"%{product_name}%")
-            )
-            new_qty = cur.fetchone()[0]
-            conn.commit()
-            return f"✅ Stock Updated. {product_name}: {new_qty}"
-    except Exception as e:
-        return f"❌ Error updating stock: {e}"
-    finally:
-        conn.close()
+    return await factory_ops.update_stock(product_name, quantity_change, pool=ctx.deps.db)
 
 # 3. Maintenance Agent (RAG)
 maintenance_agent = Agent(
@@ -99,14 +67,63 @@ maintenance_agent = Agent(
     system_prompt="You are a Maintenance Expert. Consult the manual to solve errors."
 )
 
+# "still not working after that", "same error again": the answer depends on earlier turns
+_FOLLOW_UP = re.compile(r"\b(it|that|those|still|again|same|previous|earlier|above|tried)\b", re.IGNORECASE)
+
+def _cacheable(question: str) -> bool:
+    """Answers are shared across senders only for a current message that names an error code and
+    stands on its own; the conversation context the agent also sees doesn't change what was asked."""
+    return bool(question) and bool(error_codes(question)) and not _FOLLOW_UP.search(question)
+
+async def _lookup_answer(retriever, question: str):
+    """(cached answer or None, store version seen); version is None if the cache is unavailable."""
+    try:
+        cached = await asyncio.to_thread(retriever.cached_answer, question)
+        return cached, retriever.version
+    except Exception as e:
+        print(f"⚠️ Answer cache unavailable: {e}", flush=True)
+        return None, None
+
+async def answer_maintenance(user_msg: str, question: str, deps: AgentDeps) -> str:
+    """maintenance_agent behind the semantic answer cache: repeat faults skip both LLM calls."""
+    retriever = get_retriever()
+    cacheable = _cacheable(question)
+    cached = version = None
+    # Exact repeat: the question's embedding is cached, so the lookup is in-memory and
+    # doesn't queue behind the Ollama slot
+    warm = cacheable and retriever.has_embedding(question)
+    if warm:
+        cached, version = await _lookup_answer(retriever, question)
+    if cached is None:
+        async with ollama_slot():
+            if cacheable and not warm:  # the question embedding is an Ollama call
+                cached, version = await _lookup_answer(retriever, question)
+            if cached is None:
+                with tracing.span("agent", "maintenance_agent"):
+                    result = await maintenance_agent.run(user_msg, deps=deps)
+    if cached is not None:
+        with tracing.span("agent", "maintenance_cache"):
+            return cached
+    # Errors and "nothing found" are not worth repeating to the next shift
+    if version is not None and not result.output.startswith("❌") and "No relevant info" not in result.output:
+        try:
+            await asyncio.to_thread(retriever.remember_answer, question, result.output, version)
+        except Exception:
+            pass
+    return result.output
+
 @maintenance_agent.tool
 async def consult_manual(ctx: RunContext[AgentDeps], query: str) -> str:
     """Use this to find solutions for error codes (e.g. 'Error 502') or look up procedures."""
     try:
-        embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url=ctx.deps.ollama_host)
-        # Assuming RAG db exists
-        db = Chroma(persist_directory="./chroma_db", embedding_function=embeddings)
-        results = db.similarity_search(query, k=3)
+        # "Error 502" -> that code's passage straight from the keyword index (no embedding)
+        passages = await asyncio.to_thread(get_retriever().code_passages, query)
+        if passages:
+            return "\n\n".join(passages)
+        # Warm process-wide retriever; hybrid keyword+vector search runs in a thread to keep the loop free
+        async with ollama_slot():  # embedding call counts against the Ollama limit
+            with tracing.span("tool", "consult_manual"):
+                results = await asyncio.to_thread(get_retriever().search, query, 3)
         if not results:
             return "No relevant info found in manuals."
         return "\n\n".join([r.page_content for r in results])
@@ -0,0 +1,215 @@
+import os
+import re
+import time
+import threading
+
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings
+
+from langchain_core.documents import Document
+
+from cache import TTLCache, SemanticCache
+from keyword_index import KeywordIndex, chunk_id, named_codes
+
+# --- Configuration ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db")
+EMBED_MODEL = "nomic-embed-text"
+# ingest.py bumps this file after every write so long-lived processes know to reload
+VERSION_FILE = ".ingest_version"
+# Operators repeat the same handful of questions - cache embeddings and top-k chunks
+MANUAL_CACHE_SIZE = int(os.getenv("MANUAL_CACHE_SIZE", "256"))
+MANUAL_CACHE_TTL = float(os.getenv("MANUAL_CACHE_TTL", "3600"))
+# Finished maintenance answers, reused for near-identical questions until the next ingest
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+
+# Hybrid ranking: weight of the (normalized) vector score vs BM25, and candidates pulled from each side
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "10"))
+
+_CODES = re.compile(r"\d+")
+
+
+def normalize_query(query: str) -> str:
+    """Cache key: case, punctuation and spacing don't change what the operator asked."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def error_codes(query: str) -> tuple:
+    """Numbers in the question. "Error 502" and "Error 503" embed almost identically, so cached
+    answers only match questions naming the same codes."""
+    return tuple(sorted(set(_CODES.findall(query))))
+
+
+def store_version(persist_dir: str = CHROMA_DIR) -> float:
+    """Cheap change detector: newest mtime of the ingest marker and the Chroma sqlite file."""
+    version = 0.0
+    for name in (VERSION_FILE, "chroma.sqlite3"):
+        try:
+            version = max(version, os.stat(os.path.join(persist_dir, name)).st_mtime)
+        except OSError:
+            pass
+    return version
+
+
+def mark_ingested(persist_dir: str = CHROMA_DIR):
+    """Called by ingest.py once the collection has been rewritten."""
+    os.makedirs(persist_dir, exist_ok=True)
+    with open(os.path.join(persist_dir, VERSION_FILE), "w") as f:
+        f.write(str(time.time()))
+
+
+class ManualRetriever:
+    """Process-wide handle on the manuals collection: one embeddings client, one open Chroma store.
+
+    Reopens the store when ingest.py rewrites it (detected via store_version()) and
+    answers repeat questions from an embedding cache and a top-k result cache. The semantic
+    answer cache holds whole maintenance replies for questions close to one already answered.
+    """
+
+    def __init__(self, persist_dir: str = CHROMA_DIR, ollama_host: str = OLLAMA_HOST):
+        self.persist_dir = persist_dir
+        self.ollama_host = ollama_host
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self._db = None
+        self._keywords = None
+        self._version = None
+        self.reloads = 0
+        self.embedding_cache = TTLCache(MANUAL_CACHE_SIZE, MANUAL_CACHE_TTL)
+        self.result_cache = TTLCache(MANUAL_CACHE_SIZE, MANUAL_CACHE_TTL)
+        self.answer_cache = SemanticCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+
+    def _open(self, version: float):
+        if self._embeddings is None:
+            # HTTP client is kept across reloads - only the collection changes on ingest
+            self._embeddings = OllamaEmbeddings(model=EMBED_MODEL, base_url=self.ollama_host)
+        if self._db is not None:
+            # Chroma caches the on-disk system per path; drop it so the new HNSW index is read
+            try:
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+            except Exception:
+                pass
+            self.reloads += 1
+            # Chunks changed; query embeddings don't (same model), so only results and answers are dropped
+            self.result_cache.clear()
+            self.answer_cache.clear()
+            print(f"🔁 Manuals changed on disk, reloading {self.persist_dir}", flush=True)
+        self._db = Chroma(persist_directory=self.persist_dir, embedding_function=self._embeddings)
+        self._keywords = KeywordIndex.load(self.persist_dir)  # None until ingest.py has built one
+        self._version = version
+
+    def store(self) -> Chroma:
+        """The open collection, reopened first if the store changed since the last call."""
+        version = store_version(self.persist_dir)
+        if self._db is None or version != self._version:
+            with self._lock:
+                if self._db is None or version != self._version:
+                    self._open(version)
+        return self._db
+
+    def embed(self, query: str) -> list:
+        """Query embedding, served from cache when the normalized query was seen before."""
+        key = normalize_query(query)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            if self._embeddings is None:
+                self.store()
+            vector = self._embeddings.embed_query(key)
+            self.embedding_cache.set(key, vector)
+        return vector
+
+    def code_passages(self, query: str):
+        """Manual passages for the error codes the query names, or None unless every code is indexed.
+
+        A dict lookup: no embedding call, and never another code's chunk."""
+        codes = named_codes(query)
+        self.store()
+        if not codes or self._keywords is None:
+            return None
+        passages = [self._keywords.passages_for(code) for code in codes]
+        if not all(passages):
+            return None
+        return [p for found in passages for p in found]
+
+    def search(self, query: str, k: int = 3) -> list:
+        store = self.store()  # checks for a re-ingest first, which invalidates result_cache
+        key = (normalize_query(query), k)
+        results = self.result_cache.get(key)
+        if results is None:
+            fetch_k = max(k, HYBRID_FETCH_K) if self._keywords is not None else k
+            scored = store.similarity_search_by_vector_with_relevance_scores(self.embed(query), k=fetch_k)
+            results = self._hybrid(query, scored, k)
+            self.result_cache.set(key, results)
+        return results
+
+    def _hybrid(self, query: str, scored: list, k: int) -> list:
+        """Merge vector hits [(doc, distance)] with BM25 hits: alpha * vector + (1 - alpha) * keyword,
+        each divided by its best score among the candidates."""
+        if self._keywords is None:
+            return [doc for doc, _ in scored[:k]]
+        docs, vector, keyword = {}, {}, dict(self._keywords.search(query, max(k, HYBRID_FETCH_K)))
+        for doc, distance in scored:
+            cid = doc.id or chunk_id(doc.metadata.get("source", ""), doc.page_content)
+            docs[cid] = doc
+            vector[cid] = 1 / (1 + distance)
+        for cid in keyword:
+            if cid not in docs and cid in self._keywords.docs:
+                entry = self._keywords.docs[cid]
+                docs[cid] = Document(page_content=entry["text"], metadata=entry["meta"], id=cid)
+
+        def normalized(scores: dict) -> dict:
+            high = max(scores.values(), default=0.0)
+            return {cid: v / high for cid, v in scores.items()} if high > 0 else {}
+
+        vector, keyword = normalized(vector), normalized(keyword)
+        ranked = sorted(docs, key=lambda cid: -(HYBRID_ALPHA * vector.get(cid, 0.0)
+                                                + (1 - HYBRID_ALPHA) * keyword.get(cid, 0.0)))
+        return [docs[cid] for cid in ranked[:k]]
+
+    def has_embedding(self, question: str) -> bool:
+        """True when embed(question) would be served from cache (no Ollama call)."""
+        return normalize_query(question) in self.embedding_cache
+
+    def cached_answer(self, question: str):
+        """Stored answer to a question within the similarity threshold, else None.
+
+        The embedding is cached, so a miss followed by search() pays for one Ollama call."""
+        self.store()  # a re-ingest clears the answer cache before we look
+        hit = self.answer_cache.lookup(self.embed(question), tag=error_codes(question))
+        return hit[0] if hit else None
+
+    @property
+    def version(self) -> float:
+        return self._version
+
+    def remember_answer(self, question: str, answer: str, version: float = None):
+        """Cache an answer; pass the `version` seen before answering so a mid-answer re-ingest drops it."""
+        if version is not None and store_version(self.persist_dir) != version:
+            return
+        self.answer_cache.add(self.embed(question), answer, tag=error_codes(question))
+
+    def stats(self) -> dict:
+        return {
+            "reloads": self.reloads,
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "answer_cache": self.answer_cache.stats(),
+        }
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> ManualRetriever:
+    """Lazily built singleton shared by server.py and pydantic_agent.py."""
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = ManualRetriever()
+    return _retriever
@@ -0,0 +1,74 @@
+"""Reads over the production_daily rollup (kept current by triggers, see migration v5).
+
+The dashboard never scans production_logs: every query here touches at most
+(days x machines) rows. rebuild_production_rollup() recomputes a window from the raw
+logs, for a nightly reconciliation job or after bulk edits with triggers disabled:
+    docker exec krafix_app python rollups.py --days 7
+"""
+import sys
+import argparse
+
+import db
+
+
+def production_today(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(SUM(rolls), 0) FROM production_daily WHERE day = CURRENT_DATE")
+        return int(cur.fetchone()[0])
+
+
+def daily_production(conn, days: int = None) -> list:
+    """[(day, rolls)] oldest first; all history when days is None."""
+    with conn.cursor() as cur:
+        if days is None:
+            cur.execute("SELECT day, SUM(rolls) FROM production_daily GROUP BY day ORDER BY day")
+        else:
+            cur.execute(
+                "SELECT day, SUM(rolls) FROM production_daily WHERE day > CURRENT_DATE - %s GROUP BY day ORDER BY day",
+                (days,)
+            )
+        return cur.fetchall()
+
+
+def machine_production(conn, day=None) -> list:
+    """[(machine_id, rolls)] for one day (today by default), biggest first."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT machine_id, rolls FROM production_daily WHERE day = COALESCE(%s, CURRENT_DATE) ORDER BY rolls DESC",
+            (day,)
+        )
+        return cur.fetchall()
+
+
+def inventory_levels(conn) -> list:
+    """[(product_name, quantity)] live balances (compacted quantity + ledger tail, see ledger.py)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT product_name, quantity FROM inventory_stock ORDER BY product_name")
+        return cur.fetchall()
+
+
+def rebuild_production_rollup(conn, days: int = None) -> int:
+    """Recompute the rollup from production_logs for the last `days` days (all when None)."""
+    # Range predicate on the raw column so idx_production_logs_timestamp is usable
+    since = "WHERE timestamp >= CURRENT_DATE - %(days)s" if days is not None else ""
+    with conn.cursor() as cur:
+        cur.execute("LOCK TABLE production_daily IN EXCLUSIVE MODE")
+        cur.execute(
+            "DELETE FROM production_daily" + (" WHERE day >= CURRENT_DATE - %(days)s" if days is not None else ""),
+            {"days": days}
+        )
+        cur.execute(f"""
+            INSERT INTO production_daily (day, machine_id, rolls, entries)
+            SELECT timestamp::date, COALESCE(machine_id, ''), SUM(COALESCE(rolls_produced, 0)), COUNT(*)
+            FROM production_logs {since}
+            GROUP BY 1, 2
+        """, {"days": days})
+        return cur.rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the production_daily rollup")
+    parser.add_argument("--days", type=int, default=None, help="only the last N days (default: all history)")
+    args = parser.parse_args(sys.argv[1:])
+    rows = db.get_pool().run(rebuild_production_rollup, args.days)
+    print(f"✅ Rebuilt production_daily: {rows} (day, machine) rows.")
@@ -0,0 +1,87 @@
+import re
+import threading
+
+# --- Phonetic correction (Whisper mishears on the shop floor) ---
+# Shared with the supervisor prompt in agent_graph.py so both paths agree.
+PHONETIC_CORRECTIONS = {
+    "law": "log",
+    "rules": "rolls",
+    "roles": "rolls",
+    "doles": "rolls",
+    "luxion": "production",
+}
+_PHONETIC_RE = re.compile(r"\b(" + "|".join(PHONETIC_CORRECTIONS) + r")\b")
+
+
+def phonetic_prompt() -> str:
+    """Render the correction table the way the supervisor prompt lists it."""
+    targets = {}
+    for heard, meant in PHONETIC_CORRECTIONS.items():
+        targets.setdefault(meant, []).append(heard)
+    return "\n".join(
+        "- " + " / ".join(f'"{h.title()}"' for h in heard) + f' -> "{meant.title()}"'
+        for meant, heard in targets.items()
+    )
+
+
+def correct(text: str) -> str:
+    """Lower-case and apply the phonetic table ("Law 50 rules" -> "log 50 rolls")."""
+    return _PHONETIC_RE.sub(lambda m: PHONETIC_CORRECTIONS[m.group(1)], text.lower())
+
+
+# --- Compiled intent rules (checked on corrected text) ---
+_NUMBER = re.compile(r"\b\d+\b")
+_QUESTION = re.compile(r"^\s*(how|what|when|which|who|why|show|list|compare)\b|\?\s*$")
+_PRODUCTION = re.compile(r"\brolls?\b")
+_PRODUCTION_VERB = re.compile(r"\b(log|logged|record|recorded|save|saved|produced|made|production|machine)\b")
+_INVENTORY = re.compile(
+    r"\b(add|added|remove|removed|received|receive|used|consumed|issued?|stock|inventory|units?|pcs|pieces|boxes|bags)\b"
+)
+_MAINTENANCE = re.compile(
+    r"\berror\s*(code\s*)?\d+\b|\b(jam|jammed|overheat\w*|broken|leak\w*|smok\w*|fault\w*|alarm|"
+    r"not working|won'?t start|troubleshoot\w*|repair\w*|fix|manual)\b"
+)
+
+ROUTES = {
+    "production": "production_agent",
+    "inventory": "inventory_agent",
+    "maintenance": "maintenance_agent",
+}
+
+
+def classify(text: str):
+    """Return 'production' / 'inventory' / 'maintenance' when exactly one rule fires, else None."""
+    t = correct(text)
+    hits = set()
+    if _MAINTENANCE.search(t):
+        hits.add("maintenance")
+    # Writes need a quantity; questions about numbers belong to the LLM (analytics / chat)
+    if _NUMBER.search(t) and not _QUESTION.search(t):
+        if _PRODUCTION.search(t) and _PRODUCTION_VERB.search(t):
+            hits.add("production")
+        if _INVENTORY.search(t) and not _PRODUCTION.search(t):
+            hits.add("inventory")
+    return hits.pop() if len(hits) == 1 else None
+
+
+# --- Stats ---
+_stats = {"fast_path": 0, "llm": 0, "production": 0, "inventory": 0, "maintenance": 0}
+_stats_lock = threading.Lock()
+
+
+def record(route):
+    """Count one routing decision: an intent name for the fast path, None for an LLM call."""
+    with _stats_lock:
+        if route:
+            _stats["fast_path"] += 1
+            _stats[route] += 1
+        else:
+            _stats["llm"] += 1
+
+
+def router_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["fast_path"] + stats["llm"]
+    stats["llm_skip_rate"] = round(stats["fast_path"] / total, 3) if total else 0.0
+    return stats
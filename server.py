@@ -1,110 +1,106 @@
+"""MCP tool server ("Krafix-Hybrid-Brain").
+
+Tools are async and share pooled resources (db.AsyncConnectionPool, the warm manual
+retriever), each behind its own concurrency cap (tool_limits.py).
+
+    python server.py                                   # stdio: one client process
+    MCP_TRANSPORT=streamable-http python server.py     # http://0.0.0.0:8765/mcp, many clients
+In HTTP mode GET /stats returns per-tool latency/wait percentiles and GET /metrics the
+Prometheus stage histograms.
+"""
 import os
-import psycopg2
+import asyncio
 from mcp.server.fastmcp import FastMCP
-from psycopg2.extras import RealDictCursor
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from retriever import get_retriever
 
-# Get DB Host from Docker Env
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5435")
-DB_USER = os.getenv("POSTGRES_USER", "postgres")
-DB_PASS = os.getenv("POSTGRES_PASSWORD", "password")
-DB_NAME = os.getenv("POSTGRES_DB", "krafix_factory")
+# DB config + shared connection pool (DB Host comes from Docker Env)
+import db
+import migrations
+import factory_ops
+import analytics
+import tracing
+from llm_scheduler import ollama_slot, share_slots
+from tool_limits import ToolLimiter, parse_limits
 
-DB_DSN = f"dbname={DB_NAME} user={DB_USER} password={DB_PASS} host={DB_HOST} port={DB_PORT}"
+# --- Configuration ---
+# "stdio" (default, spawned by one client), "streamable-http" or "sse" (shared network server)
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.getenv("MCP_PORT", "8765"))
+# Calls in flight per tool; the rest wait. Writes are short, analytics and RAG are not.
+MCP_TOOL_CONCURRENCY = parse_limits(os.getenv(
+    "MCP_TOOL_CONCURRENCY",
+    "log_production=8,log_production_batch=4,update_stock=8,analyze_data=2,consult_manual=2",
+))
 
-mcp = FastMCP("Krafix-Hybrid-Brain")
+mcp = FastMCP("Krafix-Hybrid-Brain", host=MCP_HOST, port=MCP_PORT, stateless_http=True)
+limits = ToolLimiter(MCP_TOOL_CONCURRENCY, default=4)
 
 @mcp.tool()
-def log_production(machine_id: str, rolls: int) -> str:
+async def log_production(machine_id: str, rolls: int) -> str:
     """Log production output. Use only when user says 'log', 'record', or 'save'."""
-    conn = psycopg2.connect(DB_DSN)
-    try:
-        with conn.cursor() as cur:
-            # Create table if not exists (Auto-setup)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS production_logs (
-                    id SERIAL PRIMARY KEY, machine_id TEXT, rolls_produced INT, timestamp TIMESTAMP DEFAULT NOW()
-                );
-            """)
-            cur.execute(
-                "INSERT INTO production_logs (machine_id, rolls_produced) VALUES (%s, %s) RETURNING id",
-                (machine_id, rolls)
-            )
-            new_id = cur.fetchone()[0]
-            conn.commit()
-            return f"✅ Success. Logged to Database. ID: {new_id}"
-    except Exception as e:
-        return f"❌ Error logging: {e}"
-    finally:
-        conn.close()
+    return await limits.call("log_production", factory_ops.log_production, machine_id, rolls)
 
 @mcp.tool()
-def update_stock(product_name: str, quantity_change: int) -> str:
-    """Update inventory. Positive int to ADD, Negative to REMOVE."""
-    conn = psycopg2.connect(DB_DSN)
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS inventory (
-                    id SERIAL PRIMARY KEY, product_name TEXT UNIQUE, quantity INT DEFAULT 0
-                );
-            """)
-            # Check exist
-            cur.execute("SELECT id FROM inventory WHERE product_name ILIKE %s", (f"%{product_name}%",))
-            if not cur.fetchone():
-                # Auto-create item if missing
-                cur.execute("INSERT INTO inventory (product_name, quantity) VALUES (%s, 0)", (product_name,))
-            
-            cur.execute(
-                "UPDATE inventory SET quantity = quantity + %s WHERE product_name ILIKE %s RETURNING quantity",
-                (quantity_change, f"%{product_name}%")
-            )
-            new_qty = cur.fetchone()[0]
-            conn.commit()
-            return f"✅ Stock Updated. {product_name}: {new_qty}"
-    except Exception as e:
-        return f"❌ Error updating stock: {e}"
-    finally:
-        conn.close()
+async def log_production_batch(entries: list[factory_ops.ProductionEntry]) -> str:
+    """Log production for SEVERAL machines at once (e.g. shift-end 'A 50, B 30, C 20 rolls'). One transaction."""
+    return await limits.call("log_production_batch", factory_ops.log_production_batch, entries)
 
 @mcp.tool()
-def analyze_data(question_as_sql_query: str) -> str:
-    """Execute a SQL query on 'production_logs' or 'inventory' tables ONLY. Do NOT use for troubleshooting or manuals."""
-    forbidden = ["insert", "update", "delete", "drop", "truncate", "alter"]
-    if any(word in question_as_sql_query.lower() for word in forbidden):
-        return "❌ SAFETY ALERT: Read-only tool."
+async def update_stock(product_name: str, quantity_change: int) -> str:
+    """Update inventory. Positive int to ADD, Negative to REMOVE."""
+    return await limits.call("update_stock", factory_ops.update_stock, product_name, quantity_change)
 
-    conn = psycopg2.connect(DB_DSN)
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(question_as_sql_query)
-            results = cur.fetchall()
-            return str(results) if results else "0 results found."
-    except Exception as e:
-        return f"❌ SQL Error: {e}"
-    finally:
-        conn.close()
+async def _analyze(sql: str) -> str:
+    # READ ONLY transaction, statement_timeout, row cap and a short result cache (see analytics.py)
+    with tracing.span("tool", "analyze_data"):
+        return await asyncio.to_thread(analytics.analyze, sql)
 
 @mcp.tool()
-def consult_manual(query: str) -> str:
-    """Use this to find solutions for error codes (e.g. 'Error 502'), fix machines, or look up procedures in the manual."""
+async def analyze_data(question_as_sql_query: str) -> str:
+    """Execute a read-only SQL query on production data ONLY. Do NOT use for troubleshooting or manuals.
+    Tables: production_logs(machine_id, rolls_produced, timestamp), production_daily(day, machine_id, rolls),
+    inventory_stock(product_name, product_key, quantity) for CURRENT stock,
+    inventory_movements(product_key, quantity_change, created_at) for stock history.
+    Stock on a past date: SELECT product_name, stock_at(product_key, '2026-10-12') FROM inventory."""
+    return await limits.call("analyze_data", _analyze, question_as_sql_query)
+
+async def _consult_manual(query: str) -> str:
     try:
-        OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-        embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url=OLLAMA_HOST)
-        
-        # Connect to existing DB
-        db = Chroma(persist_directory="./chroma_db", embedding_function=embeddings)
-        
-        # Search
-        results = db.similarity_search(query, k=3)
+        # Exact error codes are a keyword-index lookup; the rest is hybrid keyword+vector search
+        passages = await asyncio.to_thread(get_retriever().code_passages, query)
+        if passages:
+            return "\n\n".join(passages)
+        # Shared warm collection + embeddings client (reloads itself after ingest.py)
+        async with ollama_slot():
+            with tracing.span("tool", "consult_manual"):
+                results = await asyncio.to_thread(get_retriever().search, query, 3)
         if not results:
             return "No relevant info found in manuals."
-        
+
         return "\n\n".join([r.page_content for r in results])
     except Exception as e:
         return f"❌ Error searching manual: {e}"
 
+@mcp.tool()
+async def consult_manual(query: str) -> str:
+    """Use this to find solutions for error codes (e.g. 'Error 502'), fix machines, or look up procedures in the manual."""
+    return await limits.call("consult_manual", _consult_manual, query)
+
+@mcp.custom_route("/stats", methods=["GET"])
+async def stats(request: Request) -> JSONResponse:
+    return JSONResponse({"tools": limits.stats(), "db_pool": db.pool_stats()})
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(tracing.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    # Schema is owned by migrations.py - tools above only run DML
+    migrations.migrate()
+    share_slots()  # consult_manual's embedding calls count against the workers' Ollama budget
+    if MCP_TRANSPORT != "stdio":
+        print(f"🛠️ MCP tools on {MCP_TRANSPORT} at {MCP_HOST}:{MCP_PORT}", flush=True)
+    mcp.run(transport=MCP_TRANSPORT)
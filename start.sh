@@ -1,22 +1,22 @@
 #!/bin/bash
-# Pre-warm the AI Model (Retry loop to handle DNS startup)
-python -c "
-import time, requests
-for i in range(10):
-    try:
-        # 1. Pull the faster model first
-        requests.post('http://ollama:11434/api/pull', json={'name': 'llama3.2'})
-        print('⬇️ Downloading Llama 3.2...')
-        
-        # 2. Pre-warm (Load into RAM)
-        requests.post('http://ollama:11434/api/chat', json={'model': 'llama3.2'})
-        print('✅ Pre-warm request sent')
-        break
-    except Exception as e:
-        print(f'Waiting for Ollama ({e})...')
-        time.sleep(3)
-" &
+# Container entrypoint: WhatsApp server, AI worker(s), dashboard and (optionally) the MCP server.
+# Ollama models and Whisper are pulled/warmed by whatsapp_server itself (startup.py);
+# GET :8000/ready reports progress and turns 200 once they are loaded.
 
-python whatsapp_server.py & 
-streamlit run dashboard.py --server.port 8501 --server.address 0.0.0.0 
+python whatsapp_server.py &
+python worker.py --processes ${WORKER_PROCESSES:-1} &
+streamlit run dashboard.py --server.port 8501 --server.address 0.0.0.0 &
+# Shared MCP tool server for network clients; stdio clients spawn their own server.py
+if [ "${MCP_TRANSPORT:-stdio}" != "stdio" ]; then
+    python server.py &
+fi
+
+# docker stop: forward SIGTERM so the worker drains in-flight jobs
+trap 'kill -TERM $(jobs -p) 2>/dev/null' TERM INT
+
+# If any service dies, stop the others and exit so the restart policy brings all of them back
+wait -n
+status=$?
+kill -TERM $(jobs -p) 2>/dev/null
 wait
+exit $status
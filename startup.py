@@ -0,0 +1,131 @@
+"""Startup phase for whatsapp_server: deferred heavy imports, concurrent warmup, readiness.
+
+uvicorn accepts requests as soon as FastAPI is imported; everything heavy happens in
+warmup(), concurrently, while /ready reports progress per component:
+  - schema:    migrations
+  - graph:     LangGraph / PydanticAI / Chroma import (worker.py, only for JOB_QUEUE=memory)
+  - whisper:   model loaded in the transcriber processes
+  - llm:       llama3.2 loaded in Ollama (pulled first if missing)
+  - embeddings: nomic-embed-text loaded in Ollama
+Each step logs its duration, so slow starts show up in the container log.
+"""
+import os
+import time
+import asyncio
+import importlib
+
+import httpx
+
+# --- Configuration ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+LLM_MODEL = "llama3.2"
+EMBED_MODEL = "nomic-embed-text"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # keep warmed models resident between messages
+WARMUP_RETRIES = int(os.getenv("WARMUP_RETRIES", "20"))  # Ollama/DB may still be starting
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "3"))
+PULL_TIMEOUT = float(os.getenv("OLLAMA_PULL_TIMEOUT", "1800"))
+
+
+def log_timing(what: str, seconds: float):
+    print(f"⏱️ {what}: {seconds:.2f}s", flush=True)
+
+
+async def load_module(name: str):
+    """Import a heavy module off the event loop (the import lock makes repeat calls cheap)."""
+    start = time.perf_counter()
+    module = await asyncio.to_thread(importlib.import_module, name)
+    elapsed = time.perf_counter() - start
+    if elapsed > 0.05:
+        log_timing(f"import {name}", elapsed)
+    return module
+
+
+class Readiness:
+    """Per-component startup status served by /ready."""
+
+    def __init__(self, components, required=None):
+        self.components = {name: {"status": "pending"} for name in components}
+        # Components that must be up before we call ourselves ready; the rest only degrade
+        self.required = set(required if required is not None else components)
+        self.started_at = time.monotonic()
+
+    def skip(self, name: str, reason: str):
+        self.components[name] = {"status": "skipped", "reason": reason}
+        self.required.discard(name)
+
+    async def run(self, name: str, step, retries: int = 0):
+        """Await step() with retries; record warming/ready/failed and the time it took."""
+        self.components[name] = {"status": "warming"}
+        start = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                await step()
+                break
+            except Exception as e:
+                if attempt == retries:
+                    seconds = round(time.perf_counter() - start, 2)
+                    self.components[name] = {"status": "failed", "seconds": seconds, "error": str(e)[:200]}
+                    print(f"⚠️ Warmup {name} failed after {seconds}s: {e}", flush=True)
+                    return
+                self.components[name] = {"status": "warming", "attempt": attempt + 1, "error": str(e)[:200]}
+                await asyncio.sleep(WARMUP_RETRY_DELAY)
+        seconds = round(time.perf_counter() - start, 2)
+        self.components[name] = {"status": "ready", "seconds": seconds}
+        log_timing(f"warmup {name}", seconds)
+
+    @property
+    def ready(self) -> bool:
+        return all(self.components[name]["status"] == "ready" for name in self.required)
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+            "components": self.components,
+        }
+
+
+# --- Ollama ---
+async def _ollama_post(client: httpx.AsyncClient, path: str, payload: dict, timeout: float = 300) -> dict:
+    resp = await client.post(f"{OLLAMA_HOST}{path}", json=payload, timeout=timeout)
+    if resp.status_code == 404 and "not found" in resp.text:
+        raise LookupError(resp.text)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def warm_ollama_model(client: httpx.AsyncClient, model: str, embedding: bool = False):
+    """Load `model` into Ollama's memory (pulling it once if missing) and keep it resident."""
+    path, payload = ("/api/embed", {"model": model, "input": "warmup"}) if embedding else \
+        ("/api/generate", {"model": model, "prompt": "", "stream": False})
+    payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    try:
+        await _ollama_post(client, path, payload)
+    except LookupError:
+        print(f"⬇️ Pulling {model}...", flush=True)
+        start = time.perf_counter()
+        await _ollama_post(client, "/api/pull", {"model": model, "stream": False}, timeout=PULL_TIMEOUT)
+        log_timing(f"pull {model}", time.perf_counter() - start)
+        await _ollama_post(client, path, payload)
+
+
+async def warmup(readiness: Readiness, job_queue_mode: str, transcriber):
+    """Run every warmup step concurrently; failures are recorded, never raised."""
+    import migrations
+
+    if job_queue_mode != "memory":
+        readiness.skip("graph", "runs in worker.py (JOB_QUEUE=postgres)")
+
+    async with httpx.AsyncClient() as client:
+        steps = [
+            readiness.run("schema", lambda: asyncio.to_thread(migrations.migrate), WARMUP_RETRIES),
+            readiness.run("whisper", transcriber.warm),
+            readiness.run("llm", lambda: warm_ollama_model(client, LLM_MODEL), WARMUP_RETRIES),
+            readiness.run("embeddings", lambda: warm_ollama_model(client, EMBED_MODEL, embedding=True), WARMUP_RETRIES),
+        ]
+        if job_queue_mode == "memory":
+            steps.append(readiness.run("graph", lambda: load_module("worker")))
+        await asyncio.gather(*steps)
+
+    state = "ready" if readiness.ready else "degraded"
+    log_timing(f"startup ({state})", time.monotonic() - readiness.started_at)
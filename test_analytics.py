@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import MagicMock
+
+import analytics
+
+
+def make_conn(rows, description=(("machine_id",), ("rolls_produced",)), moved=0):
+    """Plain cursors for SET/MOVE, a separate mock for the named (server-side) cursor."""
+    conn = MagicMock()
+    plain = MagicMock()
+    plain.rowcount = moved
+    named = MagicMock()
+    named.fetchmany.return_value = rows
+    named.description = description
+
+    def cursor(name=None):
+        ctx = MagicMock()
+        ctx.__enter__.return_value = named if name else plain
+        return ctx
+    conn.cursor.side_effect = cursor
+    return conn, plain, named
+
+
+class TestAnalyzeData(unittest.TestCase):
+
+    def setUp(self):
+        analytics.result_cache.clear()
+
+    def test_read_only_transaction_and_row_cap(self):
+        rows = [("A", i) for i in range(4)]
+        conn, plain, named = make_conn(rows, moved=96)
+
+        columns, got, total = analytics.run_readonly_query(conn, "SELECT * FROM production_logs", max_rows=3, timeout_ms=500)
+
+        executed = [c[0][0] for c in plain.execute.call_args_list]
+        self.assertEqual(executed[0], "SET TRANSACTION READ ONLY")
+        self.assertIn("statement_timeout", executed[1])
+        self.assertEqual(executed[2:], ["SAVEPOINT count_rest", 'MOVE FORWARD ALL IN "analyze_data"',
+                                        "RELEASE SAVEPOINT count_rest"])
+        named.fetchmany.assert_called_once_with(4)  # never more than cap + 1 rows leave the server
+        self.assertEqual(len(got), 3)
+        self.assertEqual(total, 100)
+        self.assertEqual(columns, ["machine_id", "rolls_produced"])
+
+    def test_count_timeout_keeps_fetched_rows(self):
+        """A MOVE that hits statement_timeout rolls back to its savepoint so the cursor still closes"""
+        rows = [("A", i) for i in range(4)]
+        conn, plain, named = make_conn(rows)
+
+        def execute(sql, *args):
+            if sql.startswith("MOVE"):
+                raise analytics.psycopg2.errors.QueryCanceled("canceling statement due to statement timeout")
+        plain.execute.side_effect = execute
+
+        columns, got, total = analytics.run_readonly_query(conn, "SELECT * FROM production_logs", max_rows=3)
+
+        executed = [c[0][0] for c in plain.execute.call_args_list]
+        self.assertEqual(executed[-1], "ROLLBACK TO SAVEPOINT count_rest")
+        self.assertEqual((len(got), total), (3, None))
+        self.assertTrue(analytics.render_table(columns, got, total).startswith("More than 3 rows"))
+
+    def test_compact_rendering(self):
+        text = analytics.render_table(["machine_id", "note"], [("A", "x" * 100), ("B", None)], 120)
+        lines = text.splitlines()
+        self.assertEqual(lines[0], "120 rows (showing first 2):")
+        self.assertEqual(lines[1], "machine_id | note")
+        self.assertTrue(lines[2].endswith("…"))
+        self.assertLessEqual(len(lines[2]), analytics.ANALYZE_CELL_CHARS + 4)
+        self.assertEqual(lines[3], "B | NULL")
+        self.assertEqual(analytics.render_table(["n"], [], 0), "0 results found.")
+
+    def test_refusals(self):
+        self.assertIn("SAFETY", analytics.check_query("DROP TABLE inventory"))
+        self.assertIn("one statement", analytics.check_query("SELECT 1; SELECT 2"))
+        self.assertIsNone(analytics.check_query("SELECT updated_at FROM production_daily;"))
+        self.assertIsNone(analytics.check_query("SELECT * FROM inventory WHERE product_name = 'drop; cloth'"))
+
+    def test_cache_keyed_on_normalized_sql(self):
+        pool = MagicMock()
+        pool.run.return_value = (["total"], [(70,)], 1)
+
+        first = analytics.analyze("SELECT SUM(rolls_produced) AS total FROM production_logs WHERE machine_id = 'A';", pool=pool)
+        second = analytics.analyze("select sum(rolls_produced)  as total\n from production_logs where machine_id = 'A'", pool=pool)
+        third = analytics.analyze("select sum(rolls_produced) as total from production_logs where machine_id = 'a'", pool=pool)
+
+        self.assertEqual(first, "1 row:\ntotal\n70")
+        self.assertEqual(second, first)
+        self.assertEqual(pool.run.call_count, 2)  # literal case matters, whitespace/keywords don't
+        self.assertEqual(third, first)
+
+
+if __name__ == "__main__":
+    unittest.main()
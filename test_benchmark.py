@@ -0,0 +1,49 @@
+import io
+import contextlib
+import unittest
+
+import timing
+
+
+class TestTiming(unittest.TestCase):
+
+    def test_nearest_rank_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        summary = timing.summarize(values, wall_seconds=2.0)
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["p50_ms"], 50.0)
+        self.assertEqual(summary["p99_ms"], 99.0)
+        self.assertEqual(summary["throughput_per_s"], 50.0)
+
+    def test_empty(self):
+        self.assertEqual(timing.summarize([])["p95_ms"], 0.0)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        # Imported here so test_graph.py still gets the first (mocked) import of agent_graph
+        global benchmark
+        import benchmark
+
+    def test_parse_command(self):
+        cmd = benchmark.parse_command("Machine A 40, B 30, C 20 rolls")
+        self.assertEqual([(e.machine_id, e.rolls) for e in cmd.entries], [("A", 40), ("B", 30), ("C", 20)])
+        cmd = benchmark.parse_command("Remove 5 units of Glue")
+        self.assertEqual((cmd.product_name, cmd.quantity_change), ("Glue", -5))
+
+    def test_smoke_run_reports_every_stage(self):
+        cfg = benchmark.BenchConfig(requests=8, concurrency=4, senders=4, voice_ratio=0.5,
+                                    ollama_latency=0, ollama_jitter=0, embed_latency=0,
+                                    whisper_latency=0, db_latency=0, twilio_latency=0, timeout=30)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = benchmark.asyncio.run(benchmark.run_benchmark(cfg))
+        self.assertEqual(result["requests"]["accepted"], 8)
+        self.assertEqual(result["requests"]["delivered"], 8)
+        self.assertEqual(set(result["stages"]), set(benchmark.STAGES))
+        self.assertEqual(result["stages"]["end_to_end"]["count"], 8)
+        self.assertGreater(result["stages"]["route"]["count"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import MagicMock
+
+import catalog
+
+
+def conn_returning(rows):
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = rows
+    return conn, cur
+
+
+class TestCatalog(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(catalog.normalize_product("  Glue-Sticks (Big) "), "glue sticks big")
+        self.assertEqual(catalog.normalize_product("GLUE   sticks"), "glue sticks")
+
+    def test_exact_key_wins(self):
+        conn, cur = conn_returning([("glue", "Glue", 1.0), ("blue glue", "Blue Glue", 0.5)])
+        self.assertEqual(catalog.resolve_product(conn, "GLUE"), ("glue", "Glue"))
+        sql = cur.execute.call_args[0][0]
+        self.assertIn("%% %(key)s", sql)  # trigram operator -> GIN index
+        self.assertEqual(cur.execute.call_args[0][1], {"key": "glue"})
+
+    def test_fuzzy_match_resolves_spoken_name(self):
+        conn, _ = conn_returning([("glue sticks", "Glue Sticks", 0.7), ("glue gun", "Glue Gun", 0.4)])
+        self.assertEqual(catalog.resolve_product(conn, "glu stick"), ("glue sticks", "Glue Sticks"))
+
+    def test_weak_match_is_a_new_product(self):
+        conn, _ = conn_returning([("gears", "Gears", 0.31)])
+        self.assertIsNone(catalog.resolve_product(conn, "gaskets"))
+
+    def test_close_candidates_are_ambiguous(self):
+        conn, _ = conn_returning([("red tape", "Red Tape", 0.6), ("red tap", "Red Tap", 0.55)])
+        with self.assertRaises(catalog.AmbiguousProduct) as ctx:
+            catalog.resolve_product(conn, "red tapes")
+        self.assertEqual(ctx.exception.candidates, ["Red Tape", "Red Tap"])
+
+
+if __name__ == "__main__":
+    unittest.main()
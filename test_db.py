@@ -0,0 +1,128 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from psycopg2 import extensions
+
+import migrations
+from db import ConnectionPool, PoolTimeout
+
+
+def make_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    @patch("psycopg2.connect")
+    def test_reuses_connections(self, mock_connect):
+        """A returned connection is handed out again instead of reconnecting"""
+        mock_connect.side_effect = lambda dsn: make_conn()
+        pool = ConnectionPool("dsn", minconn=0, maxconn=2)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(mock_connect.call_count, 1)
+        self.assertEqual(pool.stats()["checkouts"], 2)
+
+    @patch("psycopg2.connect")
+    def test_bounded_and_times_out(self, mock_connect):
+        """Checkout beyond maxconn waits, then raises PoolTimeout"""
+        mock_connect.side_effect = lambda dsn: make_conn()
+        pool = ConnectionPool("dsn", minconn=0, maxconn=1, timeout=0.05)
+
+        held = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        stats = pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["saturation"], 1.0)
+
+        # Releasing wakes a waiter
+        result = {}
+        waiter = threading.Thread(target=lambda: result.update(conn=pool.getconn()))
+        pool.timeout = 2
+        waiter.start()
+        pool.putconn(held)
+        waiter.join(2)
+        self.assertIs(result["conn"], held)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    @patch("psycopg2.connect")
+    def test_health_check_replaces_dead_connection(self, mock_connect):
+        """Stale connections failing SELECT 1 are discarded and replaced"""
+        dead, fresh = make_conn(), make_conn()
+        dead.cursor.return_value.__enter__.return_value.execute.side_effect = Exception("server closed")
+        mock_connect.side_effect = [dead, fresh]
+        pool = ConnectionPool("dsn", minconn=0, maxconn=1, check_after=0)
+
+        pool.putconn(pool.getconn())
+        conn = pool.getconn()
+
+        self.assertIs(conn, fresh)
+        self.assertEqual(pool.stats()["health_check_failures"], 1)
+        self.assertEqual(pool.stats()["open"], 1)
+
+    @patch("psycopg2.connect")
+    def test_run_rolls_back_on_error(self, mock_connect):
+        """run() commits on success and rolls back on failure"""
+        conn = make_conn()
+        mock_connect.return_value = conn
+        pool = ConnectionPool("dsn", minconn=0, maxconn=1)
+
+        self.assertEqual(pool.run(lambda c, x: x * 2, 21), 42)
+        conn.commit.assert_called_once()
+
+        def boom(c):
+            raise ValueError("bad")
+        with self.assertRaises(ValueError):
+            pool.run(boom)
+        conn.rollback.assert_called()
+        self.assertEqual(pool.stats()["in_use"], 0)
+
+
+class TestMigrations(unittest.TestCase):
+
+    def test_applies_only_pending_versions(self):
+        """Already-recorded versions are skipped; new ones are applied and recorded"""
+        conn = make_conn()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [(1,)]
+
+        applied = migrations._apply(conn)
+
+        self.assertEqual(applied, [v for v, _, _ in migrations.MIGRATIONS if v != 1])
+        executed = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertIn("pg_advisory_xact_lock", executed[0])
+        self.assertFalse(any("CREATE TABLE IF NOT EXISTS production_logs" in sql for sql in executed))
+        self.assertTrue(any("idx_production_logs_machine_ts" in sql for sql in executed))
+
+    def test_dashboard_reads_use_rollup(self):
+        """Dashboard queries hit production_daily; the trigger keeps it in step with production_logs"""
+        import rollups
+        conn = make_conn()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (0,)
+        cur.fetchall.return_value = []
+
+        self.assertEqual(rollups.production_today(conn), 0)
+        rollups.daily_production(conn, days=30)
+        rollups.machine_production(conn)
+
+        for call in cur.execute.call_args_list:
+            self.assertIn("FROM production_daily", call[0][0])
+            self.assertNotIn("production_logs", call[0][0])
+        rollup_sql = dict((v, sql) for v, _, sql in migrations.MIGRATIONS)[5]
+        for event in ("AFTER INSERT", "AFTER UPDATE", "AFTER DELETE"):
+            self.assertIn(event, rollup_sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
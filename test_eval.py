@@ -0,0 +1,94 @@
+import io
+import json
+import asyncio
+import tempfile
+import unittest
+import contextlib
+from unittest.mock import AsyncMock, MagicMock
+
+from langchain_core.messages import AIMessage
+
+import run_eval
+
+CASES = [
+    {"id": "maint", "input": "How to fix Error 502?", "route": "maintenance_agent",
+     "expected": "Apply grease to the main axle.", "must_contain": ["grease"]},
+    {"id": "prod", "input": "Log 50 rolls for Machine A", "route": "production_agent",
+     "must_contain": ["success"]},
+]
+
+
+class FakeGraph:
+    """Streams node updates like a compiled StateGraph; records the thread of each call."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.threads = []
+
+    async def astream(self, inputs, config):
+        self.threads.append(config["configurable"]["thread_id"])
+        text = inputs["messages"][0][1]
+        route, answer = self.answers[text]
+        await asyncio.sleep(0)
+        yield {"memory": None}
+        yield {route: {"messages": [{"role": "assistant", "content": answer}]}}
+        yield {"supervisor": None}
+
+
+class TestEval(unittest.TestCase):
+
+    def run_eval(self, graph, judge=None, cache=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(run_eval.evaluate(CASES, graph, judge, cache or run_eval.VerdictCache()))
+
+    def test_routes_rules_and_own_threads(self):
+        graph = FakeGraph({
+            "How to fix Error 502?": ("maintenance_agent", "Apply grease to the main axle."),
+            "Log 50 rolls for Machine A": ("inventory_agent", "✅ Stock Updated."),
+        })
+        results = {r.id: r for r in self.run_eval(graph)}
+
+        self.assertTrue(results["maint"].correct)
+        self.assertFalse(results["prod"].correct)
+        self.assertIn("routed to inventory_agent", results["prod"].reason)
+        self.assertEqual(len(set(graph.threads)), 2)
+
+        report = run_eval.build_report(list(results.values()), 1.0, run_eval.VerdictCache())
+        self.assertEqual(report["routes"]["maintenance_agent"]["accuracy"], 1.0)
+        self.assertEqual(report["routes"]["production_agent"]["accuracy"], 0.0)
+        self.assertEqual(report["overall"]["latency"]["count"], 2)
+
+    def test_judge_verdicts_are_cached_by_output(self):
+        graph = FakeGraph({
+            "How to fix Error 502?": ("maintenance_agent", "Apply grease to the main axle."),
+            "Log 50 rolls for Machine A": ("production_agent", "✅ Success. ID: 1"),
+        })
+        judge = MagicMock()
+        judge.ainvoke = AsyncMock(return_value=AIMessage("CORRECT\nsame fix"))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/verdicts.json"
+            cache = run_eval.VerdictCache(path)
+            self.run_eval(graph, judge, cache)
+            cache.save()
+            again = run_eval.VerdictCache(path)
+            results = self.run_eval(graph, judge, again)
+
+        # Only "maint" has an expected answer; the second run is served from the file
+        self.assertEqual(judge.ainvoke.await_count, 1)
+        self.assertEqual(again.hits, 1)
+        self.assertEqual({r.id: r.graded_by for r in results}, {"maint": "cache", "prod": "rule"})
+
+    def test_load_cases_rejects_duplicates(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write(json.dumps(CASES[0]) + "\n" + json.dumps(CASES[0]) + "\n")
+            f.flush()
+            with self.assertRaises(ValueError):
+                run_eval.load_cases(f.name)
+
+    def test_golden_cases_file_is_valid(self):
+        cases = run_eval.load_cases("eval_cases.jsonl")
+        self.assertTrue(all(c.get("route") for c in cases))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 
 import asyncio
 from typing import Literal
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, AsyncMock, patch
 import os
 
 # Mock environment variables BEFORE importing agent_graph
@@ -14,10 +14,11 @@ with patch("langchain_ollama.ChatOllama") as MockOllama, \
      patch("langgraph.prebuilt.create_react_agent"), \
      patch("agent_graph.production_agent") as mock_prod, \
      patch("agent_graph.inventory_agent") as mock_inv, \
-     patch("agent_graph.maintenance_agent") as mock_maint:
+     patch("pydantic_agent.maintenance_agent") as mock_maint:
     
     # Setup Mock LLM response behavior
     mock_llm_instance = MockOllama.return_value
+    mock_llm_instance.ainvoke = AsyncMock()  # supervisor_node is async
     
     # Configure mocks to return an object with .output attribute (matching PydanticAI)
     mock_result = MagicMock()
@@ -36,32 +37,32 @@ with patch("langchain_ollama.ChatOllama") as MockOllama, \
         print("🧪 Testing Supervisor Routing...")
 
         # Case 1: Production
-        mock_llm_instance.invoke.return_value.content = "production_agent"
+        mock_llm_instance.ainvoke.return_value.content = "production_agent"
         state = {"messages": [{"role": "user", "content": "Log 50 rolls"}]}
-        result = supervisor_node(state)
+        result = asyncio.run(supervisor_node(state))
         assert isinstance(result, Command)
         assert result.goto == "production_agent"
         print("✅ Production Routing: PASSED")
 
         # Case 2: Inventory
-        mock_llm_instance.invoke.return_value.content = "inventory_agent"
+        mock_llm_instance.ainvoke.return_value.content = "inventory_agent"
         state = {"messages": [{"role": "user", "content": "Update stock"}]}
-        result = supervisor_node(state)
+        result = asyncio.run(supervisor_node(state))
         assert result.goto == "inventory_agent"
         print("✅ Inventory Routing: PASSED")
 
         # Case 3: Maintenance
-        mock_llm_instance.invoke.return_value.content = "maintenance_agent"
+        mock_llm_instance.ainvoke.return_value.content = "maintenance_agent"
         state = {"messages": [{"role": "user", "content": "Error 502"}]}
-        result = supervisor_node(state)
+        result = asyncio.run(supervisor_node(state))
         assert result.goto == "maintenance_agent"
         print("✅ Maintenance Routing: PASSED")
 
         # Case 4: General Chat (fallback)
-        mock_llm_instance.invoke.return_value.content = "How are you?"
+        mock_llm_instance.ainvoke.return_value.content = "How are you?"
         # The logic: if not in list, fallback to message + END
         state = {"messages": [{"role": "user", "content": "Hello"}]}
-        result = supervisor_node(state)
+        result = asyncio.run(supervisor_node(state))
         
         # Verify it goes to END
         assert result.goto == END
@@ -69,9 +70,70 @@ with patch("langchain_ollama.ChatOllama") as MockOllama, \
         assert "messages" in result.update
         print("✅ General Chat Routing: PASSED")
 
+    def test_fast_path_skips_llm():
+        print("🧪 Testing Fast-Path Router...")
+        mock_llm_instance.ainvoke.reset_mock()
+
+        # Phonetic correction: "Law 50 rules" -> "log 50 rolls"
+        state = {"messages": [{"role": "user", "content": "Law 50 rules for Machine A"}]}
+        assert asyncio.run(supervisor_node(state)).goto == "production_agent"
+        state = {"messages": [{"role": "user", "content": "Add 20 units of glue"}]}
+        assert asyncio.run(supervisor_node(state)).goto == "inventory_agent"
+        state = {"messages": [{"role": "user", "content": "Machine B shows Error 999"}]}
+        assert asyncio.run(supervisor_node(state)).goto == "maintenance_agent"
+        mock_llm_instance.ainvoke.assert_not_called()
+
+        # Agent replies still go through the LLM (FINISH decision)
+        mock_llm_instance.ainvoke.return_value.content = "FINISH"
+        state = {"messages": [{"role": "assistant", "content": "✅ Success. Logged to Database. ID: 7"}]}
+        assert asyncio.run(supervisor_node(state)).goto == END
+        mock_llm_instance.ainvoke.assert_called_once()
+        print("✅ Fast-Path Routing: PASSED")
+
+    def test_structured_command_mode():
+        print("🧪 Testing Structured Command Mode...")
+        import agent_graph
+        from commands import FactoryCommand
+
+        async def run(cmd, text):
+            with patch.object(agent_graph, "command_llm") as mock_cmd_llm, \
+                 patch("factory_ops.log_production", new=AsyncMock(return_value="✅ Success. Logged to Database. ID: 7")) as mock_tool:
+                mock_cmd_llm.ainvoke = AsyncMock(return_value=cmd)
+                result = await agent_graph.command_node({"messages": [{"role": "user", "content": text}]})
+                return result, mock_tool
+
+        # One extraction call, tool runs directly, graph ends - no FINISH round trip
+        cmd = FactoryCommand(intent="log_production", machine_id="A", rolls=50)
+        result, mock_tool = asyncio.run(run(cmd, "Log 50 rolls for Machine A"))
+        assert result.goto == END
+        assert "ID: 7" in result.update["messages"][0]["content"]
+        mock_tool.assert_awaited_once()
+        assert mock_tool.call_args[0][:2] == ("A", 50)
+
+        # Missing details -> ask instead of guessing
+        cmd = FactoryCommand(intent="log_production", machine_id="A")
+        result, mock_tool = asyncio.run(run(cmd, "Log rolls for Machine A"))
+        assert result.goto == END
+        assert "rolls" in result.update["messages"][0]["content"]
+        mock_tool.assert_not_awaited()
+
+        # Chat without a reply text -> a real fallback, not "Please tell me the ."
+        result, mock_tool = asyncio.run(run(FactoryCommand(intent="chat"), "hmm"))
+        assert result.goto == END
+        assert result.update["messages"][0]["content"] == agent_graph.NOT_UNDERSTOOD
+        mock_tool.assert_not_awaited()
+
+        # Maintenance still goes to the RAG agent, and the structured graph compiles
+        result, _ = asyncio.run(run(cmd, "Error 502 on the cutter"))
+        assert result.goto == "maintenance_agent"
+        assert agent_graph.build_graph("structured") is not None
+        print("✅ Structured Command Mode: PASSED")
+
     if __name__ == "__main__":
         try:
             test_supervisor_routing()
+            test_fast_path_skips_llm()
+            test_structured_command_mode()
             print("\n🎉 All Tests Passed!")
         except AssertionError as e:
             print(f"\n❌ Test Failed: {e}")
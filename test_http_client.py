@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+import http_client
+from http_client import MediaDownloadError, download_media, send_whatsapp
+
+
+@patch.multiple("http_client", TWILIO_ACCOUNT_SID="ACtest", TWILIO_AUTH_TOKEN="token")
+class TestHttpClient(unittest.IsolatedAsyncioTestCase):
+
+    def use_transport(self, handler):
+        http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=True)
+
+    async def asyncTearDown(self):
+        await http_client.close_client()
+
+    @patch("http_client.asyncio.sleep", new_callable=AsyncMock)
+    async def test_send_retries_then_succeeds(self, mock_sleep):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(503 if len(calls) < 3 else 201, json={})
+
+        self.use_transport(handler)
+        resp = await send_whatsapp("whatsapp:+1", "✅ Done")
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(mock_sleep.await_count, 2)
+        self.assertIn(b"Body=", calls[0].content)
+        self.assertTrue(str(calls[0].url).endswith("/Accounts/ACtest/Messages.json"))
+
+    @patch("http_client.asyncio.sleep", new_callable=AsyncMock)
+    async def test_send_does_not_retry_client_errors(self, mock_sleep):
+        self.use_transport(lambda request: httpx.Response(400, json={"message": "bad To"}))
+        resp = await send_whatsapp("whatsapp:+1", "hi")
+        self.assertEqual(resp.status_code, 400)
+        mock_sleep.assert_not_awaited()
+
+    async def test_download_streams_and_caps_size(self):
+        self.use_transport(lambda request: httpx.Response(200, content=b"x" * 100))
+        self.assertEqual(await download_media("http://media/1", max_bytes=100), b"x" * 100)
+        with self.assertRaises(MediaDownloadError):
+            await download_media("http://media/1", max_bytes=99)
+
+    async def test_download_error_status(self):
+        self.use_transport(lambda request: httpx.Response(401))
+        with self.assertRaises(MediaDownloadError) as ctx:
+            await download_media("http://media/1")
+        self.assertEqual(ctx.exception.status, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
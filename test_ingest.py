@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+
+from ingest import chunk_id, find_pdfs, plan_changes
+from keyword_index import KeywordIndex, build_index, save_index
+
+MANUAL = ("Error 404: Network Timeout. Solution: Restart Router. "
+          "Error 502: Blade Jam caused by debris. Solution: Apply grease to the main axle and clear debris. "
+          "Error 999: Overheating. Solution: Turn off machine for 10 minutes.")
+
+
+class TestIncrementalIngest(unittest.TestCase):
+
+    def test_chunk_id_is_stable(self):
+        """Same file + text hashes to the same ID; different file or text does not"""
+        self.assertEqual(chunk_id("a.pdf", "Error 502"), chunk_id("a.pdf", "Error 502"))
+        self.assertNotEqual(chunk_id("a.pdf", "Error 502"), chunk_id("b.pdf", "Error 502"))
+        self.assertNotEqual(chunk_id("a.pdf", "Error 502"), chunk_id("a.pdf", "Error 503"))
+
+    def test_plan_changes(self):
+        """Only new chunks are embedded; changed and removed files lose their stale chunks"""
+        with tempfile.TemporaryDirectory() as tmp:
+            kept = os.path.join(tmp, "kept.pdf")
+            untouched = os.path.join(tmp, "untouched.pdf")
+            for path in (kept, untouched):
+                open(path, "wb").close()
+            removed = os.path.join(tmp, "removed.pdf")
+
+            existing = {"same": kept, "old": kept, "other": untouched, "gone": removed, "legacy": ""}
+            desired = {"same": None, "new": None}
+
+            to_add, to_delete = plan_changes(existing, desired, scanned={kept})
+
+            self.assertEqual(to_add, ["new"])
+            self.assertEqual(sorted(to_delete), ["gone", "legacy", "old"])
+
+    def test_find_pdfs_recurses(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "press"))
+            for name in ("a.pdf", "press/B.PDF", "notes.txt"):
+                open(os.path.join(tmp, name), "wb").close()
+            found = find_pdfs([tmp])
+            self.assertEqual([os.path.basename(p) for p in found], ["a.pdf", "B.PDF"])
+
+
+class TestKeywordIndex(unittest.TestCase):
+
+    def setUp(self):
+        chunks = [
+            ("c1", MANUAL, {"source": "manual.pdf", "page": 0}),
+            ("c2", "Lubrication schedule: grease every bearing weekly.", {"source": "care.pdf", "page": 3}),
+            ("c3", "Safety: lock out the feeder before clearing a jam.", {"source": "care.pdf", "page": 1}),
+        ]
+        self.index = build_index(chunks)
+
+    def test_error_code_map_holds_only_that_codes_passage(self):
+        keywords = KeywordIndex(self.index)
+        [passage] = keywords.passages_for("502")
+        self.assertTrue(passage.startswith("Error 502: Blade Jam"))
+        self.assertNotIn("999", passage)
+        self.assertEqual(keywords.passages_for("503"), [])
+
+    def test_code_passage_spans_chunk_boundary(self):
+        """A fix that spills into the next chunk (or page) stays attached to its error code"""
+        page0 = "Error 404: Network Timeout. Solution: Restart Router. Error 502: Blade Jam caused by"
+        chunks = [
+            ("a1", page0[:60], {"source": "m.pdf", "page": 0, "start_index": 0}),
+            ("a2", page0[50:], {"source": "m.pdf", "page": 0, "start_index": 50}),  # 10-char overlap
+            ("a3", "debris. Solution: Apply grease to the main axle.", {"source": "m.pdf", "page": 1, "start_index": 0}),
+        ]
+        keywords = KeywordIndex(build_index(chunks))
+        self.assertEqual(keywords.passages_for("502"),
+                         ["Error 502: Blade Jam caused by debris. Solution: Apply grease to the main axle."])
+        self.assertEqual(keywords.passages_for("404"), ["Error 404: Network Timeout. Solution: Restart Router."])
+
+    def test_header_without_fix_is_left_to_search(self):
+        """Chunks from older ingests (no start_index) can't be stitched; a bare header isn't indexed"""
+        chunks = [("a1", "Error 404: Network Timeout. Solution: Restart Router. Error 502: Blade Jam caused by",
+                   {"source": "old.pdf", "page": 0})]
+        keywords = KeywordIndex(build_index(chunks))
+        self.assertEqual(keywords.passages_for("502"), [])
+        self.assertEqual(len(keywords.passages_for("404")), 1)
+
+    def test_bm25_ranks_rare_terms(self):
+        keywords = KeywordIndex(self.index)
+        self.assertEqual(keywords.search("lock out feeder", k=1)[0][0], "c3")
+        self.assertEqual([cid for cid, _ in keywords.search("grease bearing")][0], "c2")
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(KeywordIndex.load(tmp))
+            save_index(self.index, tmp)
+            self.assertEqual(KeywordIndex.load(tmp).passages_for("404"), KeywordIndex(self.index).passages_for("404"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import MagicMock
+
+import ledger
+
+
+def make_cursor(conn=None):
+    conn = conn or MagicMock()
+    return conn, conn.cursor.return_value.__enter__.return_value
+
+
+class TestLedger(unittest.TestCase):
+
+    def test_compaction_skips_when_another_worker_holds_the_lock(self):
+        conn, cur = make_cursor()
+        cur.fetchone.return_value = (False,)
+        self.assertEqual(ledger.compact_inventory(conn), 0)
+        self.assertEqual(cur.execute.call_count, 1)
+
+    def test_compaction_folds_tail_into_balances_and_snapshots(self):
+        conn, cur = make_cursor()
+        cur.fetchone.return_value = (True,)
+        cur.rowcount = 3
+
+        self.assertEqual(ledger.compact_inventory(conn), 3)
+        executed = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertIn("IN SHARE MODE", executed[1])  # in-flight movements commit before the cutoff
+        self.assertIn("m.id > i.as_of_id", executed[2])
+        self.assertIn("INSERT INTO inventory_snapshots", executed[2])
+
+    def test_point_in_time_uses_sql_function(self):
+        conn, cur = make_cursor()
+        cur.fetchone.return_value = (42,)
+        self.assertEqual(ledger.stock_at(conn, "glue", "2026-10-12"), 42)
+        self.assertEqual(cur.execute.call_args[0], ("SELECT stock_at(%s, %s)", ("glue", "2026-10-12")))
+
+
+if __name__ == "__main__":
+    unittest.main()
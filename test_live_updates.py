@@ -0,0 +1,40 @@
+import unittest
+from collections import namedtuple
+from unittest.mock import MagicMock
+
+import migrations
+from live_updates import ChangeListener, CHANGE_CHANNEL
+
+Notify = namedtuple("Notify", "pid channel payload")
+
+
+class TestChangeListener(unittest.TestCase):
+
+    def test_drain_bumps_only_changed_tables(self):
+        listener = ChangeListener(dsn="unused")
+        conn = MagicMock()
+        conn.notifies = [Notify(1, CHANGE_CHANNEL, "production_daily"), Notify(1, CHANGE_CHANNEL, "production_daily")]
+
+        self.assertEqual(listener.drain(conn), {"production_daily"})
+        conn.poll.assert_called_once()
+        self.assertEqual(listener.version("production_daily"), 1)  # a burst is one refresh
+        self.assertEqual(listener.version("inventory"), 0)
+
+        conn.notifies = [Notify(1, CHANGE_CHANNEL, "inventory")]
+        listener.drain(conn)
+        self.assertEqual(listener.snapshot(), {"production_daily": 1, "inventory": 1})
+
+    def test_reconnect_invalidates_everything(self):
+        listener = ChangeListener(dsn="unused")
+        listener._bump_all()
+        self.assertEqual(listener.snapshot(), {"production_daily": 1, "inventory": 1})
+
+    def test_tables_notify_on_the_listened_channel(self):
+        sql = dict((v, sql) for v, _, sql in migrations.MIGRATIONS)[6]
+        self.assertIn(f"pg_notify('{CHANGE_CHANNEL}'", sql)
+        self.assertIn("ON production_daily", sql)
+        self.assertIn("ON inventory", sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
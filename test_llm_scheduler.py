@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+
+import threading
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock
+
+from llm_scheduler import LLMScheduler, SchedulerBusy, SharedSlots
+
+
+class FakeLocks:
+    """Postgres advisory locks as seen by several processes' connections."""
+
+    def __init__(self):
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    def connection(self):
+        locks = self
+        conn = MagicMock()
+
+        def execute(sql, params=()):
+            with locks.lock:
+                if "pg_try_advisory_lock" in sql:
+                    taken = locks.owners.setdefault(params, conn) is conn
+                    cur.fetchone.return_value = (taken,)
+                elif "pg_advisory_unlock_all" in sql:
+                    for key in [k for k, owner in locks.owners.items() if owner is conn]:
+                        del locks.owners[key]
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.execute.side_effect = execute
+        return conn
+
+
+class FakePool:
+    def __init__(self, locks):
+        self.locks = locks
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self.locks.connection()
+
+
+class TestLLMScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_per_sender_fifo(self):
+        """One sender's jobs never overlap and finish in arrival order"""
+        sched = LLMScheduler(concurrency=4, max_pending=10, max_pending_per_sender=10)
+        order, running = [], []
+
+        async def job(i):
+            running.append(i)
+            assert len(running) == 1, "same-sender jobs overlapped"
+            await asyncio.sleep(0.01 * (3 - i))  # earlier jobs are slower
+            order.append(i)
+            running.remove(i)
+            return i
+
+        futures = [sched.enqueue("whatsapp:+1", job, i) for i in range(3)]
+        self.assertEqual(await asyncio.gather(*futures), [0, 1, 2])
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual(sched.stats()["pending"], 0)
+
+    async def test_global_slot_limit(self):
+        """Different senders run in parallel, but only `concurrency` hold an Ollama slot"""
+        sched = LLMScheduler(concurrency=2, max_pending=10)
+        active, peak = 0, 0
+
+        async def job():
+            nonlocal active, peak
+            async with sched.slot():
+                active += 1
+                peak = max(peak, active)
+                async with sched.slot():  # nested (e.g. embeddings in an agent run) doesn't deadlock
+                    await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*[sched.enqueue(f"sender-{i}", job) for i in range(5)])
+        self.assertEqual(peak, 2)
+
+    async def test_backpressure(self):
+        """A full queue rejects new work instead of growing"""
+        sched = LLMScheduler(concurrency=1, max_pending=2, max_pending_per_sender=5)
+        gate = asyncio.Event()
+
+        async def job():
+            await gate.wait()
+
+        first = sched.enqueue("a", job)
+        second = sched.enqueue("b", job)
+        with self.assertRaises(SchedulerBusy):
+            sched.enqueue("c", job)
+        self.assertEqual(sched.stats()["rejected"], 1)
+
+        gate.set()
+        await asyncio.gather(first, second)
+        sched.enqueue("c", job)  # room again
+
+
+class TestSharedSlots(unittest.IsolatedAsyncioTestCase):
+
+    async def test_cap_holds_across_processes(self):
+        """Two worker processes with OLLAMA_CONCURRENCY=2 each still run at most 2 Ollama calls between them"""
+        locks = FakeLocks()
+        processes = [LLMScheduler(concurrency=2, max_pending=20) for _ in range(2)]
+        for sched in processes:
+            sched.shared = SharedSlots(2, FakePool(locks), poll=0.001)
+        active, peak = 0, 0
+
+        async def job(sched):
+            nonlocal active, peak
+            async with sched.slot():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.005)
+                active -= 1
+
+        await asyncio.gather(*[job(processes[i % 2]) for i in range(8)])
+        self.assertEqual(peak, 2)
+        self.assertEqual(locks.owners, {})  # every slot released
+        self.assertTrue(processes[0].stats()["shared_slots"])
+
+    async def test_cancelled_waiter_leaves_no_lock(self):
+        locks = FakeLocks()
+        slots = SharedSlots(1, FakePool(locks), poll=0.001)
+        release = asyncio.Event()
+
+        async def hold():
+            async with slots.hold():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.02)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        self.assertEqual(locks.owners, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+import memory
+import commands
+import agent_graph
+
+
+class TestMemoryWindow(unittest.TestCase):
+
+    def test_prompt_stays_within_budget(self):
+        long_chat = []
+        for i in range(200):
+            long_chat += [HumanMessage(f"Log {i} rolls for Machine A please", id=f"h{i}"),
+                          AIMessage(f"✅ Success. Logged to Database. ID: {i}", id=f"a{i}")]
+        prompt = memory.prompt({"messages": long_chat, "summary": "Foreman logs Machine A output."}, "SYSTEM")
+
+        self.assertIn("Foreman logs Machine A output.", prompt[0].content)
+        self.assertEqual(prompt[1].type, "human")
+        self.assertEqual(prompt[-1].content, "✅ Success. Logged to Database. ID: 199")
+        history = memory.count_tokens_approximately(prompt[1:])
+        self.assertLessEqual(history, memory.MEMORY_TOKEN_BUDGET)
+
+    def test_split_starts_on_user_turn(self):
+        msgs = [HumanMessage("a"), AIMessage("b"), HumanMessage("c"), AIMessage("d"), AIMessage("e"), HumanMessage("f")]
+        cut = memory.split_point(msgs, keep=3)
+        self.assertEqual(msgs[cut].content, "f")
+
+    def test_agent_input_carries_pending_confirmation(self):
+        state = {"messages": [HumanMessage("Log 50 rolls for Machine For"),
+                              AIMessage("Did you mean Machine 4?"), HumanMessage("Yes")]}
+        text = memory.agent_input(state)
+        self.assertIn("Did you mean Machine 4?", text)
+        self.assertTrue(text.endswith("Current message: Yes"))
+        self.assertEqual(memory.agent_input({"messages": [HumanMessage("Yes")]}), "Yes")
+
+
+class TestCheckpointedGraph(unittest.TestCase):
+
+    def test_thread_is_persisted_and_compacted(self):
+        """Many turns on one thread: history survives between calls but stays bounded"""
+        graph = agent_graph.build_graph("structured", checkpointer=InMemorySaver())
+        config = {"configurable": {"thread_id": "whatsapp:+1"}}
+        chat = commands.FactoryCommand(intent="chat", reply="Hello foreman")
+        summary = MagicMock(content="Foreman chatted about shifts.")
+
+        async def run():
+            seen = []
+            for i in range(20):
+                await graph.ainvoke({"messages": [("user", f"hello number {i}")]}, config)
+                seen.append(len(mock_cmd.ainvoke.await_args.args[0]))
+            return seen, await graph.aget_state(config)
+
+        with patch.object(agent_graph, "command_llm") as mock_cmd, \
+             patch.object(agent_graph, "llm") as mock_llm:
+            mock_cmd.ainvoke = AsyncMock(return_value=chat)
+            mock_llm.ainvoke = AsyncMock(return_value=summary)
+            seen, state = asyncio.run(run())
+
+        self.assertGreater(seen[3], seen[0])  # earlier turns reached the prompt
+        self.assertLessEqual(max(seen), memory.MEMORY_MAX_MESSAGES + 2)
+        self.assertLessEqual(len(state.values["messages"]), memory.MEMORY_MAX_MESSAGES + 1)
+        self.assertEqual(state.values["summary"], "Foreman chatted about shifts.")
+        self.assertTrue(mock_llm.ainvoke.await_count < 20)  # compaction is batched, not per turn
+
+
+if __name__ == "__main__":
+    unittest.main()
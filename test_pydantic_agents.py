@@ -21,6 +21,9 @@ class TestPydanticAgents(unittest.IsolatedAsyncioTestCase):
         # The module sets it on import, but we want to verify that logic.
         if "OLLAMA_BASE_URL" in os.environ:
             del os.environ["OLLAMA_BASE_URL"]
+        # Fresh shared pool per test so each test's psycopg2.connect mock is used
+        import db
+        db.close_pool()
 
     async def test_agent_configuration(self):
         """Verify that OLLAMA_BASE_URL is correctly set with /v1 suffix"""
@@ -50,8 +53,9 @@ class TestPydanticAgents(unittest.IsolatedAsyncioTestCase):
 
         result = await log_production(ctx, "Machine-X", 50)
         
-        # Verify SQL
-        self.assertIn("INSERT INTO production_logs", mock_cur.execute.call_args_list[1][0][0])
+        # Verify SQL (DML only - schema is owned by migrations.py)
+        self.assertIn("INSERT INTO production_logs", mock_cur.execute.call_args_list[0][0][0])
+        self.assertNotIn("CREATE TABLE", str(mock_cur.execute.call_args_list))
         self.assertIn("✅ Success. Logged to Database. ID: 123", result)
         print("✅ Production Tool Test: SQL execution verified.")
 
@@ -63,7 +67,8 @@ class TestPydanticAgents(unittest.IsolatedAsyncioTestCase):
         mock_conn = mock_connect.return_value
         mock_cur = mock_conn.cursor.return_value
         mock_cur.__enter__.return_value = mock_cur
-        mock_cur.fetchone.side_effect = [None, [99]] # First None (check exist), then 99 (returning qty)
+        mock_cur.fetchall.return_value = []  # No catalog match -> new product
+        mock_cur.fetchone.side_effect = [(501,), (99,)]  # movement id, live balance
 
         deps = AgentDeps()
         ctx = MagicMock()
@@ -71,9 +76,114 @@ class TestPydanticAgents(unittest.IsolatedAsyncioTestCase):
 
         result = await update_stock(ctx, "Gears", 10)
         
-        self.assertIn("INSERT INTO inventory", mock_cur.execute.call_args_list[2][0][0])
+        # Catalog lookup, new catalog row, ledger append, live balance - never UPDATE inventory
+        executed = [c[0] for c in mock_cur.execute.call_args_list]
+        self.assertIn("ON CONFLICT (product_key) DO NOTHING", executed[1][0])
+        self.assertEqual(executed[1][1], ("Gears", "gears"))
+        self.assertIn("INSERT INTO inventory_movements", executed[2][0])
+        self.assertEqual(executed[2][1], ("gears", 10))
+        self.assertIn("FROM inventory_stock", executed[3][0])
+        self.assertFalse(any(sql.lstrip().startswith("UPDATE inventory") for sql, *_ in executed))
         self.assertIn("✅ Stock Updated. Gears: 99", result)
         print("✅ Inventory Tool Test: Logic verified.")
 
+    @patch("psycopg2.connect")
+    async def test_production_batch_tool(self, mock_connect):
+        """Shift-end report: one INSERT for all machines, one ID per entry"""
+        from pydantic_agent import log_production_batch, AgentDeps
+        from factory_ops import ProductionEntry
+
+        mock_cur = mock_connect.return_value.cursor.return_value
+        mock_cur.__enter__.return_value = mock_cur
+        mock_cur.fetchall.return_value = [(11,), (12,), (13,)]
+
+        ctx = MagicMock()
+        ctx.deps = AgentDeps()
+        entries = [ProductionEntry(machine_id=m, rolls=r) for m, r in (("A", 50), ("B", 30), ("C", 20))]
+        result = await log_production_batch(ctx, entries)
+
+        self.assertEqual(mock_cur.execute.call_count, 1)
+        sql, params = mock_cur.execute.call_args[0]
+        self.assertIn("unnest", sql)
+        self.assertEqual(params, (["A", "B", "C"], [50, 30, 20]))
+        self.assertIn("Logged 3 entries", result)
+        self.assertIn("- B: 30 rolls (ID: 12)", result)
+
+    async def test_write_behind_buffer_groups_inserts(self):
+        """Logs arriving inside the window share one batch; each caller gets its own ID"""
+        import asyncio
+        import factory_ops
+
+        pool = MagicMock()
+        pool.run = AsyncMock(return_value=[21, 22, 23])
+        buffer = factory_ops.ProductionBuffer(pool, window=0.01)
+        ids = await asyncio.gather(buffer.add("A", 1), buffer.add("B", 2), buffer.add("C", 3))
+
+        self.assertEqual(ids, [21, 22, 23])
+        pool.run.assert_awaited_once_with(factory_ops.insert_production_batch, [("A", 1), ("B", 2), ("C", 3)])
+        self.assertEqual(buffer.stats()["rows_per_flush"], 3.0)
+
+        pool.run.side_effect = RuntimeError("db down")
+        with self.assertRaises(RuntimeError):
+            await buffer.add("A", 1)
+
+    async def test_maintenance_answer_cache(self):
+        """A cached answer skips the agent run; a fresh answer is stored for the next shift"""
+        import pydantic_agent
+
+        manuals = MagicMock(version=7.0)
+        manuals.cached_answer.return_value = "Apply grease to the main axle."
+        run = AsyncMock(return_value=MagicMock(output="Turn off the machine for 10 minutes."))
+        with patch.object(pydantic_agent, "get_retriever", return_value=manuals), \
+             patch.object(pydantic_agent.maintenance_agent, "run", run):
+            answer = await pydantic_agent.answer_maintenance("Error 502?", "Error 502?", None)
+            self.assertEqual(answer, "Apply grease to the main axle.")
+            run.assert_not_awaited()
+
+            manuals.cached_answer.return_value = None
+            answer = await pydantic_agent.answer_maintenance("Error 999?", "Error 999?", None)
+        self.assertEqual(answer, "Turn off the machine for 10 minutes.")
+        manuals.remember_answer.assert_called_once_with("Error 999?", "Turn off the machine for 10 minutes.", 7.0)
+
+    async def test_warm_cache_hit_skips_ollama_slot(self):
+        """An exact repeat (embedding cached) is answered without queueing for an Ollama slot"""
+        import pydantic_agent
+
+        manuals = MagicMock(version=7.0)
+        manuals.has_embedding.return_value = True
+        manuals.cached_answer.return_value = "Apply grease to the main axle."
+        slot = MagicMock(side_effect=AssertionError("took an Ollama slot"))
+        with patch.object(pydantic_agent, "get_retriever", return_value=manuals), \
+             patch.object(pydantic_agent, "ollama_slot", slot):
+            answer = await pydantic_agent.answer_maintenance("Error 502?", "Error 502?", None)
+        self.assertEqual(answer, "Apply grease to the main axle.")
+        manuals.cached_answer.assert_called_once_with("Error 502?")
+
+    async def test_maintenance_cache_keyed_on_current_message(self):
+        """Conversation context doesn't stop a standalone code question from using the cache;
+        follow-ups and questions without an error code stay out of it"""
+        import pydantic_agent
+
+        manuals = MagicMock(version=7.0)
+        manuals.cached_answer.return_value = None
+        run = AsyncMock(return_value=MagicMock(output="Check the belt tension on Machine B."))
+        context = ("Recent conversation (context only - act on the current message, never repeat earlier actions):\n"
+                   "user: Log 50 rolls for Machine A\nassistant: ✅ Logged.\n\nCurrent message: ")
+        with patch.object(pydantic_agent, "get_retriever", return_value=manuals), \
+             patch.object(pydantic_agent.maintenance_agent, "run", run):
+            await pydantic_agent.answer_maintenance(context + "How to fix Error 502?", "How to fix Error 502?", None)
+            manuals.cached_answer.assert_called_once_with("How to fix Error 502?")
+            manuals.remember_answer.assert_called_once()
+
+            manuals.reset_mock()
+            for question in ("still not working after that", "Error 502 again after that", "The belt slips"):
+                answer = await pydantic_agent.answer_maintenance(context + question, question, None)
+                self.assertEqual(answer, "Check the belt tension on Machine B.")
+            await pydantic_agent.answer_maintenance("Error 502 on B", None, None)
+
+        self.assertEqual(run.await_count, 5)
+        manuals.cached_answer.assert_not_called()
+        manuals.remember_answer.assert_not_called()
+
 if __name__ == "__main__":
     unittest.main()
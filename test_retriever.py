@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cache import SemanticCache
+from langchain_core.documents import Document
+
+from keyword_index import build_index, save_index
+from retriever import ManualRetriever, mark_ingested
+
+
+class TestManualRetriever(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        mark_ingested(self.dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("retriever.OllamaEmbeddings")
+    @patch("retriever.Chroma")
+    def test_store_opened_once(self, mock_chroma, mock_embeddings):
+        """Repeated searches reuse one embeddings client and one open collection"""
+        r = ManualRetriever(persist_dir=self.dir, ollama_host="http://mock")
+        for k in (1, 2, 3):
+            r.search("Error 502", k=k)
+        self.assertEqual(mock_chroma.call_count, 1)
+        self.assertEqual(mock_embeddings.call_count, 1)
+        self.assertEqual(mock_chroma.return_value.similarity_search_by_vector_with_relevance_scores.call_count, 3)
+
+    @patch("retriever.OllamaEmbeddings")
+    @patch("retriever.Chroma")
+    def test_repeat_questions_hit_cache(self, mock_chroma, mock_embeddings):
+        """Normalized repeats skip both the Ollama embedding call and the vector search"""
+        mock_chroma.return_value.similarity_search_by_vector_with_relevance_scores.return_value = [("chunk", 0.2)]
+        r = ManualRetriever(persist_dir=self.dir, ollama_host="http://mock")
+
+        self.assertEqual(r.search("Error 502"), ["chunk"])
+        self.assertEqual(r.search("  error 502? "), ["chunk"])
+
+        mock_embeddings.return_value.embed_query.assert_called_once_with("error 502")
+        self.assertEqual(mock_chroma.return_value.similarity_search_by_vector_with_relevance_scores.call_count, 1)
+        self.assertEqual(r.stats()["result_cache"]["hits"], 1)
+
+    @patch("retriever.OllamaEmbeddings")
+    @patch("retriever.Chroma")
+    def test_reloads_after_ingest(self, mock_chroma, mock_embeddings):
+        """A newer ingest marker reopens the collection but keeps the HTTP client"""
+        r = ManualRetriever(persist_dir=self.dir, ollama_host="http://mock")
+        r.search("Error 502")
+        marker = os.path.join(self.dir, ".ingest_version")
+        stat = os.stat(marker)
+        os.utime(marker, (stat.st_atime + 10, stat.st_mtime + 10))
+        r.search("Error 502")
+        self.assertEqual(mock_chroma.call_count, 2)
+        self.assertEqual(mock_embeddings.call_count, 1)
+        self.assertEqual(r.reloads, 1)
+        # Results were invalidated, the query embedding was reused
+        self.assertEqual(mock_chroma.return_value.similarity_search_by_vector_with_relevance_scores.call_count, 2)
+        mock_embeddings.return_value.embed_query.assert_called_once()
+
+    @patch("retriever.OllamaEmbeddings")
+    @patch("retriever.Chroma")
+    def test_answer_cache_matches_paraphrase_not_other_code(self, mock_chroma, mock_embeddings):
+        """Near-identical questions reuse the answer; a different error code never does"""
+        mock_embeddings.return_value.embed_query.side_effect = lambda q: [1.0, 0.05 * len(q), 0.0]
+        r = ManualRetriever(persist_dir=self.dir, ollama_host="http://mock")
+        r.remember_answer("error 502 blade jam", "Apply grease to the main axle.", r.version)
+
+        self.assertEqual(r.cached_answer("Error 502, blade jammed"), "Apply grease to the main axle.")
+        self.assertIsNone(r.cached_answer("error 503 blade jam"))
+        self.assertEqual(r.stats()["answer_cache"]["hits"], 1)
+        # Seen questions can be looked up without an Ollama call (no embedding-cache stats touched)
+        embedding_stats = r.stats()["embedding_cache"]
+        self.assertTrue(r.has_embedding("Error 502, Blade jammed!"))
+        self.assertFalse(r.has_embedding("error 504"))
+        self.assertEqual(r.stats()["embedding_cache"], embedding_stats)
+
+    @patch("retriever.OllamaEmbeddings")
+    @patch("retriever.Chroma")
+    def test_answer_cache_cleared_by_ingest(self, mock_chroma, mock_embeddings):
+        """Answers from the old manual are dropped, and one computed across an ingest is never stored"""
+        mock_embeddings.return_value.embed_query.return_value = [1.0, 0.0]
+        r = ManualRetriever(persist_dir=self.dir, ollama_host="http://mock")
+        r.store()
+        stale_version = r.version
+        r.remember_answer("error 502", "old answer", stale_version)
+
+        marker = os.path.join(self.dir, ".ingest_version")
+        stat = os.stat(marker)
+        os.utime(marker, (stat.st_atime + 10, stat.st_mtime + 10))
+        r.remember_answer("error 502", "answer from the old manual", stale_version)
+        self.assertIsNone(r.cached_answer("error 502"))
+
+    @patch("retriever.OllamaEmbeddings")
+    @patch("retriever.Chroma")
+    def test_exact_code_skips_embedding_and_hybrid_merges_keyword_hits(self, mock_chroma, mock_embeddings):
+        """'Error 502' is a map lookup; other questions blend BM25 hits into the vector results"""
+        save_index(build_index([
+            ("c1", "Error 502: Blade Jam. Apply grease to the main axle.", {"source": "m.pdf"}),
+            ("c2", "Error 503: Feeder stall. Reset the feeder.", {"source": "m.pdf"}),
+            ("c3", "Torque spec for the axle bolt is 45 Nm.", {"source": "m.pdf"}),
+        ]), self.dir)
+        mark_ingested(self.dir)
+        near = Document(page_content="Error 503: Feeder stall. Reset the feeder.", metadata={"source": "m.pdf"}, id="c2")
+        far = Document(page_content="Torque spec for the axle bolt is 45 Nm.", metadata={"source": "m.pdf"}, id="c3")
+        mock_chroma.return_value.similarity_search_by_vector_with_relevance_scores.return_value = [(near, 0.3), (far, 0.6)]
+        r = ManualRetriever(persist_dir=self.dir, ollama_host="http://mock")
+
+        self.assertEqual(r.code_passages("How to fix Error 502?"), ["Error 502: Blade Jam. Apply grease to the main axle."])
+        self.assertIsNone(r.code_passages("Error 777 on line 2"))  # unknown code: fall back to search
+        mock_embeddings.return_value.embed_query.assert_not_called()
+
+        results = r.search("axle bolt torque", k=3)
+        self.assertEqual([d.id for d in results], ["c3", "c2", "c1"])  # c1 comes from BM25 alone
+        self.assertIn("Blade Jam", results[2].page_content)
+
+
+class TestSemanticCache(unittest.TestCase):
+
+    def test_threshold_ttl_and_capacity(self):
+        cache = SemanticCache(maxsize=2, ttl=60, threshold=0.9)
+        cache.add([1, 0], "a")
+        cache.add([0, 1], "b")
+        value, score = cache.lookup([0.99, 0.05])
+        self.assertEqual(value, "a")
+        self.assertGreater(score, 0.9)
+        self.assertIsNone(cache.lookup([0.7, 0.7]))  # cosine 0.71: too far from both
+
+        cache.add([0.6, 0.8], "c")  # evicts "b", the least recently used
+        self.assertIsNone(cache.lookup([0, 1]))
+        self.assertEqual(cache.evictions, 1)
+
+        cache.ttl = -1
+        cache.add([-1, 0], "expired")
+        self.assertIsNone(cache.lookup([-1, 0]))
+        self.assertEqual(cache.expired, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
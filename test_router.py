@@ -0,0 +1,47 @@
+import unittest
+
+import router
+
+
+class TestFastPathRouter(unittest.TestCase):
+
+    def test_high_confidence_commands(self):
+        cases = {
+            "Log 100 rolls for Machine A": "production",
+            "Law 50 Doles on machine B": "production",
+            "Machine C produced 30 rolls": "production",
+            "Add 50 logs to inventory": "inventory",
+            "Remove 5 units of glue": "inventory",
+            "Received 12 boxes of tape": "inventory",
+            "Error 502": "maintenance",
+            "The cutter is jammed again": "maintenance",
+        }
+        for text, intent in cases.items():
+            self.assertEqual(router.classify(text), intent, text)
+
+    def test_ambiguous_goes_to_llm(self):
+        for text in [
+            "Hello",
+            "How many rolls did we log today?",
+            "Update stock",                      # no quantity
+            "Log 50 rolls, machine shows error 502",  # two intents
+            "Thanks, that's all",
+        ]:
+            self.assertIsNone(router.classify(text), text)
+
+    def test_phonetic_correction(self):
+        self.assertEqual(router.correct("Law 50 Rules"), "log 50 rolls")
+        self.assertIn('"Rules" / "Roles" / "Doles" -> "Rolls"', router.phonetic_prompt())
+
+    def test_stats(self):
+        before = router.router_stats()
+        router.record("inventory")
+        router.record(None)
+        after = router.router_stats()
+        self.assertEqual(after["fast_path"], before["fast_path"] + 1)
+        self.assertEqual(after["llm"], before["llm"] + 1)
+        self.assertEqual(after["inventory"], before["inventory"] + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import json
+import asyncio
+import unittest
+import contextlib
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+import startup
+
+
+class TestReadiness(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.out = contextlib.redirect_stdout(io.StringIO())
+        self.out.__enter__()
+        self.addCleanup(self.out.__exit__, None, None, None)
+
+    @patch("startup.WARMUP_RETRY_DELAY", 0)
+    async def test_retries_then_ready(self):
+        readiness = startup.Readiness(["llm", "embeddings"], required=["llm"])
+        step = AsyncMock(side_effect=[ConnectionError("ollama starting"), None])
+        await readiness.run("llm", step, retries=2)
+        self.assertEqual(readiness.components["llm"]["status"], "ready")
+        self.assertTrue(readiness.ready)  # embeddings still pending, but not required
+
+    @patch("startup.WARMUP_RETRY_DELAY", 0)
+    async def test_failure_is_recorded_not_raised(self):
+        readiness = startup.Readiness(["whisper"])
+        await readiness.run("whisper", AsyncMock(side_effect=RuntimeError("no ffmpeg")), retries=1)
+        self.assertEqual(readiness.components["whisper"]["status"], "failed")
+        self.assertIn("no ffmpeg", readiness.report()["components"]["whisper"]["error"])
+        self.assertFalse(readiness.ready)
+
+    async def test_missing_model_is_pulled_then_loaded(self):
+        calls = []
+
+        def handle(request):
+            calls.append(request.url.path)
+            body = json.loads(request.content)
+            if request.url.path == "/api/generate" and calls.count("/api/pull") == 0:
+                return httpx.Response(404, json={"error": f"model '{body['model']}' not found"})
+            return httpx.Response(200, json={"done": True})
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handle)) as client:
+            await startup.warm_ollama_model(client, "llama3.2")
+        self.assertEqual(calls, ["/api/generate", "/api/pull", "/api/generate"])
+
+    async def test_warmup_runs_components_concurrently(self):
+        readiness = startup.Readiness(["schema", "graph", "whisper", "llm", "embeddings"])
+        started = []
+
+        async def slow(name):
+            started.append(name)
+            await asyncio.sleep(0.05)
+
+        transcriber = SimpleNamespace(warm=lambda: slow("whisper"))
+        with patch("migrations.migrate", return_value=[]), \
+             patch("startup.warm_ollama_model", new=lambda client, model, embedding=False: slow(model)):
+            await asyncio.wait_for(startup.warmup(readiness, "postgres", transcriber), timeout=0.5)
+
+        self.assertEqual(readiness.components["graph"]["status"], "skipped")
+        self.assertEqual(set(started), {"whisper", "llama3.2", "nomic-embed-text"})
+        self.assertTrue(readiness.ready)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from tool_limits import ToolLimiter, parse_limits
+
+
+class TestParseLimits(unittest.TestCase):
+
+    def test_spec(self):
+        self.assertEqual(parse_limits(" log_production=8, analyze_data=2,"), {"log_production": 8, "analyze_data": 2})
+        self.assertEqual(parse_limits(""), {})
+
+
+class TestToolLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_cap_per_tool(self):
+        """A slow tool is held to its own cap and doesn't block other tools"""
+        limiter = ToolLimiter({"analyze_data": 2}, default=4)
+        active, peak = 0, 0
+        release = asyncio.Event()
+
+        async def slow_query():
+            nonlocal active, peak
+            async with limiter.slot("analyze_data"):
+                active += 1
+                peak = max(peak, active)
+                await release.wait()
+                active -= 1
+
+        async def quick_log():
+            async with limiter.slot("log_production"):
+                return limiter.stats()["analyze_data"]["waiting"]
+
+        queries = [asyncio.create_task(slow_query()) for _ in range(6)]
+        await asyncio.sleep(0)  # every query is now running or queued
+        waiting_during_log = await quick_log()
+        release.set()
+        await asyncio.gather(*queries)
+
+        self.assertEqual(waiting_during_log, 4)  # ran while analyze_data was still queued
+        self.assertEqual(peak, 2)
+        stats = limiter.stats()["analyze_data"]
+        self.assertEqual((stats["limit"], stats["calls"], stats["in_flight"], stats["waiting"]), (2, 6, 0, 0))
+        self.assertEqual(stats["wait"]["count"], 6)
+        self.assertEqual(limiter.stats()["log_production"]["limit"], 4)
+
+    async def test_errors_counted_and_slot_released(self):
+        limiter = ToolLimiter({"update_stock": 1})
+        with self.assertRaises(ValueError):
+            async with limiter.slot("update_stock"):
+                raise ValueError("boom")
+        async with limiter.slot("update_stock"):  # would deadlock if the slot leaked
+            pass
+        stats = limiter.stats()["update_stock"]
+        self.assertEqual((stats["calls"], stats["errors"], stats["in_flight"]), (2, 1, 0))
+        self.assertEqual(stats["latency"]["count"], 2)
+
+    async def test_failure_replies_counted_as_errors(self):
+        """Tools report failures as "❌ ..." text instead of raising; call() still counts them"""
+        limiter = ToolLimiter()
+
+        async def tool(reply):
+            return reply
+
+        self.assertEqual(await limiter.call("update_stock", tool, "✅ Stock Updated. Glue: 10"), "✅ Stock Updated. Glue: 10")
+        await limiter.call("update_stock", tool, "❌ Error updating stock: db down")
+        stats = limiter.stats()["update_stock"]
+        self.assertEqual((stats["calls"], stats["errors"]), (2, 1))
+
+    async def test_cancelled_while_waiting(self):
+        limiter = ToolLimiter({"consult_manual": 1})
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot("consult_manual"):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.stats()["consult_manual"]["waiting"], 1)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+
+        stats = limiter.stats()["consult_manual"]
+        self.assertEqual((stats["calls"], stats["waiting"], stats["in_flight"]), (1, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
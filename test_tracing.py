@@ -0,0 +1,76 @@
+import io
+import asyncio
+import unittest
+import unittest.mock
+import contextlib
+
+import tracing
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = tracing.Registry()
+        hist = registry.histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            hist.observe(value, stage="agent")
+        text = registry.render()
+        self.assertIn('t_seconds_bucket{stage="agent",le="0.1"} 1', text)
+        self.assertIn('t_seconds_bucket{stage="agent",le="1"} 2', text)
+        self.assertIn('t_seconds_bucket{stage="agent",le="+Inf"} 3', text)
+        self.assertIn('t_seconds_count{stage="agent"} 3', text)
+        self.assertIn("# TYPE t_seconds histogram", text)
+
+    def test_gauge_callback_and_label_escaping(self):
+        registry = tracing.Registry()
+        registry.gauge("depth", "queue depth", callback=lambda: 4)
+        registry.counter("hits_total", "hits", ("name",)).inc(name='a"b')
+        text = registry.render()
+        self.assertIn("depth 4", text)
+        self.assertIn('hits_total{name="a\\"b"} 1', text)
+
+
+class TestSpans(unittest.TestCase):
+
+    def test_span_logs_request_id_and_counts_errors(self):
+        out = io.StringIO()
+        errors_before = tracing.STAGE_ERRORS._values.get(("tool", "boom"), 0)
+        with contextlib.redirect_stdout(out), tracing.bind("SM1"):
+            with self.assertRaises(ValueError):
+                with tracing.span("tool", "boom"):
+                    raise ValueError("bad")
+        self.assertIn('"request_id": "SM1"', out.getvalue())
+        self.assertIn('"status": "error"', out.getvalue())
+        self.assertEqual(tracing.STAGE_ERRORS._values[("tool", "boom")], errors_before + 1)
+
+    def test_request_id_reaches_spawned_tasks(self):
+        async def child():
+            return tracing.current_request_id()
+
+        async def main():
+            with tracing.bind("SM2"):
+                return await asyncio.create_task(child())
+
+        self.assertEqual(asyncio.run(main()), "SM2")
+        self.assertIsNone(tracing.current_request_id())
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def test_metrics_endpoint_exposes_stage_histogram(self):
+        # Imported here so test_graph.py still gets the first (mocked) import of agent_graph
+        from fastapi.testclient import TestClient
+        import whatsapp_server
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with tracing.span("send", "twilio"):
+                pass
+        with unittest.mock.patch.object(whatsapp_server, "JOB_QUEUE", "memory"):
+            resp = TestClient(whatsapp_server.app).get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('factory_stage_duration_seconds_count{stage="send",name="twilio"}', resp.text)
+        self.assertIn("factory_llm_pending", resp.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
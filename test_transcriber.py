@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+import transcriber
+from transcriber import TranscriberPool, TranscriptionBusy
+
+
+class TestTranscriberPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        # Threads stand in for worker processes; the model is a mock
+        self.model = MagicMock()
+        self.model.transcribe.return_value = {"text": " Log 50 rolls"}
+        transcriber._model = self.model
+        self.pool = TranscriberPool(workers=1, max_jobs=1)
+        self.pool._executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        transcriber._model = None
+
+    @patch("transcriber.decode_audio", return_value=np.zeros(16000, np.float32))
+    async def test_transcribes_bytes_in_memory(self, mock_decode):
+        text = await self.pool.transcribe(b"OggS...")
+        self.assertEqual(text, " Log 50 rolls")
+        mock_decode.assert_called_once_with(b"OggS...")
+        # The model gets a decoded array, never a file path
+        self.assertIsInstance(self.model.transcribe.call_args[0][0], np.ndarray)
+        stats = self.pool.stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertAlmostEqual(stats["audio_seconds"], 1.0)
+
+    @patch("transcriber.decode_audio", return_value=np.zeros(1600, np.float32))
+    async def test_bounded_jobs(self, mock_decode):
+        first = asyncio.ensure_future(self.pool.transcribe(b"a"))
+        await asyncio.sleep(0)
+        with self.assertRaises(TranscriptionBusy):
+            await self.pool.transcribe(b"b")
+        await first
+        self.assertEqual(self.pool.stats()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
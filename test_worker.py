@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import job_queue
+import tracing
+import worker
+
+
+def make_job(**overrides):
+    job = {"id": 7, "sender_id": "whatsapp:+1", "payload": "Log 50 rolls for Machine A",
+           "attempts": 1, "max_attempts": 3, "queue_wait_s": 0.1}
+    job.update(overrides)
+    return job
+
+
+class TestWorker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = MagicMock()
+        self.pool.run = AsyncMock()
+        patcher = patch("worker.db.get_async_pool", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ops(self):
+        return [c.args[0] for c in self.pool.run.await_args_list]
+
+    @patch("worker.deliver", new_callable=AsyncMock)
+    @patch("worker.run_graph", new_callable=AsyncMock, return_value="✅ Success. ID: 1")
+    async def test_success_delivers_then_completes(self, mock_graph, mock_deliver):
+        await worker.run_job(make_job(), "w1")
+        mock_deliver.assert_awaited_once_with("whatsapp:+1", "✅ Success. ID: 1")
+        self.assertEqual(self.ops(), [job_queue.complete_job])
+
+    @patch("worker.deliver", new_callable=AsyncMock)
+    @patch("worker.run_graph", new_callable=AsyncMock, side_effect=RuntimeError("ollama down"))
+    async def test_failure_requeues_until_attempts_exhausted(self, mock_graph, mock_deliver):
+        await worker.run_job(make_job(attempts=1), "w1")
+        self.assertEqual(self.pool.run.await_args.args[0], job_queue.fail_job)
+        self.assertTrue(self.pool.run.await_args.args[-1])  # retry
+
+        await worker.run_job(make_job(attempts=3), "w1")
+        self.assertFalse(self.pool.run.await_args.args[-1])  # final attempt -> failed
+        mock_deliver.assert_not_awaited()
+
+    @patch("worker.run_graph", new_callable=AsyncMock)
+    async def test_expired_final_lease_is_not_rerun(self, mock_graph):
+        await worker.run_job(make_job(attempts=4), "w1")
+        mock_graph.assert_not_awaited()
+        self.assertEqual(self.ops(), [job_queue.fail_job])
+
+
+class TestWorkerMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def scrape(self, server, path=b"/metrics"):
+        host, port = server.sockets[0].getsockname()[:2]
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b"GET " + path + b" HTTP/1.1\r\nHost: worker\r\n\r\n")
+        response = (await reader.read()).decode()
+        writer.close()
+        return response
+
+    async def test_worker_spans_are_scraped(self):
+        """Graph and agent spans recorded while a job runs show up on the worker's own /metrics"""
+        async def astream(inputs, config):
+            with tracing.span("agent", "worker_metrics_probe"):
+                yield {"production_agent": {"messages": [{"role": "assistant", "content": "✅ Logged."}]}}
+
+        with patch.object(worker, "graph", MagicMock(astream=astream)):
+            self.assertEqual(await worker.run_graph("Log 50 rolls for Machine A", "whatsapp:+1"), "✅ Logged.")
+
+        server = await tracing.serve_metrics(0, "127.0.0.1")
+        try:
+            response = await self.scrape(server)
+            missing = await self.scrape(server, b"/nope")
+        finally:
+            server.close()
+            await server.wait_closed()
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK"))
+        self.assertIn('factory_stage_duration_seconds_count{stage="agent",name="worker_metrics_probe"} 1', response)
+        self.assertIn('factory_stage_duration_seconds_count{stage="graph",name=""}', response)
+        self.assertTrue(missing.startswith("HTTP/1.1 404"))
+
+
+class TestJobQueueSql(unittest.TestCase):
+
+    def test_claim_keeps_sender_order(self):
+        """The claim skips locked rows and any job with an earlier unfinished job from the same sender"""
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (7, "whatsapp:+1", "hi", 1, 3, 0.2, "SM123")
+
+        job = job_queue.claim_job(conn, "w1")
+
+        sql = cur.execute.call_args[0][0]
+        self.assertIn("FOR UPDATE SKIP LOCKED", sql)
+        self.assertIn("e.id < j.id", sql)
+        self.assertEqual(job["id"], 7)
+        self.assertEqual(job["queue_wait_s"], 0.2)
+        self.assertEqual(job["request_id"], "SM123")
+
+
+if __name__ == "__main__":
+    unittest.main()
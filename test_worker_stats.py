@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import worker_stats
+
+
+def snapshot(fast_path, llm, hits, misses, completed):
+    cache = {"size": hits, "maxsize": 256, "hits": hits, "misses": misses, "hit_rate": 0.0}
+    return {
+        "router": {"fast_path": fast_path, "llm": llm, "production": fast_path, "llm_skip_rate": 0.0},
+        "llm_scheduler": {"completed": completed, "active_slots": 1, "concurrency": 2},
+        "manual_retriever": {"reloads": 1, "embedding_cache": cache, "answer_cache": dict(cache, threshold=0.92)},
+    }
+
+
+class TestMergeStats(unittest.TestCase):
+
+    def test_counters_summed_and_rates_recomputed(self):
+        merged = worker_stats.merge_stats([snapshot(3, 1, 6, 2, 4), snapshot(1, 3, 0, 4, 2)])
+        self.assertEqual(merged["router"]["fast_path"], 4)
+        self.assertEqual(merged["router"]["llm_skip_rate"], 0.5)
+        self.assertEqual(merged["llm_scheduler"], {"completed": 6, "active_slots": 2, "concurrency": 2})
+        self.assertEqual(merged["manual_retriever"]["embedding_cache"]["hit_rate"], 0.5)
+        self.assertEqual(merged["manual_retriever"]["answer_cache"]["threshold"], 0.92)  # settings aren't summed
+        self.assertEqual(worker_stats.merge_stats([]), {})
+
+    def test_missing_retriever_in_some_workers(self):
+        idle = snapshot(0, 0, 0, 0, 0)
+        idle["manual_retriever"] = None
+        merged = worker_stats.merge_stats([idle, snapshot(1, 1, 1, 1, 1)])
+        self.assertEqual(merged["manual_retriever"]["embedding_cache"]["hits"], 1)
+
+
+class TestStatsEndpoint(unittest.TestCase):
+
+    def test_stats_sums_worker_snapshots(self):
+        """JOB_QUEUE=postgres: router/scheduler/retriever numbers come from the workers, not the webhook"""
+        # Imported here so test_graph.py still gets the first (mocked) import of agent_graph
+        from fastapi.testclient import TestClient
+        import whatsapp_server
+
+        async def run(fn, *args, **kwargs):
+            if fn is worker_stats.recent_stats:
+                return [snapshot(3, 1, 6, 2, 4), snapshot(1, 3, 0, 4, 2)]
+            return {"queued": 0}
+
+        pool = MagicMock(run=AsyncMock(side_effect=run))
+        with patch.object(whatsapp_server, "JOB_QUEUE", "postgres"), \
+             patch.object(whatsapp_server.db, "get_async_pool", return_value=pool), \
+             patch.object(whatsapp_server.db, "pool_stats", return_value={}):
+            body = TestClient(whatsapp_server.app).get("/stats").json()
+        self.assertEqual(body["workers"], 2)
+        self.assertEqual(body["router"]["llm_skip_rate"], 0.5)
+        self.assertEqual(body["llm_scheduler"]["completed"], 6)
+        self.assertEqual(body["jobs"], {"queued": 0})
+
+
+class TestPublisher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_worker_publishes_until_stopped_then_removes_its_row(self):
+        import worker
+
+        pool = MagicMock(run=AsyncMock())
+        stop = asyncio.Event()
+        with patch.object(worker.db, "get_async_pool", return_value=pool), \
+             patch.object(worker_stats, "local_stats", return_value={"router": {"llm": 1}}):
+            task = asyncio.create_task(worker.stats_publisher("host:1", stop))
+            await asyncio.sleep(0)
+            stop.set()
+            await task
+        ops = [c.args[:3] for c in pool.run.await_args_list]
+        self.assertEqual(ops, [(worker_stats.publish_stats, "host:1", {"router": {"llm": 1}}),
+                               (worker_stats.remove_stats, "host:1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
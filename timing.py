@@ -0,0 +1,25 @@
+"""Latency summaries shared by the benchmark and eval runners."""
+import math
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(durations: list, wall_seconds: float = None) -> dict:
+    """count, mean and p50/p95/p99 in ms (+ throughput per second when wall time is given)."""
+    values = sorted(durations)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+    if wall_seconds:
+        summary["throughput_per_s"] = round(len(values) / wall_seconds, 3)
+    return summary
@@ -0,0 +1,102 @@
+"""Per-tool concurrency limits and latency stats for the MCP tool server (server.py).
+
+Several agents and dashboards share one server, so a burst of slow analyze_data queries
+must not take every pooled connection away from log_production. Each tool gets its own
+cap; calls over the cap wait their turn (the wait is reported separately from run time).
+
+Tools report failures as "❌ ..." replies rather than raising, so call() counts those as
+errors too.
+"""
+import time
+import asyncio
+import weakref
+from types import SimpleNamespace
+from collections import deque
+from contextlib import asynccontextmanager
+
+import timing
+
+LATENCY_WINDOW = 1000  # most recent calls per tool kept for percentiles
+FAILURE_PREFIX = "❌"
+
+
+def parse_limits(spec: str) -> dict:
+    """"log_production=8,analyze_data=2" -> {"log_production": 8, "analyze_data": 2}."""
+    limits = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, _, value = part.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+class ToolLimiter:
+    def __init__(self, limits: dict = None, default: int = 4):
+        self.limits = dict(limits or {})
+        self.default = default
+        self._semaphores = weakref.WeakKeyDictionary()  # loop -> {tool: Semaphore}
+        self._stats = {}
+
+    def limit(self, tool: str) -> int:
+        return self.limits.get(tool, self.default)
+
+    def _tool_stats(self, tool: str) -> dict:
+        stats = self._stats.get(tool)
+        if stats is None:
+            stats = self._stats[tool] = {"calls": 0, "errors": 0, "in_flight": 0, "waiting": 0,
+                                         "latency": deque(maxlen=LATENCY_WINDOW),
+                                         "wait": deque(maxlen=LATENCY_WINDOW)}
+        return stats
+
+    def _semaphore(self, tool: str) -> asyncio.Semaphore:
+        per_loop = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if tool not in per_loop:
+            per_loop[tool] = asyncio.Semaphore(self.limit(tool))
+        return per_loop[tool]
+
+    @asynccontextmanager
+    async def slot(self, tool: str):
+        """`async with limiter.slot("analyze_data") as call:` around one tool call.
+
+        Exceptions count as errors; so does `call.failed = True`."""
+        stats = self._tool_stats(tool)
+        semaphore = self._semaphore(tool)
+        queued = time.perf_counter()
+        stats["waiting"] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1  # acquired, or cancelled while waiting
+        stats["wait"].append(time.perf_counter() - queued)
+        stats["in_flight"] += 1
+        start = time.perf_counter()
+        call = SimpleNamespace(failed=False)
+        try:
+            yield call
+        except Exception:
+            call.failed = True
+            raise
+        finally:
+            stats["errors"] += call.failed
+            stats["in_flight"] -= 1
+            stats["calls"] += 1
+            stats["latency"].append(time.perf_counter() - start)
+            semaphore.release()
+
+    async def call(self, tool: str, fn, *args):
+        """`await fn(*args)` in the tool's slot; a "❌ ..." reply counts as an error."""
+        async with self.slot(tool) as call:
+            result = await fn(*args)
+            call.failed = isinstance(result, str) and result.startswith(FAILURE_PREFIX)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            tool: {
+                "limit": self.limit(tool),
+                "calls": s["calls"], "errors": s["errors"],
+                "in_flight": s["in_flight"], "waiting": s["waiting"],
+                "latency": timing.summarize(list(s["latency"])),
+                "wait": timing.summarize(list(s["wait"])),
+            }
+            for tool, s in sorted(self._stats.items())
+        }
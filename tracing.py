@@ -0,0 +1,242 @@
+"""Per-request timing spans and Prometheus metrics.
+
+Every WhatsApp message gets a request ID (Twilio's MessageSid when present) held in a
+contextvar, so the webhook, the worker, LangGraph nodes and tool calls all log it without
+threading it through signatures. Each span logs one JSON line and feeds the
+factory_stage_duration_seconds histogram that whatsapp_server exposes on GET /metrics.
+worker.py processes record the graph/agent/tool/send stages and serve their own registry
+with serve_metrics() (one port per process, WORKER_METRICS_PORT + index).
+
+    with tracing.span("download"):            # sync or async code
+        audio = await download_media(url)
+
+    @tracing.traced("tool")                    # async functions
+    async def update_stock(...): ...
+"""
+import os
+import json
+import time
+import asyncio
+import uuid
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- Configuration ---
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"  # one JSON line per span on stdout
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+# --- Request IDs ---
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+@contextmanager
+def bind(request_id: str = None):
+    """Run the block (and every task it starts) under request_id (a fresh one if None)."""
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+# --- Metrics (Prometheus text format, no client library needed) ---
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.labelnames, k), v) for k, v in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {value:g}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Set directly, or give it a callback evaluated at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception:
+                pass  # a broken probe must not break the scrape
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                out.append((f"{self.name}_bucket", _labels(self.labelnames + ("le",), key + (le,)), cumulative))
+            out.append((f"{self.name}_sum", _labels(self.labelnames, key), total))
+            out.append((f"{self.name}_count", _labels(self.labelnames, key), cumulative))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Idempotent per name, so re-imports and tests get the existing metric back."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), callback=None) -> Gauge:
+        gauge = self.register(Gauge(name, help_text, labelnames, callback))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, help_text, labelnames=(), buckets=STAGE_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+async def serve_metrics(port: int, host: str = "0.0.0.0", registry: Registry = None):
+    """Minimal HTTP server answering GET /metrics, for processes without a web framework (worker.py).
+
+    Returns the asyncio.Server; close() it on shutdown. Port 0 picks a free port."""
+    registry = registry or REGISTRY
+
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # headers
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "factory_stage_duration_seconds", "Time spent per pipeline stage", ("stage", "name"))
+STAGE_ERRORS = REGISTRY.counter(
+    "factory_stage_errors_total", "Pipeline stage runs that raised", ("stage", "name"))
+
+
+# --- Spans ---
+def _log(record: dict):
+    if TRACE_LOG:
+        print(json.dumps(record, default=str), flush=True)
+
+
+@contextmanager
+def span(stage: str, name: str = "", **attrs):
+    """Time the block as `stage` (e.g. "agent") / `name` (e.g. "production_agent")."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs  # callers may add attributes (status codes, sizes) while inside
+    except Exception as e:
+        status = "error"
+        attrs.setdefault("error", repr(e)[:200])
+        STAGE_ERRORS.inc(stage=stage, name=name)
+        raise
+    except BaseException:  # task cancelled / shutdown
+        status = "cancelled"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, name=name)
+        _log({"span": stage, "name": name, "request_id": _request_id.get(),
+              "ms": round(elapsed * 1000, 1), "status": status, **attrs})
+
+
+def traced(stage: str, name: str = None):
+    """Decorator: run an async function inside span(stage, name or its __name__)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage, name or fn.__name__):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# --- Configuration ---
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")  # Tiny is faster for Docker
+# Each worker process holds its own copy of the model (~150MB RAM for tiny)
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+# Voice notes queued or running before we ask the sender to type instead
+WHISPER_MAX_JOBS = int(os.getenv("WHISPER_MAX_JOBS", "8"))
+SAMPLE_RATE = 16000
+
+
+class TranscriptionBusy(Exception):
+    """Raised when WHISPER_MAX_JOBS voice notes are already queued."""
+
+
+def decode_audio(data: bytes) -> np.ndarray:
+    """Decode any ffmpeg-readable bytes (Twilio sends OGG/Opus) to 16kHz mono float32, in memory."""
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+           "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    proc = subprocess.run(cmd, input=data, capture_output=True, check=False)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(proc.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+# --- Worker process side ---
+_model = None
+
+
+def _init_worker(model_name: str):
+    """Runs once per worker process: load Whisper so jobs only pay for inference."""
+    global _model
+    import whisper
+    _model = whisper.load_model(model_name)
+
+
+def _transcribe_job(data: bytes, submitted_at: float) -> dict:
+    started = time.time()
+    audio = decode_audio(data)
+    text = _model.transcribe(audio, fp16=False)["text"]
+    return {
+        "text": text,
+        "queue_wait_s": started - submitted_at,
+        "transcribe_s": time.time() - started,
+        "audio_s": len(audio) / SAMPLE_RATE,
+    }
+
+
+def _ping() -> bool:
+    return _model is not None
+
+
+# --- Server side ---
+class TranscriberPool:
+    """Whisper in dedicated processes: the event loop never runs inference and jobs are bounded."""
+
+    def __init__(self, model_name: str = WHISPER_MODEL, workers: int = WHISPER_WORKERS,
+                 max_jobs: int = WHISPER_MAX_JOBS):
+        self.model_name = model_name
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self._executor = None
+        self._jobs = 0
+        self._stats = {"completed": 0, "failed": 0, "rejected": 0,
+                       "queue_wait_seconds": 0.0, "transcribe_seconds": 0.0, "audio_seconds": 0.0}
+
+    def start(self):
+        if self._executor is None:
+            # spawn: forking a process that already imported torch is unsafe
+            ctx = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=ctx,
+                initializer=_init_worker, initargs=(self.model_name,),
+            )
+        return self
+
+    async def warm(self):
+        """Block until every worker has loaded the model."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)])
+
+    async def transcribe(self, data: bytes) -> str:
+        if self._jobs >= self.max_jobs:
+            self._stats["rejected"] += 1
+            raise TranscriptionBusy(f"{self._jobs} voice notes already queued")
+        self.start()
+        self._jobs += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, _transcribe_job, data, time.time())
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._jobs -= 1
+        self._stats["completed"] += 1
+        self._stats["queue_wait_seconds"] += result["queue_wait_s"]
+        self._stats["transcribe_seconds"] += result["transcribe_s"]
+        self._stats["audio_seconds"] += result["audio_s"]
+        print(f"📝 Transcribed {result['audio_s']:.1f}s audio in {result['transcribe_s']:.2f}s "
+              f"(queued {result['queue_wait_s']:.2f}s)", flush=True)
+        return result["text"]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats.update({"jobs": self._jobs, "max_jobs": self.max_jobs, "workers": self.workers})
+        return stats
+
+
+_pool = None
+
+
+def get_transcriber() -> TranscriberPool:
+    global _pool
+    if _pool is None:
+        _pool = TranscriberPool()
+    return _pool
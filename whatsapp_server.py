@@ -1,98 +1,162 @@
-from fastapi import FastAPI, Form, Response, BackgroundTasks
-import whisper
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Form, Response
+from fastapi.responses import PlainTextResponse, JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
 import os
-import requests
 
-app = FastAPI()
+import db
+import tracing
+import startup
+import job_queue
+import worker_stats
+from llm_scheduler import get_scheduler, share_slots, SchedulerBusy, BUSY_REPLY
+from transcriber import get_transcriber, TranscriptionBusy
+from http_client import download_media, close_client, MediaDownloadError
+# The LangGraph/PydanticAI/Chroma stack (worker.py, retriever.py) is imported lazily:
+# the webhook only needs it for JOB_QUEUE=memory, and startup.warmup() loads it off the loop.
 
-# Load Voice Model (Tiny is faster for Docker)
-print("👂 Loading Whisper Model...")
-ear_model = whisper.load_model("tiny") 
+# "postgres": durable queue drained by worker.py (default). "memory": in-process, lost on restart.
+JOB_QUEUE = os.getenv("JOB_QUEUE", "postgres")
+# Components that must be warm before /ready says yes; the others only degrade features
+READY_REQUIRES = os.getenv("READY_REQUIRES", "schema,graph,whisper,llm").split(",")
 
+readiness = startup.Readiness(["schema", "graph", "whisper", "llm", "embeddings"], required=READY_REQUIRES)
 
-from agent_graph import graph
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if JOB_QUEUE == "memory":
+        share_slots()  # the graph runs here: take Ollama slots from the shared budget
+    # Accept requests immediately; migrations and model loads run concurrently (see /ready)
+    warm = asyncio.create_task(startup.warmup(readiness, JOB_QUEUE, get_transcriber()))
+    yield
+    warm.cancel()
+    get_transcriber().shutdown()
+    await close_client()
+    db.close_pool()
 
-async def process_ai_response(user_text: str, sender_id: str):
-    print(f"🔄 Processing AI response for {sender_id} via LangGraph...", flush=True)
-    try:
-        # Create Thread ID specific to user for memory
-        config = {"configurable": {"thread_id": sender_id}}
-        
-        # Invoke Graph
-        # The graph expects a list of messages
-        last_message = None
-        async for event in graph.astream({"messages": [("user", user_text)]}, config):
-            for value in event.values():
-                if value and "messages" in value:
-                    msg = value["messages"][-1]
-                    content = None
-                    if hasattr(msg, "content"):
-                        content = msg.content
-                    else:
-                        content = msg.get("content", str(msg))
-                    
-                    if content and str(content).strip():
-                        last_message = content
-                        print(f"🤖 Graph Step: {last_message[:50]}...", flush=True)
-        
-        answer = last_message if last_message else "Internal Error: No response from Supervisor."
-        
-        print(f"✅ AI Answer Ready: {answer[:50]}...", flush=True)
-    except Exception:
-        import traceback
-        print(f"❌ AI Processing Failed:\n{traceback.format_exc()}", flush=True)
+app = FastAPI(lifespan=lifespan)
+
+async def enqueue_ai_job(user_text: str, sender_id: str):
+    """Hand the message to the AI workers. Raises SchedulerBusy when the backlog is full."""
+    if JOB_QUEUE == "memory":
+        worker = await startup.load_module("worker")
+        get_scheduler().enqueue(sender_id, worker.process_ai_response, user_text, sender_id, tracing.current_request_id())
         return
+    pool = db.get_async_pool()
+    if await pool.run(job_queue.queue_depth) >= job_queue.JOB_MAX_QUEUED:
+        raise SchedulerBusy("AI job queue full")
+    await pool.run(job_queue.enqueue_job, sender_id, user_text, request_id=tracing.current_request_id())
 
-    # Send final answer via Twilio API (since we already replied to webhook)
-    tw_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    tw_token = os.getenv("TWILIO_AUTH_TOKEN")
-    if tw_sid and tw_token:
-        try:
-            client = requests.auth.HTTPBasicAuth(tw_sid, tw_token)
-            url = f"https://api.twilio.com/2010-04-01/Accounts/{tw_sid}/Messages.json"
-            data = {"To": sender_id, "From": "whatsapp:+14155238886", "Body": answer}
-            resp = requests.post(url, auth=client, data=data) 
-            print(f"✅ Sent async response to {sender_id}. Status: {resp.status_code}", flush=True)
-            if resp.status_code != 201:
-                print(f"⚠️ Twilio API Error: {resp.text}", flush=True)
-        except Exception as e:
-            print(f"❌ Failed to send async response: {e}", flush=True)
+WEBHOOK_REQUESTS = tracing.REGISTRY.counter(
+    "factory_webhook_requests_total", "WhatsApp webhook calls by message kind and outcome", ("kind", "outcome"))
+AI_JOBS_QUEUED = tracing.REGISTRY.gauge("factory_ai_jobs_queued", "Jobs waiting in the Postgres AI queue")
+tracing.REGISTRY.gauge("factory_llm_pending", "In-process AI jobs waiting or running (JOB_QUEUE=memory)",
+                       callback=lambda: get_scheduler().stats()["pending"])
+tracing.REGISTRY.gauge("factory_llm_active_slots", "Ollama calls in flight",
+                       callback=lambda: get_scheduler().stats()["active_slots"])
+tracing.REGISTRY.gauge("factory_transcriber_jobs", "Voice notes queued or transcribing",
+                       callback=lambda: get_transcriber().stats()["jobs"])
+tracing.REGISTRY.gauge("factory_db_pool_in_use", "Pooled Postgres connections checked out",
+                       callback=lambda: db._pool.stats()["in_use"] if db._pool is not None else 0)
 
-@app.post("/whatsapp")
-async def reply_whatsapp(background_tasks: BackgroundTasks, Body: str = Form(None), MediaUrl0: str = Form(None), MediaContentType0: str = Form(None), From: str = Form(...)):
+def _twiml(message: str) -> Response:
+    return Response(content=f"<Response><Message>{message}</Message></Response>", media_type="application/xml")
+
+async def handle_message(Body: str, MediaUrl0: str, MediaContentType0: str, From: str):
+    """(reply, outcome) for one inbound message; the outcome labels the webhook counter."""
     user_text = Body or ""
     
     # Handle Voice
     if MediaContentType0 and "audio" in MediaContentType0:
         print(f"🎤 Voice Note from {From}: {MediaUrl0}")
         try:
-            # Twilio Auth
-            tw_sid = os.getenv("TWILIO_ACCOUNT_SID")
-            tw_token = os.getenv("TWILIO_AUTH_TOKEN")
-            auth = (tw_sid, tw_token) if tw_sid and tw_token and "PLACEHOLDER" not in tw_sid else None
-
-            resp = requests.get(MediaUrl0, auth=auth, timeout=10) # 10s timeout
-            if resp.status_code == 200 and len(resp.content) > 0:
-                with open("temp.ogg", "wb") as f: f.write(resp.content)
-                try:
-                    user_text = ear_model.transcribe("temp.ogg", fp16=False)["text"]
-                    print(f"📝 Transcribed Text: '{user_text}'", flush=True)
-                except Exception as e:
-                    print(f"❌ Whisper Error: {e}")
-                    user_text = "I couldn't hear that properly."
-                finally:
-                    if os.path.exists("temp.ogg"):
-                        os.remove("temp.ogg")
-            else:
-                print(f"❌ Download Failed: {resp.status_code}")
-                return Response(content=f"<Response><Message>❌ Audio download failed (Status {resp.status_code}). Please text me instead.</Message></Response>", media_type="application/xml")
+            # Streamed over the shared keep-alive client, capped at MEDIA_MAX_BYTES
+            with tracing.span("download", "twilio_media") as attrs:
+                audio = await download_media(MediaUrl0)
+                attrs["bytes"] = len(audio)
+        except MediaDownloadError as e:
+            print(f"❌ Download Failed: {e}")
+            return f"❌ Audio download failed ({e}). Please text me instead.", "download_failed"
         except Exception as e:
              print(f"❌ Network Error: {e}")
-             return Response(content=f"<Response><Message>❌ Error processing audio. Please text me instead.</Message></Response>", media_type="application/xml")
+             return "❌ Error processing audio. Please text me instead.", "download_failed"
+
+        # Decoded in memory and transcribed in a worker process (no shared temp file)
+        try:
+            with tracing.span("transcribe", "whisper"):
+                user_text = await get_transcriber().transcribe(audio)
+            print(f"📝 Transcribed Text: '{user_text}'", flush=True)
+        except TranscriptionBusy:
+            print(f"⏳ Whisper queue full, asking {From} to type", flush=True)
+            return "⏳ Too many voice notes right now. Please text me instead.", "busy"
+        except Exception as e:
+            print(f"❌ Whisper Error: {e}")
+            user_text = "I couldn't hear that properly."
+
+    # Enqueue and return to avoid Twilio 15s timeout; workers keep each sender's messages in order
+    try:
+        await enqueue_ai_job(user_text, From)
+    except SchedulerBusy:
+        print(f"⏳ AI queue full, telling {From} to retry", flush=True)
+        return BUSY_REPLY, "busy"
+    except Exception as e:
+        print(f"❌ Failed to enqueue AI job: {e}", flush=True)
+        return "❌ I can't process messages right now. Please try again shortly.", "error"
+    return "🧠 Thinking...", "accepted"
+
+@app.post("/whatsapp")
+async def reply_whatsapp(Body: str = Form(None), MediaUrl0: str = Form(None), MediaContentType0: str = Form(None), From: str = Form(...), MessageSid: str = Form(None)):
+    # Twilio's MessageSid is the request ID from here to the outbound reply
+    with tracing.bind(MessageSid):
+        kind = "voice" if MediaContentType0 and "audio" in MediaContentType0 else "text"
+        reply, outcome = await handle_message(Body, MediaUrl0, MediaContentType0, From)
+        WEBHOOK_REQUESTS.inc(kind=kind, outcome=outcome)
+        return _twiml(reply)
+
+@app.get("/stats")
+async def stats():
+    """Runtime counters for capacity planning (DB pool saturation, cache hit rates, ...).
+
+    Router, LLM scheduler and retriever counters come from the processes running the graph:
+    summed over live worker.py processes for JOB_QUEUE=postgres, this process for memory."""
+    workers = jobs = None
+    if JOB_QUEUE == "postgres":
+        pool = db.get_async_pool()
+        snapshots = await pool.run(worker_stats.recent_stats)
+        graph_stats, workers = worker_stats.merge_stats(snapshots), len(snapshots)
+        jobs = await pool.run(job_queue.job_stats)
+    else:
+        graph_stats = worker_stats.local_stats()
+    return {
+        "db_pool": db.pool_stats(),
+        "manual_retriever": graph_stats.get("manual_retriever"),
+        "router": graph_stats.get("router"),
+        "llm_scheduler": graph_stats.get("llm_scheduler"),
+        "workers": workers,
+        "transcriber": get_transcriber().stats(),
+        "jobs": jobs,
+    }
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the required components are warm, else 503 with per-component status."""
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape: stage latency histograms, webhook/error counters, queue-depth gauges."""
+    if JOB_QUEUE == "postgres":
+        try:
+            AI_JOBS_QUEUED.set(await db.get_async_pool().run(job_queue.queue_depth))
+        except Exception as e:
+            print(f"⚠️ Queue depth probe failed: {e}", flush=True)
+    return PlainTextResponse(tracing.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
-    # Start AI in background to avoid Twilio 15s timeout
-    background_tasks.add_task(process_ai_response, user_text, From)
-    return Response(content=f"<Response><Message>🧠 Thinking...</Message></Response>", media_type="application/xml")
+startup.log_timing("import whatsapp_server", time.perf_counter() - _import_started)
 
 if __name__ == "__main__":
     import uvicorn
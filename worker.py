@@ -0,0 +1,240 @@
+"""AI worker: claims jobs from the Postgres queue, runs the LangGraph supervisor, replies via Twilio.
+
+    python worker.py                       # 1 process, WORKER_CONCURRENCY jobs in flight
+    python worker.py --processes 4         # scale out on one host (or run more containers)
+
+Each process serves its own stage metrics on GET :WORKER_METRICS_PORT+index/metrics
+(9100, 9101, ...): the graph, agent, tool and send spans run here, not in the webhook.
+
+OLLAMA_CONCURRENCY is one budget for all worker processes and containers together: each
+process takes its Ollama slots from a shared set of Postgres advisory locks
+(llm_scheduler.SharedSlots), so adding processes adds throughput for DB/tool work, not
+more concurrent LLM calls. OLLAMA_SLOT_SCOPE=process restores a per-process cap.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import multiprocessing
+
+_import_started = time.perf_counter()
+import db
+import migrations
+import job_queue
+import ledger
+import tracing
+import worker_stats
+import llm_scheduler
+from agent_graph import graph
+from http_client import send_whatsapp, twilio_auth, close_client
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# --- Configuration ---
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))  # jobs in flight per process
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+# GET /metrics per process (graph/agent/tool/send stage histograms): port + process index, 0 = off
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+
+# --- Conversation pipeline ---
+async def run_graph(user_text: str, sender_id: str) -> str:
+    """Run one user message through the supervisor graph and return the final answer."""
+    print(f"🔄 Processing AI response for {sender_id} via LangGraph...", flush=True)
+    # Create Thread ID specific to user for memory
+    config = {"configurable": {"thread_id": sender_id}}
+
+    # Invoke Graph
+    # The graph expects a list of messages
+    last_message = None
+    with tracing.span("graph"):
+        async for event in graph.astream({"messages": [("user", user_text)]}, config):
+            for value in event.values():
+                if value and "messages" in value:
+                    msg = value["messages"][-1]
+                    content = None
+                    if hasattr(msg, "content"):
+                        content = msg.content
+                    else:
+                        content = msg.get("content", str(msg))
+
+                    if content and str(content).strip():
+                        last_message = content
+                        print(f"🤖 Graph Step: {last_message[:50]}...", flush=True)
+
+    answer = last_message if last_message else "Internal Error: No response from Supervisor."
+    print(f"✅ AI Answer Ready: {answer[:50]}...", flush=True)
+    return answer
+
+
+async def deliver(sender_id: str, answer: str):
+    """Send the final answer via Twilio API (the webhook already replied 'Thinking...')."""
+    if not twilio_auth():
+        return
+    try:
+        with tracing.span("send", "twilio") as attrs:
+            resp = await send_whatsapp(sender_id, answer)
+            attrs["status_code"] = resp.status_code
+        print(f"✅ Sent async response to {sender_id}. Status: {resp.status_code}", flush=True)
+        if resp.status_code != 201:
+            print(f"⚠️ Twilio API Error: {resp.text}", flush=True)
+    except Exception as e:
+        print(f"❌ Failed to send async response: {e}", flush=True)
+
+
+async def process_ai_response(user_text: str, sender_id: str, request_id: str = None):
+    """In-process variant (JOB_QUEUE=memory): no durability, errors are only logged."""
+    with tracing.bind(request_id):
+        try:
+            answer = await run_graph(user_text, sender_id)
+        except Exception:
+            import traceback
+            print(f"❌ AI Processing Failed:\n{traceback.format_exc()}", flush=True)
+            return
+        await deliver(sender_id, answer)
+
+
+# --- Queue worker ---
+async def _heartbeat(job: dict, worker_id: str):
+    pool = db.get_async_pool()
+    while True:
+        await asyncio.sleep(job_queue.JOB_VISIBILITY_TIMEOUT / 3)
+        await pool.run(job_queue.extend_job, job["id"], worker_id)
+
+
+async def run_job(job: dict, worker_id: str):
+    with tracing.bind(job.get("request_id") or f"job-{job['id']}"):
+        await _run_job(job, worker_id)
+
+
+async def _run_job(job: dict, worker_id: str):
+    pool = db.get_async_pool()
+    if job["attempts"] > job["max_attempts"]:
+        # Lease expired on the last attempt (worker crashed mid-run): give up
+        await pool.run(job_queue.fail_job, job["id"], "lease expired after final attempt", False)
+        return
+
+    start = time.perf_counter()
+    heartbeat = asyncio.create_task(_heartbeat(job, worker_id))
+    try:
+        answer = await run_graph(job["payload"], job["sender_id"])
+    except Exception as e:
+        retry = job["attempts"] < job["max_attempts"]
+        print(f"❌ Job {job['id']} attempt {job['attempts']}/{job['max_attempts']} failed: {e!r}"
+              f"{' - retrying' if retry else ''}", flush=True)
+        await pool.run(job_queue.fail_job, job["id"], repr(e), retry)
+        return
+    finally:
+        heartbeat.cancel()
+
+    # Delivery failures are not retried: re-running the graph would repeat the DB write
+    await deliver(job["sender_id"], answer)
+    await pool.run(job_queue.complete_job, job["id"], answer)
+    print(f"⏱️ Job {job['id']} done: queued {job['queue_wait_s']:.2f}s, ran {time.perf_counter() - start:.2f}s", flush=True)
+
+
+async def worker_slot(worker_id: str, stop: asyncio.Event):
+    pool = db.get_async_pool()
+    while not stop.is_set():
+        try:
+            job = await pool.run(job_queue.claim_job, worker_id)
+        except Exception as e:
+            print(f"⚠️ Claim failed ({e}), backing off", flush=True)
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(job, worker_id)
+
+
+async def compactor(stop: asyncio.Event):
+    """Periodic inventory ledger compaction; the advisory lock lets only one worker run it."""
+    pool = db.get_async_pool()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), ledger.INVENTORY_COMPACT_INTERVAL)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            compacted = await pool.run(ledger.compact_inventory)
+            if compacted:
+                print(f"📒 Compacted {compacted} inventory balances", flush=True)
+        except Exception as e:
+            print(f"⚠️ Inventory compaction failed: {e}", flush=True)
+
+
+async def stats_publisher(worker_id: str, stop: asyncio.Event):
+    """Publish this process's router / scheduler / retriever counters for the webhook's GET /stats."""
+    pool = db.get_async_pool()
+    while not stop.is_set():
+        try:
+            await pool.run(worker_stats.publish_stats, worker_id, worker_stats.local_stats())
+        except Exception as e:
+            print(f"⚠️ Stats publish failed: {e}", flush=True)
+        try:
+            await asyncio.wait_for(stop.wait(), worker_stats.WORKER_STATS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    try:
+        await pool.run(worker_stats.remove_stats, worker_id)
+    except Exception:
+        pass  # the row goes stale and drops out of /stats on its own
+
+
+async def serve(concurrency: int = WORKER_CONCURRENCY, index: int = 0):
+    await asyncio.to_thread(migrations.ensure_migrated)
+    llm_scheduler.share_slots()
+    metrics = None
+    if WORKER_METRICS_PORT:
+        metrics = await tracing.serve_metrics(WORKER_METRICS_PORT + index)
+        print(f"📈 Worker metrics on :{WORKER_METRICS_PORT + index}/metrics", flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)  # finish in-flight jobs, then exit
+
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Worker {base_id} started ({concurrency} slots, imports took {IMPORT_SECONDS:.2f}s)", flush=True)
+    try:
+        await asyncio.gather(compactor(stop), stats_publisher(base_id, stop),
+                             *(worker_slot(f"{base_id}:{i}", stop) for i in range(concurrency)))
+    finally:
+        if metrics is not None:
+            metrics.close()
+        await close_client()
+        db.close_pool()
+
+
+def _run_process(concurrency: int, index: int = 0):
+    asyncio.run(serve(concurrency, index))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FactoryOS AI job worker")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        _run_process(args.concurrency)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_run_process, args=(args.concurrency, i)) for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    # Forward shutdown so each child drains its in-flight jobs
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: [p.terminate() for p in procs if p.is_alive()])
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
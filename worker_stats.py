@@ -0,0 +1,82 @@
+"""Runtime counters from the processes that run the graph, for whatsapp_server's GET /stats.
+
+Router, LLM-scheduler and manual-retriever counters live in whichever process runs the
+supervisor graph. With JOB_QUEUE=postgres that's worker.py, so each worker process upserts
+a JSON snapshot every WORKER_STATS_INTERVAL seconds and /stats sums the fresh ones.
+Ops take an open connection, like job_queue.py; run them through the pool.
+"""
+import os
+import sys
+import json
+
+# --- Configuration ---
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "10"))
+# Snapshots older than this belong to workers that stopped or died
+WORKER_STATS_MAX_AGE = float(os.getenv("WORKER_STATS_MAX_AGE", str(3 * WORKER_STATS_INTERVAL)))
+
+
+def local_stats() -> dict:
+    """This process's router / scheduler / retriever counters (retriever only once it's imported)."""
+    import router
+    from llm_scheduler import get_scheduler
+    retriever = sys.modules.get("retriever")
+    return {
+        "router": router.router_stats(),
+        "llm_scheduler": get_scheduler().stats(),
+        "manual_retriever": retriever.get_retriever().stats() if retriever else None,
+    }
+
+
+def publish_stats(conn, worker_id: str, stats: dict):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO worker_stats (worker_id, stats, updated_at) VALUES (%s, %s, NOW())
+            ON CONFLICT (worker_id) DO UPDATE SET stats = EXCLUDED.stats, updated_at = NOW()
+        """, (worker_id, json.dumps(stats)))
+
+
+def remove_stats(conn, worker_id: str):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM worker_stats WHERE worker_id = %s", (worker_id,))
+
+
+def recent_stats(conn, max_age: float = WORKER_STATS_MAX_AGE) -> list:
+    """Snapshots from workers that published within max_age seconds."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT stats FROM worker_stats WHERE updated_at > NOW() - make_interval(secs => %s)",
+                    (max_age,))
+        return [row[0] if isinstance(row[0], dict) else json.loads(row[0]) for row in cur.fetchall()]
+
+
+# Settings, not counters: every worker reports the same value
+_SETTINGS = frozenset({"threshold", "concurrency"})
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _merge(values: list):
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    if all(isinstance(v, dict) for v in present):
+        keys = dict.fromkeys(k for v in present for k in v)
+        merged = {key: _merge([v.get(key) for v in present]) if key not in _SETTINGS
+                  else next((v[key] for v in present if v.get(key) is not None), None) for key in keys}
+        # Ratios don't add up: recompute them from the summed counts
+        if _is_number(merged.get("hits")) and _is_number(merged.get("misses")):
+            lookups = merged["hits"] + merged["misses"]
+            merged["hit_rate"] = round(merged["hits"] / lookups, 3) if lookups else 0.0
+        if _is_number(merged.get("fast_path")) and _is_number(merged.get("llm")):
+            total = merged["fast_path"] + merged["llm"]
+            merged["llm_skip_rate"] = round(merged["fast_path"] / total, 3) if total else 0.0
+        return merged
+    if all(_is_number(v) for v in present):
+        return sum(present)
+    return present[0]
+
+
+def merge_stats(snapshots: list) -> dict:
+    """Sum counters across worker snapshots (nested dicts merged key by key, rates recomputed)."""
+    return _merge(list(snapshots)) or {}